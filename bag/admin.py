@@ -1 +1,21 @@
-# Register your models here.
+from django.contrib import admin
+
+from .models import DiscountCode
+
+
+@admin.register(DiscountCode)
+class DiscountCodeAdmin(admin.ModelAdmin):
+    list_display = (
+        "code",
+        "kind",
+        "value",
+        "min_spend",
+        "times_used",
+        "max_uses",
+        "max_uses_per_user",
+        "valid_until",
+        "active",
+    )
+    list_filter = ("kind", "active")
+    search_fields = ("code",)
+    readonly_fields = ("times_used",)
@@ -1,148 +1,253 @@
+import hashlib
+import json
 from decimal import Decimal
-from products.models import Product, ProductOption
+from functools import partial
+
+from django.utils import timezone
+
+from products.catalog import DISCOUNTS, get_catalog_version
+
+from .discounts import drop_ineligible_discount, get_rule
+from .pricing import (  # noqa: F401 (re-exported for older imports)
+    FREE_DELIVERY_THRESHOLD,
+    STANDARD_DELIVERY,
+    BagPricer,
+    PricedBag,
+)
+
+# Keys exposed to templates by the bag context processor
+BAG_CONTEXT_KEYS = (
+    "items",
+    "bag_items",
+    "product_count",
+    "total",
+    "bag_total",
+    "delivery",
+    "free_delta",
+    "discount_amount",
+    "discount_code",
+    "grand_total",
+)
+
+# Denormalised totals kept in the session for the nav badge.
+# Bump SUMMARY_VERSION whenever the stored shape changes.
+BAG_SUMMARY_KEY = "bag_summary"
+SUMMARY_VERSION = 2
+
+# Template key -> (summary field, converter)
+SUMMARY_CONTEXT_KEYS = {
+    "bag_count": ("count", int),
+    "product_count": ("count", int),
+    "total": ("subtotal", Decimal),
+    "bag_total": ("subtotal", Decimal),
+    "delivery": ("delivery", Decimal),
+    "discount_amount": ("discount", Decimal),
+    "grand_total": ("grand_total", Decimal),
+}
+
+
+def _eligible_discount_code(request) -> str:
+    """
+    Return the session discount code if this user may still use it.
 
-FREE_DELIVERY_THRESHOLD = Decimal("50.00")
-STANDARD_DELIVERY = Decimal("5.00")
+    Safeguard: if the user logs in and has already used a single-use
+    code (or the code expired), remove it and set a one-time flag for
+    views to message the user.
+    """
+    disc = request.session.get("discount") or {}
+    discount_code = (disc.get("code") or "").strip().upper()
 
+    if drop_ineligible_discount(request, discount_code):
+        discount_code = ""
 
-def _is_cupcake(product: Product) -> bool:
-    cat = getattr(product, "category", None)
-    if not cat:
-        return False
-    slug = getattr(cat, "slug", "") or ""
-    name = getattr(cat, "name", "") or ""
-    return slug.lower() == "cupcakes" or name.lower() == "cupcakes"
+    return discount_code
 
 
-def _pack_price(product: Product, option: ProductOption | None) -> Decimal:
+def _price_request_bag(request) -> PricedBag:
+    """
+    Discount handling:
+      - session['discount'] stores ONLY {"code": "..."}
+      - discount_amount is recalculated every request so it stays in sync
+        when bag contents change (e.g. on mobile add-to-bag).
     """
-    Unit price used for a line item:
-      - Cupcakes with option: per-box price from option.pack_price()
-      - Everything else: product.price
+    return BagPricer(
+        request.session.get("bag", {}),
+        _eligible_discount_code(request),
+    ).price()
+
+
+def _bag_fingerprint(request):
+    """Session state the bag totals depend on."""
+    user = getattr(request, "user", None)
+    return (
+        dict(request.session.get("bag", {}) or {}),
+        dict(request.session.get("discount") or {}),
+        user.pk if user is not None and user.is_authenticated else None,
+    )
+
+
+class LazyBag:
     """
-    if option:
-        return Decimal(option.pack_price())
-    return Decimal(product.price or 0)
+    Request-scoped, memoised PricedBag.
+
+    Nothing is queried until a value is read. The result is then reused
+    for the rest of the request, and only rebuilt if the session bag,
+    discount or user changes in between (e.g. a view edits the bag and
+    then renders).
+    """
+
+    def __init__(self, request):
+        self._request = request
+        self._fingerprint = None
+        self._priced = None
+
+    @property
+    def priced(self) -> PricedBag:
+        if (
+            self._priced is None
+            or _bag_fingerprint(self._request) != self._fingerprint
+        ):
+            self._priced = _price_request_bag(self._request)
+            # Taken after pricing: the discount safeguard may edit
+            # the session while computing.
+            self._fingerprint = _bag_fingerprint(self._request)
+        return self._priced
+
+    def __getitem__(self, key):
+        return self.priced.context[key]
+
+    def get(self, key, default=None):
+        return self.priced.context.get(key, default)
+
+
+def get_bag(request):
+    """Return the LazyBag for this request, creating it on first use."""
+    bag = getattr(request, "_lazy_bag", None)
+    if bag is None:
+        bag = LazyBag(request)
+        request._lazy_bag = bag
+    return bag
+
+
+def get_priced_bag(request) -> PricedBag:
+    """The PricedBag for this request, priced at most once."""
+    return get_bag(request).priced
 
 
 def bag_contents(request):
     """
-    session['bag'] keys:
-      "<product_id>"                 -> simple product
-      "<product_id>_<option_id>"     -> ONLY cupcakes (box option)
+    Bag totals as a plain dict for Python callers (views, checkout).
 
-    Discount handling:
-      - session['discount'] stores ONLY {"code": "..."}
-      - discount_amount is recalculated every request so it stays in sync
-        when bag contents change (e.g. on mobile add-to-bag).
+    Shares the per-request memo with the template context, so asking
+    for it several times in one request only prices the bag once.
+    Treat the returned dict as read-only.
     """
-    bag = request.session.get("bag", {})
-    items = []
-    product_count = 0
-    subtotal = Decimal("0.00")
-
-    for key, quantity in bag.items():
-        try:
-            pid_str, opt_str = (str(key).split("_", 1) + [None])[:2]
-            pid = int(pid_str)
-            opt_id = int(opt_str) if opt_str else None
-            qty = int(quantity)
-        except (TypeError, ValueError):
-            continue
-
-        product = (
-            Product.objects.select_related("category").filter(pk=pid).first()
-        )
-        if not product:
-            continue
-
-        option = None
-        if opt_id and _is_cupcake(product):
-            option = ProductOption.objects.filter(
-                pk=opt_id, product_id=pid
-            ).first()
-
-        unit_price = _pack_price(product, option)
-        line_total = unit_price * qty
-        subtotal += line_total
-        product_count += qty
-
-        per_unit = None
-        if option and getattr(option, "quantity", None):
-            per_unit = unit_price / Decimal(option.quantity)
-
-        items.append(
-            {
-                "key": key,
-                "product": product,
-                "option": option,
-                "quantity": qty,  # number of boxes if option present
-                "unit_price": unit_price,
-                "per_unit": per_unit,  # price per cupcake (Decimal) or None
-                "line_total": line_total,
-            }
-        )
+    return get_priced_bag(request).context
 
-    # ------------------
-    # Delivery
-    # ------------------
-    if product_count == 0 or subtotal >= FREE_DELIVERY_THRESHOLD:
-        delivery = Decimal("0.00")
-        free_delta = Decimal("0.00")
-    else:
-        delivery = STANDARD_DELIVERY
-        free_delta = FREE_DELIVERY_THRESHOLD - subtotal
-
-    # ------------------
-    # Discount (recalculate dynamically each request)
-    # ------------------
-    disc = request.session.get("discount") or {}
-    discount_code = (disc.get("code") or "").strip().upper()
 
-    # Safeguard: if user logs in and WELCOME10 is already used, remove it
-    # and set a one-time flag for views to message the user.
-    if discount_code == "WELCOME10" and request.user.is_authenticated:
-        from checkout.models import Order
-
-        already_used = Order.objects.filter(
-            user=request.user,
-            discount_code="WELCOME10",
-            paid=True,
-        ).exists()
-
-        if already_used:
-            request.session.pop("discount", None)
-            request.session["discount_removed_notice"] = "WELCOME10_USED"
-            request.session.modified = True
-            discount_code = ""
-
-    discount_amount = Decimal("0.00")
-    if discount_code == "WELCOME10":
-        discount_amount = (subtotal * Decimal("0.10")).quantize(
-            Decimal("0.01")
-        )
+def _summary_fingerprint(request) -> str:
+    """Short hash of the session state a stored summary was built from."""
+    bag, disc, user_id = _bag_fingerprint(request)
+    raw = json.dumps(
+        [bag, (disc.get("code") or "").strip().upper(), user_id],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha1(raw.encode()).hexdigest()
+
 
-    # Safety clamps
-    if discount_amount < 0:
-        discount_amount = Decimal("0.00")
-    if discount_amount > subtotal:
-        discount_amount = subtotal
-
-    total_after_discount = subtotal - discount_amount
-    grand_total = total_after_discount + delivery
-
-    return {
-        "items": items,  # alias
-        "bag_items": items,
-        "product_count": product_count,
-        "total": subtotal,  # pre-discount subtotal
-        "bag_total": subtotal,
-        "delivery": delivery,
-        "free_delta": free_delta,
-        "discount_amount": discount_amount,
-        "discount_code": discount_code,
-        "grand_total": grand_total,
+def _discount_expiry(code: str) -> float | None:
+    """
+    When `code`'s rule next starts or stops applying (a timestamp), or
+    None if it never will; a summary priced before then goes stale.
+    """
+    rule = get_rule(code)
+    if rule is None:
+        return None
+    if rule.valid_from and timezone.now() < rule.valid_from:
+        return rule.valid_from.timestamp()
+    return rule.valid_until.timestamp() if rule.valid_until else None
+
+
+def store_bag_summary(request):
+    """
+    Price the bag and store a small summary of it in the session.
+
+    Called by every view that changes the bag or discount, so the nav
+    badge can render on later pages without touching the database.
+    """
+    priced = get_priced_bag(request)
+    summary = {
+        "v": SUMMARY_VERSION,
+        "catalog_version": get_catalog_version(),
+        "discounts_version": get_catalog_version(DISCOUNTS),
+        "fingerprint": _summary_fingerprint(request),
+        "expires": _discount_expiry(priced.discount_code),
+        "count": priced.product_count,
+        "subtotal": str(priced.subtotal),
+        "delivery": str(priced.delivery),
+        "discount": str(priced.discount_amount),
+        "grand_total": str(priced.grand_total),
     }
+    request.session[BAG_SUMMARY_KEY] = summary
+    request.session.modified = True
+    return summary
+
+
+def get_bag_summary(request):
+    """
+    Return the stored summary if it still matches the session bag and
+    the catalog and discount rule versions, and its discount hasn't
+    started or expired since, otherwise rebuild it.
+
+    An empty bag with no stored summary is answered with zeros and
+    nothing is written, so anonymous browsing doesn't create sessions.
+    """
+    summary = request.session.get(BAG_SUMMARY_KEY)
+    if (
+        summary
+        and summary.get("v") == SUMMARY_VERSION
+        and summary.get("catalog_version") == get_catalog_version()
+        and summary.get("discounts_version")
+        == get_catalog_version(DISCOUNTS)
+        and summary.get("fingerprint") == _summary_fingerprint(request)
+        and (
+            summary.get("expires") is None
+            or timezone.now().timestamp() < summary["expires"]
+        )
+    ):
+        return summary
+    if not summary and not request.session.get("bag"):
+        priced = get_priced_bag(request)
+        return {
+            "count": priced.product_count,
+            "subtotal": priced.subtotal,
+            "delivery": priced.delivery,
+            "discount": priced.discount_amount,
+            "grand_total": priced.grand_total,
+        }
+    return store_bag_summary(request)
+
+
+def _summary_value(request, field, convert):
+    return convert(get_bag_summary(request)[field])
+
+
+def bag_context(request):
+    """
+    Template context processor.
+
+    Each key maps to a callable, which Django templates call on first
+    use, so pages that never read the bag don't touch the database.
+    Counts and totals come from the session summary (see
+    get_bag_summary), so the nav badge normally costs no queries; line
+    items are only priced when a template iterates them.
+    """
+    bag = get_bag(request)
+    context = {key: partial(bag.__getitem__, key) for key in BAG_CONTEXT_KEYS}
+    for key, (field, convert) in SUMMARY_CONTEXT_KEYS.items():
+        context[key] = partial(_summary_value, request, field, convert)
+    return context
 
 
 def bag_totals(request):
@@ -0,0 +1,238 @@
+"""
+Discount rule engine.
+
+Active DiscountCode rows are compiled into an in-process dict of frozen
+DiscountRule objects, so evaluating a code on each bag render is a dict
+lookup. The table is reloaded when its own version counter changes
+(saving or deleting a DiscountCode bumps it, see bag.signals), which
+leaves the catalog's caches alone.
+
+Limits: max_uses caps how many orders are placed with a code, paid or
+not, since by then the customer has confirmed payment at that price;
+record_redemption() enforces it atomically. max_uses_per_user counts
+the user's paid orders (times_used_by).
+
+How many paid orders a user has with a code is cached per process and
+user, keyed on the PAID_ORDERS version, so the bag context, the bag views
+and apply_discount don't each query the orders table. The Stripe webhook
+(run by a worker) and the admin "mark paid" action bump that version once
+an order carrying a code is marked paid, which every process sees within
+CATALOG_VERSION_TTL.
+"""
+import logging
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from checkout.models import Order
+from products.catalog import (
+    DISCOUNTS,
+    PAID_ORDERS,
+    bump_catalog_version,
+    get_catalog_version,
+)
+
+from .models import DiscountCode
+
+logger = logging.getLogger(__name__)
+
+USAGE_CACHE_TIMEOUT = 60 * 60 * 24
+ZERO = Decimal("0.00")
+
+
+@dataclass(frozen=True)
+class DiscountRule:
+    pk: int
+    code: str
+    kind: str
+    value: Decimal
+    min_spend: Decimal
+    max_uses: int | None
+    max_uses_per_user: int | None
+    times_used: int
+    valid_from: datetime | None
+    valid_until: datetime | None
+
+    @classmethod
+    def from_model(cls, obj: DiscountCode) -> "DiscountRule":
+        return cls(
+            pk=obj.pk,
+            code=obj.code,
+            kind=obj.kind,
+            value=obj.value,
+            min_spend=obj.min_spend,
+            max_uses=obj.max_uses,
+            max_uses_per_user=obj.max_uses_per_user,
+            times_used=obj.times_used,
+            valid_from=obj.valid_from,
+            valid_until=obj.valid_until,
+        )
+
+    def is_live(self, now=None) -> bool:
+        """Inside the validity window and under the global limit."""
+        now = now or timezone.now()
+        if self.valid_from and now < self.valid_from:
+            return False
+        if self.valid_until and now >= self.valid_until:
+            return False
+        if self.max_uses is not None and self.times_used >= self.max_uses:
+            return False
+        return True
+
+    def amount_for(self, subtotal: Decimal) -> Decimal:
+        """Discount on `subtotal`, clamped to 0..subtotal."""
+        if subtotal <= 0 or subtotal < self.min_spend:
+            return ZERO
+        if self.kind == DiscountCode.PERCENTAGE:
+            amount = (subtotal * self.value / 100).quantize(Decimal("0.01"))
+        else:
+            amount = self.value
+        return min(max(amount, ZERO), subtotal)
+
+
+_table = {"version": None, "rules": {}}
+_table_lock = threading.Lock()
+
+
+def get_rule(code: str) -> DiscountRule | None:
+    """Compiled rule for an active code, or None."""
+    code = (code or "").strip().upper()
+    if not code:
+        return None
+
+    version = get_catalog_version(DISCOUNTS)
+    if _table["version"] != version:
+        with _table_lock:
+            if _table["version"] != version:
+                _table["rules"] = {
+                    obj.code: DiscountRule.from_model(obj)
+                    for obj in DiscountCode.objects.filter(active=True)
+                }
+                _table["version"] = version
+    return _table["rules"].get(code)
+
+
+def discount_for(code: str, subtotal: Decimal) -> Decimal:
+    """
+    Discount amount for an (already eligibility-checked) code; zero for
+    unknown, expired or exhausted codes and below the minimum spend.
+    """
+    rule = get_rule(code)
+    if rule is None or not rule.is_live():
+        return ZERO
+    return rule.amount_for(subtotal)
+
+
+def _usage_key(user_id, code: str) -> str:
+    version = get_catalog_version(PAID_ORDERS)
+    return f"discount:used:{version}:{user_id}:{code}"
+
+
+def times_used_by(user, code: str) -> int:
+    """How many paid orders `user` has with `code` (cached)."""
+    key = _usage_key(user.pk, code)
+    used = cache.get(key)
+    if used is None:
+        used = Order.objects.filter(
+            user=user,
+            discount_code=code,
+            paid=True,
+        ).count()
+        cache.set(key, used, USAGE_CACHE_TIMEOUT)
+    return used
+
+
+def has_used_code(user, code: str) -> bool:
+    """True if `user` already has a paid order with `code`."""
+    return times_used_by(user, code) > 0
+
+
+def forget_code_usage(user_id, code: str):
+    """Retire the cached counts once the order marked paid commits."""
+    code = (code or "").strip().upper()
+    if user_id and code:
+        # Before commit, a reader could re-cache the old count
+        transaction.on_commit(lambda: bump_catalog_version(PAID_ORDERS))
+
+
+def unavailable_reason(rule: DiscountRule | None, user) -> str | None:
+    """
+    Why `user` can't use `rule` right now: "USED" (per-user limit
+    reached), "UNAVAILABLE" (unknown, expired or exhausted) or None.
+    """
+    if rule is None or not rule.is_live():
+        return "UNAVAILABLE"
+    if (
+        rule.max_uses_per_user is not None
+        and user.is_authenticated
+        and times_used_by(user, rule.code) >= rule.max_uses_per_user
+    ):
+        return "USED"
+    return None
+
+
+def drop_ineligible_discount(request, code: str) -> bool:
+    """
+    If the session's `code` can no longer be used by this user, remove
+    it and set a one-time flag ("<CODE>_USED" / "<CODE>_UNAVAILABLE")
+    for views to message the user. Returns True when the code was
+    dropped.
+    """
+    if not code:
+        return False
+    reason = unavailable_reason(get_rule(code), request.user)
+    if reason is None:
+        return False
+
+    request.session.pop("discount", None)
+    request.session["discount_removed_notice"] = f"{code}_{reason}"
+    request.session.modified = True
+    return True
+
+
+def removed_notice_message(notice: str, where: str) -> str:
+    """User-facing text for a discount_removed_notice flag."""
+    code, _, reason = (notice or "").rpartition("_")
+    if reason == "USED":
+        return (
+            f"{code} has already been used on your account and "
+            f"has been removed from {where}."
+        )
+    return f"{code} is no longer available and has been removed from {where}."
+
+
+def record_redemption(code: str) -> bool:
+    """
+    Count one redemption of `code` (called inside the order transaction).
+
+    A single conditional UPDATE ... SET times_used = times_used + 1
+    WHERE times_used < max_uses, so concurrent checkouts never lose an
+    increment or count past the limit. Returns False when the code was
+    already used up (e.g. by a checkout that committed first); the order
+    keeps the price the customer paid. Reaching the limit bumps the rule
+    version so every process stops offering the code.
+    """
+    rule = get_rule(code)
+    if rule is None:
+        return False
+    codes = DiscountCode.objects.filter(pk=rule.pk)
+    if rule.max_uses is not None:
+        codes = codes.filter(times_used__lt=F("max_uses"))
+    if not codes.update(times_used=F("times_used") + 1):
+        logger.warning("Discount code %s redeemed past its limit", code)
+        transaction.on_commit(lambda: bump_catalog_version(DISCOUNTS))
+        return False
+    if rule.max_uses is not None:
+        exhausted = DiscountCode.objects.filter(
+            pk=rule.pk, times_used__gte=F("max_uses")
+        ).exists()
+        if exhausted:
+            logger.info("Discount code %s reached its usage limit", code)
+            transaction.on_commit(lambda: bump_catalog_version(DISCOUNTS))
+    return True
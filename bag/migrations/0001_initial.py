@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:20
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiscountCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=40, unique=True)),
+                ('kind', models.CharField(choices=[('percentage', 'Percentage off subtotal'), ('fixed', 'Fixed amount off subtotal')], default='percentage', max_length=12)),
+                ('value', models.DecimalField(decimal_places=2, help_text='Percent (e.g. 10) or amount in euro, depending on kind.', max_digits=8)),
+                ('min_spend', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=8)),
+                ('max_uses', models.PositiveIntegerField(blank=True, help_text='Total redemptions; blank = no limit.', null=True)),
+                ('max_uses_per_user', models.PositiveIntegerField(blank=True, help_text='Paid orders per registered user; blank = no limit.', null=True)),
+                ('times_used', models.PositiveIntegerField(default=0, editable=False)),
+                ('valid_from', models.DateTimeField(blank=True, null=True)),
+                ('valid_until', models.DateTimeField(blank=True, null=True)),
+                ('active', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ['code'],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+from decimal import Decimal
+
+from django.db import migrations
+
+
+def seed_welcome10(apps, schema_editor):
+    """WELCOME10 was hard-coded before discount codes lived in the DB."""
+    DiscountCode = apps.get_model("bag", "DiscountCode")
+    DiscountCode.objects.get_or_create(
+        code="WELCOME10",
+        defaults={
+            "kind": "percentage",
+            "value": Decimal("10.00"),
+            "max_uses_per_user": 1,
+        },
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("bag", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_welcome10, migrations.RunPython.noop),
+    ]
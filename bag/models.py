@@ -1 +1,60 @@
-# Create your models here.
+from decimal import Decimal
+
+from django.db import models
+
+
+class DiscountCode(models.Model):
+    """
+    A discount code customers can apply in the bag.
+
+    Rules (all optional except kind/value):
+      - percentage off the subtotal, or a fixed amount off
+      - minimum spend (subtotal before delivery)
+      - global and per-user usage limits
+      - validity window
+
+    Evaluation goes through the compiled rule table in bag.discounts;
+    times_used is only ever changed with an atomic F() update there.
+    """
+
+    PERCENTAGE = "percentage"
+    FIXED = "fixed"
+    KIND_CHOICES = [
+        (PERCENTAGE, "Percentage off subtotal"),
+        (FIXED, "Fixed amount off subtotal"),
+    ]
+
+    code = models.CharField(max_length=40, unique=True)
+    kind = models.CharField(
+        max_length=12, choices=KIND_CHOICES, default=PERCENTAGE
+    )
+    value = models.DecimalField(
+        max_digits=8,
+        decimal_places=2,
+        help_text="Percent (e.g. 10) or amount in euro, depending on kind.",
+    )
+    min_spend = models.DecimalField(
+        max_digits=8, decimal_places=2, default=Decimal("0.00")
+    )
+    max_uses = models.PositiveIntegerField(
+        null=True, blank=True, help_text="Total redemptions; blank = no limit."
+    )
+    max_uses_per_user = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Paid orders per registered user; blank = no limit.",
+    )
+    times_used = models.PositiveIntegerField(default=0, editable=False)
+    valid_from = models.DateTimeField(null=True, blank=True)
+    valid_until = models.DateTimeField(null=True, blank=True)
+    active = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ["code"]
+
+    def __str__(self):
+        return self.code
+
+    def save(self, *args, **kwargs):
+        self.code = (self.code or "").strip().upper()
+        super().save(*args, **kwargs)
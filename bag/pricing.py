@@ -0,0 +1,191 @@
+"""
+Shared pricing engine for the bag and checkout.
+
+BagPricer turns the raw session bag into an immutable PricedBag. Both the
+bag context processor and the checkout view go through it (via
+bag.context_processors.get_priced_bag), so a request prices the bag once
+and every caller sees the same numbers.
+"""
+from dataclasses import dataclass
+from decimal import Decimal
+from functools import cached_property
+
+from products.models import Product, ProductOption
+from products.snapshot import get_snapshot
+
+from .discounts import discount_for
+
+FREE_DELIVERY_THRESHOLD = Decimal("50.00")
+STANDARD_DELIVERY = Decimal("5.00")
+ZERO = Decimal("0.00")
+
+
+def delivery_for(subtotal: Decimal, product_count: int):
+    """(delivery charge, amount left to spend for free delivery)."""
+    if product_count == 0 or subtotal >= FREE_DELIVERY_THRESHOLD:
+        return ZERO, ZERO
+    return STANDARD_DELIVERY, FREE_DELIVERY_THRESHOLD - subtotal
+
+
+def _is_cupcake(product: Product) -> bool:
+    cat = getattr(product, "category", None)
+    if not cat:
+        return False
+    slug = getattr(cat, "slug", "") or ""
+    name = getattr(cat, "name", "") or ""
+    return slug.lower() == "cupcakes" or name.lower() == "cupcakes"
+
+
+def _pack_price(product: Product, option: ProductOption | None) -> Decimal:
+    """
+    Unit price used for a line item:
+      - Cupcakes with option: per-box price from option.pack_price()
+      - Everything else: product.price
+    """
+    if option:
+        return Decimal(option.pack_price())
+    return Decimal(product.price or 0)
+
+
+def _parse_bag_keys(bag) -> list[tuple[str, int, int | None, int]]:
+    """
+    Parse session['bag'] into (key, product_id, option_id, quantity)
+    tuples, silently dropping malformed entries.
+    """
+    parsed = []
+    for key, quantity in (bag or {}).items():
+        try:
+            pid_str, opt_str = (str(key).split("_", 1) + [None])[:2]
+            pid = int(pid_str)
+            opt_id = int(opt_str) if opt_str else None
+            qty = int(quantity)
+        except (TypeError, ValueError):
+            continue
+        parsed.append((key, pid, opt_id, qty))
+    return parsed
+
+
+@dataclass(frozen=True)
+class PricedLine:
+    key: str
+    product: Product
+    option: ProductOption | None
+    quantity: int  # number of boxes if option present
+    unit_price: Decimal
+    per_unit: Decimal | None  # price per cupcake or None
+    line_total: Decimal
+
+
+@dataclass(frozen=True)
+class PricedBag:
+    lines: tuple[PricedLine, ...]
+    product_count: int
+    subtotal: Decimal  # pre-discount
+    delivery: Decimal
+    free_delta: Decimal
+    discount_code: str
+    discount_amount: Decimal
+
+    @property
+    def pre_discount_total(self) -> Decimal:
+        return self.subtotal + self.delivery
+
+    @property
+    def grand_total(self) -> Decimal:
+        return self.subtotal - self.discount_amount + self.delivery
+
+    @cached_property
+    def context(self) -> dict:
+        """Template/legacy dict view, with the historical key names."""
+        items = list(self.lines)
+        return {
+            "items": items,  # alias
+            "bag_items": items,
+            "product_count": self.product_count,
+            "total": self.subtotal,  # pre-discount subtotal
+            "bag_total": self.subtotal,
+            "delivery": self.delivery,
+            "free_delta": self.free_delta,
+            "discount_amount": self.discount_amount,
+            "discount_code": self.discount_code,
+            "grand_total": self.grand_total,
+        }
+
+
+class BagPricer:
+    """
+    Price a session bag.
+
+    session['bag'] keys:
+      "<product_id>"                 -> simple product
+      "<product_id>_<option_id>"     -> ONLY cupcakes (box option)
+
+    Products (with category and options) come from the in-memory catalog
+    snapshot, so pricing doesn't query per line, or at all once the
+    snapshot is loaded. The discount code must already have been checked
+    for eligibility by the caller.
+    """
+
+    def __init__(self, bag, discount_code: str = ""):
+        self.bag = bag or {}
+        self.discount_code = (discount_code or "").strip().upper()
+
+    def lines(self) -> tuple[PricedLine, ...]:
+        parsed = _parse_bag_keys(self.bag)
+        if not parsed:
+            return ()
+
+        products = {
+            product.pk: product
+            for product in get_snapshot().get_products(
+                {pid for _, pid, _, _ in parsed}
+            )
+        }
+
+        lines = []
+        for key, pid, opt_id, qty in parsed:
+            product = products.get(pid)
+            if not product:
+                continue
+
+            option = None
+            if opt_id and _is_cupcake(product):
+                # Prefetched, and linked back to product for pack_price()
+                option = next(
+                    (o for o in product.options.all() if o.pk == opt_id),
+                    None,
+                )
+
+            unit_price = _pack_price(product, option)
+            per_unit = None
+            if option and getattr(option, "quantity", None):
+                per_unit = unit_price / Decimal(option.quantity)
+
+            lines.append(
+                PricedLine(
+                    key=key,
+                    product=product,
+                    option=option,
+                    quantity=qty,
+                    unit_price=unit_price,
+                    per_unit=per_unit,
+                    line_total=unit_price * qty,
+                )
+            )
+        return tuple(lines)
+
+    def price(self) -> PricedBag:
+        lines = self.lines()
+        product_count = sum(line.quantity for line in lines)
+        subtotal = sum((line.line_total for line in lines), ZERO)
+
+        delivery, free_delta = delivery_for(subtotal, product_count)
+        return PricedBag(
+            lines=lines,
+            product_count=product_count,
+            subtotal=subtotal,
+            delivery=delivery,
+            free_delta=free_delta,
+            discount_code=self.discount_code,
+            discount_amount=discount_for(self.discount_code, subtotal),
+        )
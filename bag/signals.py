@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from products.catalog import DISCOUNTS, bump_catalog_version
+
+from .models import DiscountCode
+
+
+@receiver([post_save, post_delete], sender=DiscountCode)
+def discount_codes_changed(sender, **kwargs):
+    # Reloads every process's compiled rule table (bag.discounts); the
+    # catalog's own caches are unaffected
+    bump_catalog_version(DISCOUNTS)
@@ -1 +1,310 @@
-# Create your tests here.
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.template import engines
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from checkout.models import Order
+from products.catalog import (
+    PAID_ORDERS,
+    bump_catalog_version,
+    get_catalog_version,
+)
+from products.models import Category, Product, ProductOption
+from products.snapshot import get_snapshot
+
+from .context_processors import (
+    BAG_SUMMARY_KEY,
+    bag_context,
+    bag_contents,
+    store_bag_summary,
+)
+from .discounts import (
+    discount_for,
+    drop_ineligible_discount,
+    forget_code_usage,
+    get_rule,
+    has_used_code,
+    record_redemption,
+)
+from .models import DiscountCode
+from .pricing import BagPricer
+
+
+class BagTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cupcakes = Category.objects.create(
+            name="cupcakes", slug="cupcakes"
+        )
+        self.cake = Product.objects.create(
+            name="Sponge", description="", price=Decimal("12.00")
+        )
+        self.cupcake = Product.objects.create(
+            name="Vanilla Cupcake",
+            description="",
+            price=Decimal("2.50"),
+            category=self.cupcakes,
+        )
+        self.box = ProductOption.objects.create(
+            product=self.cupcake, label="Box of 6", quantity=6
+        )
+
+    def _request(self, bag=None, session=None):
+        request = RequestFactory().get("/")
+        request.session = session or SessionStore()
+        if bag is not None:
+            request.session["bag"] = bag
+        request.user = AnonymousUser()
+        return request
+
+
+class BagContentsTests(BagTestCase):
+    def test_prices_simple_and_boxed_lines(self):
+        ctx = bag_contents(
+            self._request(
+                {
+                    str(self.cake.id): 2,
+                    f"{self.cupcake.id}_{self.box.id}": 1,
+                    "not-a-key": 3,
+                }
+            )
+        )
+        self.assertEqual(len(ctx["bag_items"]), 2)
+        self.assertEqual(ctx["product_count"], 3)
+        self.assertEqual(ctx["total"], Decimal("39.00"))
+        boxed = ctx["bag_items"][1]
+        self.assertEqual(boxed.option, self.box)
+        self.assertEqual(boxed.per_unit, Decimal("2.50"))
+
+    def test_query_count_is_independent_of_bag_size(self):
+        products = [
+            Product.objects.create(
+                name=f"Cake {i}", description="", price=Decimal("5.00")
+            )
+            for i in range(15)
+        ]
+        bag = {str(p.id): 1 for p in products}
+        bag[f"{self.cupcake.id}_{self.box.id}"] = 2
+
+        get_snapshot()
+        with self.assertNumQueries(0):
+            ctx = bag_contents(self._request(bag))
+        self.assertEqual(len(ctx["bag_items"]), 16)
+
+    def test_empty_bag_makes_no_queries(self):
+        with self.assertNumQueries(0):
+            ctx = bag_contents(self._request({}))
+        self.assertEqual(ctx["grand_total"], Decimal("0.00"))
+
+
+class LazyBagContextTests(BagTestCase):
+    def _render(self, source, request):
+        template = engines["django"].from_string(source)
+        return template.render({}, request)
+
+    def test_unused_bag_context_makes_no_queries(self):
+        request = self._request({str(self.cake.id): 1})
+        with self.assertNumQueries(0):
+            self._render("About us", request)
+
+    def test_bag_is_priced_once_per_request(self):
+        request = self._request({str(self.cake.id): 2})
+        with mock.patch.object(
+            BagPricer, "lines", autospec=True, side_effect=BagPricer.lines
+        ) as lines:
+            html = self._render(
+                "{{ grand_total }}|{{ product_count }}", request
+            )
+            bag_contents(request)
+        self.assertEqual(lines.call_count, 1)
+        self.assertEqual(html, "29.00|2")
+
+    def test_reprices_after_bag_changes(self):
+        request = self._request({str(self.cake.id): 1})
+        ctx = bag_context(request)
+        self.assertEqual(ctx["product_count"](), 1)
+        request.session["bag"][str(self.cake.id)] = 4
+        self.assertEqual(ctx["product_count"](), 4)
+
+
+class BagSummaryTests(BagTestCase):
+    NAV = "{{ bag_count }}|{{ grand_total }}"
+
+    def _render(self, request):
+        template = engines["django"].from_string(self.NAV)
+        return template.render({}, request)
+
+    def test_add_to_bag_stores_summary(self):
+        self.client.post(
+            reverse("add_to_bag", args=[self.cake.id]), {"quantity": 3}
+        )
+        summary = self.client.session[BAG_SUMMARY_KEY]
+        self.assertEqual(summary["count"], 3)
+        self.assertEqual(summary["grand_total"], "41.00")
+
+    def test_nav_renders_from_summary_without_queries(self):
+        request = self._request({str(self.cake.id): 1})
+        store_bag_summary(request)
+        request = self._request(session=request.session)
+        with self.assertNumQueries(0):
+            html = self._render(request)
+        self.assertEqual(html, "1|17.00")
+
+    def test_catalog_change_invalidates_summary(self):
+        request = self._request({str(self.cake.id): 1})
+        store_bag_summary(request)
+        self.cake.price = Decimal("60.00")
+        self.cake.save()
+        request = self._request(session=request.session)
+        self.assertEqual(self._render(request), "1|60.00")
+
+    def test_discount_expiry_invalidates_summary(self):
+        now = timezone.now()
+        DiscountCode.objects.create(
+            code="TODAY", value=10, valid_until=now + timedelta(hours=1)
+        )
+        request = self._request({str(self.cake.id): 1})
+        request.session["discount"] = {"code": "TODAY"}
+        store_bag_summary(request)
+        request = self._request(session=request.session)
+        self.assertEqual(self._render(request), "1|15.80")
+
+        later = now + timedelta(hours=2)
+        with mock.patch("django.utils.timezone.now", return_value=later):
+            request = self._request(session=request.session)
+            self.assertEqual(self._render(request), "1|17.00")
+
+
+class BagPricerTests(BagTestCase):
+    def test_priced_bag_is_immutable(self):
+        priced = BagPricer({str(self.cake.id): 1}, "welcome10").price()
+        self.assertEqual(priced.discount_code, "WELCOME10")
+        self.assertEqual(priced.discount_amount, Decimal("1.20"))
+        self.assertEqual(priced.grand_total, Decimal("15.80"))
+        with self.assertRaises(AttributeError):
+            priced.subtotal = Decimal("0.00")
+
+    def test_query_count_for_1_to_200_lines(self):
+        Product.objects.bulk_create(
+            Product(name=f"Bulk {i}", description="", price=Decimal("1.00"))
+            for i in range(200)
+        )
+        ids = list(Product.objects.values_list("id", flat=True)[:200])
+        bump_catalog_version()  # bulk_create sends no signals
+        get_snapshot()
+        for size in (1, 10, 50, 200):
+            bag = {str(pid): 1 for pid in ids[:size]}
+            with self.assertNumQueries(0):
+                priced = BagPricer(bag).price()
+            self.assertEqual(len(priced.lines), size)
+            self.assertEqual(priced.product_count, size)
+
+
+class DiscountEligibilityTests(BagTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("shopper", "s@e.com", "pw")
+
+    def test_usage_is_cached_per_user(self):
+        get_catalog_version(PAID_ORDERS)  # read by every bag render
+        with self.assertNumQueries(1):
+            self.assertFalse(has_used_code(self.user, "WELCOME10"))
+            self.assertFalse(has_used_code(self.user, "WELCOME10"))
+
+    def test_forget_after_paid_order(self):
+        self.assertFalse(has_used_code(self.user, "WELCOME10"))
+        order = Order.objects.create(
+            user=self.user,
+            full_name="S",
+            email="s@e.com",
+            discount_code="WELCOME10",
+        )
+        order.paid = True
+        order.save(update_fields=["paid"])
+        with self.captureOnCommitCallbacks(execute=True):
+            forget_code_usage(order.user_id, order.discount_code)
+
+        request = self._request({str(self.cake.id): 1})
+        request.user = self.user
+        request.session["discount"] = {"code": "WELCOME10"}
+        self.assertTrue(drop_ineligible_discount(request, "WELCOME10"))
+        self.assertNotIn("discount", request.session)
+        self.assertEqual(
+            request.session["discount_removed_notice"], "WELCOME10_USED"
+        )
+
+
+class DiscountRuleTests(BagTestCase):
+    def test_welcome10_is_seeded(self):
+        self.assertEqual(discount_for("welcome10", Decimal("40.00")), 4)
+
+    def test_fixed_amount_and_min_spend(self):
+        DiscountCode.objects.create(
+            code="fiver",
+            kind=DiscountCode.FIXED,
+            value=Decimal("5.00"),
+            min_spend=Decimal("30.00"),
+        )
+        self.assertEqual(discount_for("FIVER", Decimal("29.99")), 0)
+        self.assertEqual(discount_for("FIVER", Decimal("30.00")), 5)
+
+    def test_validity_window(self):
+        now = timezone.now()
+        DiscountCode.objects.create(
+            code="LATER", value=10, valid_from=now + timedelta(days=1)
+        )
+        DiscountCode.objects.create(
+            code="GONE", value=10, valid_until=now - timedelta(days=1)
+        )
+        self.assertEqual(discount_for("LATER", Decimal("50.00")), 0)
+        self.assertEqual(discount_for("GONE", Decimal("50.00")), 0)
+
+    def test_lookup_uses_compiled_table(self):
+        get_rule("WELCOME10")
+        with self.assertNumQueries(0):
+            for _ in range(100):
+                get_rule("WELCOME10")
+                get_rule("NOPE")
+
+    def test_global_limit(self):
+        DiscountCode.objects.create(code="ONCE", value=10, max_uses=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(record_redemption("ONCE"))
+        self.assertEqual(
+            DiscountCode.objects.get(code="ONCE").times_used, 1
+        )
+        self.assertEqual(discount_for("ONCE", Decimal("50.00")), 0)
+
+        # A checkout that still saw the code as live can't overshoot
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertFalse(record_redemption("ONCE"))
+        self.assertEqual(
+            DiscountCode.objects.get(code="ONCE").times_used, 1
+        )
+
+    def test_code_changes_leave_the_catalog_version_alone(self):
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            DiscountCode.objects.create(code="NEW5", value=5)
+        self.assertEqual(discount_for("NEW5", Decimal("40.00")), 2)
+        self.assertEqual(get_catalog_version(), version)
+
+    def test_apply_min_spend_message(self):
+        DiscountCode.objects.create(
+            code="BIG", value=10, min_spend=Decimal("100.00")
+        )
+        session = self.client.session
+        session["bag"] = {str(self.cake.id): 1}
+        session.save()
+        response = self.client.post(
+            reverse("apply_discount"), {"code": "big"}, follow=True
+        )
+        self.assertNotIn("discount", self.client.session)
+        self.assertContains(response, "Spend at least")
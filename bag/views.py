@@ -3,9 +3,16 @@ from decimal import Decimal
 from django.contrib import messages
 from django.shortcuts import get_object_or_404, redirect, render
 
-from checkout.models import Order
 from products.models import Product, ProductOption
 
+from .context_processors import bag_contents, store_bag_summary
+from .discounts import (
+    drop_ineligible_discount,
+    get_rule,
+    removed_notice_message,
+    unavailable_reason,
+)
+
 
 def _get_bag(session):
     """Ensure a bag dict exists in the session and return it."""
@@ -18,39 +25,23 @@ def _consume_discount_removed_notice(request):
     show a one-time message and clear the notice flag.
     """
     notice = request.session.pop("discount_removed_notice", None)
-    if notice == "WELCOME10_USED":
+    if notice:
         request.session.modified = True
         messages.warning(
-            request,
-            "WELCOME10 has already been used on your account and "
-            "has been removed from your bag totals."
+            request, removed_notice_message(notice, "your bag totals")
         )
 
 
 def _enforce_discount_eligibility_for_user(request):
     """
-    Apply-time enforcement (covers cases where a logged-in user enters
-    WELCOME10 again). The global safeguard is still in the context processor.
+    Apply-time enforcement (covers cases where a logged-in user enters a
+    single-use code again). The global safeguard is still in the context
+    processor.
     """
     disc = request.session.get("discount") or {}
     code = (disc.get("code") or "").strip().upper()
 
-    if code != "WELCOME10":
-        return
-
-    if not request.user.is_authenticated:
-        return
-
-    already_used = Order.objects.filter(
-        user=request.user,
-        discount_code="WELCOME10",
-        paid=True,
-    ).exists()
-
-    if already_used:
-        request.session.pop("discount", None)
-        request.session["discount_removed_notice"] = "WELCOME10_USED"
-        request.session.modified = True
+    drop_ineligible_discount(request, code)
 
 
 def view_bag(request):
@@ -107,6 +98,7 @@ def add_to_bag(request, product_id):
     # Normal behaviour for all products (including Custom Cake Deposit)
     bag[key] = bag.get(key, 0) + qty
     request.session.modified = True
+    store_bag_summary(request)
 
     if option:
         messages.success(
@@ -161,6 +153,7 @@ def adjust_bag(request, product_id):
         messages.info(request, msg)
 
     request.session.modified = True
+    store_bag_summary(request)
     return redirect("view_bag")
 
 
@@ -183,6 +176,7 @@ def remove_from_bag(request, product_id):
     if key in bag:
         bag.pop(key)
         request.session.modified = True
+        store_bag_summary(request)
         msg = f"Removed {product.name}"
         if option:
             msg += f" ({option.label})"
@@ -196,12 +190,13 @@ def remove_from_bag(request, product_id):
 
 def apply_discount(request):
     """
-    Accepts POST with 'code'. MVP supports:
-      WELCOME10 -> 10% off subtotal (before delivery).
+    Accepts POST with 'code', looked up in the DiscountCode rule table
+    (e.g. WELCOME10 -> 10% off subtotal before delivery).
 
     Stores {'code': CODE, 'amount': Decimal} in session['discount'].
 
-    WELCOME10 can only be used once per registered user.
+    Per-user limits (WELCOME10 is once per registered user), the global
+    limit, the validity window and any minimum spend are enforced here.
     """
     if request.method != "POST":
         return redirect("view_bag")
@@ -211,39 +206,41 @@ def apply_discount(request):
         messages.error(request, "Please enter a discount code.")
         return redirect("view_bag")
 
-    # Enforce single-use per registered user (at apply-time)
-    if code == "WELCOME10" and request.user.is_authenticated:
-        already_used = Order.objects.filter(
-            user=request.user,
-            discount_code="WELCOME10",
-            paid=True,
-        ).exists()
-
-        if already_used:
-            request.session.pop("discount", None)
-            request.session["discount_removed_notice"] = "WELCOME10_USED"
-            request.session.modified = True
-            _consume_discount_removed_notice(request)
-            return redirect("view_bag")
+    rule = get_rule(code)
+    reason = unavailable_reason(rule, request.user)
 
-    # Compute against current subtotal via context processor
-    from .context_processors import bag_contents
+    # Enforce per-user limits (at apply-time)
+    if reason == "USED":
+        request.session.pop("discount", None)
+        request.session["discount_removed_notice"] = f"{code}_USED"
+        request.session.modified = True
+        store_bag_summary(request)
+        _consume_discount_removed_notice(request)
+        return redirect("view_bag")
 
+    # Compute against current subtotal via context processor
     ctx = bag_contents(request)
     subtotal = ctx.get("total", Decimal("0.00"))
-
-    amount = Decimal("0.00")
-    if code == "WELCOME10":
-        amount = (subtotal * Decimal("0.10")).quantize(Decimal("0.01"))
+    amount = rule.amount_for(subtotal) if reason is None else Decimal("0")
 
     if amount <= 0:
-        messages.error(request, "This code is invalid or your bag is empty.")
+        if reason is None and subtotal and subtotal < rule.min_spend:
+            messages.error(
+                request,
+                f"Spend at least €{rule.min_spend:.2f} to use '{code}'.",
+            )
+        else:
+            messages.error(
+                request, "This code is invalid or your bag is empty."
+            )
         request.session.pop("discount", None)
         request.session.modified = True
+        store_bag_summary(request)
         return redirect("view_bag")
 
     request.session["discount"] = {"code": code, "amount": str(amount)}
     request.session.modified = True
+    store_bag_summary(request)
     messages.success(
         request, f"Discount code '{code}' applied: -€{amount:.2f}"
     )
@@ -254,5 +251,6 @@ def remove_discount(request):
     """Remove any applied discount from session."""
     request.session.pop("discount", None)
     request.session.modified = True
+    store_bag_summary(request)
     messages.info(request, "Discount removed.")
     return redirect("view_bag")
@@ -69,6 +69,7 @@ INSTALLED_APPS = [
     "profiles",
     "custom_cake",
     "newsletter",
+    "jobs",
 ]
 
 # --- Middleware ---
@@ -104,7 +105,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
-                "bag.context_processors.bag_contents",
+                "bag.context_processors.bag_context",
                 "products.context_processors.all_categories",
             ],
         },
@@ -125,9 +126,29 @@ else:
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
+            # A file, not the in-memory default: an in-memory database
+            # shared between threads fails with "table is locked" instead
+            # of waiting, so the job workers' concurrency tests need one
+            "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
         }
     }
 
+# --- Caches ---
+# "default" is per process: data keyed on a version counter (snapshot
+# mirror, fragments, sitemaps, discount usage), where each process filling
+# its own copy is fine. "shared" is one table every web and worker process
+# sees, for state every process adds to (fragment stats). Create it with
+# `python manage.py createcachetable`.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "shared": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "django_cache",
+    },
+}
+
 # --- Authentication ---
 AUTHENTICATION_BACKENDS = [
     "django.contrib.auth.backends.ModelBackend",
@@ -190,6 +211,9 @@ STORAGES = {
 
 # --- Media ---
 MEDIA_URL = "/media/"
+# Thumbnail widths (px) generated on upload; see products.images
+IMAGE_THUMB_WIDTHS = (320, 640, 960)
+IMAGE_THUMB_QUALITY = 80
 
 cloudinary.config(
     cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
@@ -208,11 +232,57 @@ EMAIL_BACKEND = os.getenv(
     "django.core.mail.backends.console.EmailBackend",
 )
 
+# --- Background jobs (jobs.queue / manage.py run_workers) ---
+JOBS_EAGER = env_bool("JOBS_EAGER", False)  # run inline, no worker
+JOBS_WORKERS = 4
+JOBS_POLL_INTERVAL = 1.0  # seconds between polls when idle
+JOBS_VISIBILITY_TIMEOUT = 300  # seconds before a stuck job is re-claimed
+JOBS_MAX_ATTEMPTS = 5
+JOBS_RETRY_BACKOFF = 10  # seconds, doubled per attempt
+JOBS_RETRY_BACKOFF_MAX = 3600
+
 # --- Stripe ---
 STRIPE_PUBLIC_KEY = os.getenv("STRIPE_PUBLIC_KEY", "")
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY", "")
 STRIPE_CURRENCY = os.getenv("STRIPE_CURRENCY", "eur")
 STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET", "")
+# Calls are made while a checkout request waits, so keep each to one
+# attempt: a checkout page makes at most two (modify, then create), i.e.
+# 2 * (connect + read) = 14s worst case, well inside gunicorn's 30s
+STRIPE_CONNECT_TIMEOUT = 2  # seconds
+STRIPE_READ_TIMEOUT = 5  # seconds
+STRIPE_MAX_RETRIES = 0  # network retries; each one adds a full timeout
+STRIPE_POOL_SIZE = 10  # keep-alive connections per process
+# Failed tries before a webhook event is parked and skipped (keep it at
+# or below JOBS_MAX_ATTEMPTS so the processing job gets that far)
+STRIPE_EVENT_MAX_ATTEMPTS = 3
+
+# --- Payment gateway (checkout.gateways) ---
+# checkout.gateways.FakeGateway is in-process, for tests and load runs
+PAYMENT_GATEWAY = os.getenv(
+    "PAYMENT_GATEWAY", "checkout.gateways.StripeGateway"
+)
+PAYMENT_FAKE_LATENCY = 0  # seconds added to each fake gateway call
+PAYMENT_BREAKER_THRESHOLD = 3  # consecutive failures before failing fast
+PAYMENT_BREAKER_RESET = 30  # seconds before a trial call is let through
+
+# --- Catalog ---
+# Product cards per listing page, and where the result count stops
+PRODUCTS_PAGE_SIZE = int(os.getenv("PRODUCTS_PAGE_SIZE", "24"))
+PRODUCTS_COUNT_CAP = int(os.getenv("PRODUCTS_COUNT_CAP", "1000"))
+# Seconds a worker trusts its cached catalog version before re-reading it
+CATALOG_VERSION_TTL = int(os.getenv("CATALOG_VERSION_TTL", "5"))
+# Cached page fragments; any catalog change retires them sooner
+FRAGMENT_CACHE_TIMEOUT = int(os.getenv("FRAGMENT_CACHE_TIMEOUT", "3600"))
+# Seconds between adding a process's fragment hit/miss counts to the totals
+FRAGMENT_STATS_FLUSH = 10
+# URLs per product sitemap file (the protocol's limit is 50,000)
+SITEMAP_CHUNK_SIZE = int(os.getenv("SITEMAP_CHUNK_SIZE", "50000"))
+SITEMAP_CACHE_TIMEOUT = int(os.getenv("SITEMAP_CACHE_TIMEOUT", "3600"))
+
+# --- Orders ---
+# Rows per page on the (keyset-paginated) order history
+ORDERS_PAGE_SIZE = int(os.getenv("ORDERS_PAGE_SIZE", "25"))
 
 # --- Security (production) ---
 SECURE_SSL_REDIRECT = not DEBUG
@@ -0,0 +1,151 @@
+"""
+Sitemap generation for the whole catalog.
+
+/sitemap.xml is a sitemap index pointing at:
+  - sitemap-static.xml      fixed landing pages
+  - sitemap-categories.xml  one ?category= listing per category
+  - sitemap-products-N.xml  product pages, SITEMAP_CHUNK_SIZE per file
+                            (the protocol allows at most 50,000)
+
+Product chunks are keyset ranges: the first id of every chunk is found
+with one window query per catalog version, and a chunk is read with
+WHERE id >= <its first id> ... LIMIT, so late chunks cost no more than
+early ones. Rows come from values_list() with a server-side cursor (ids
+and timestamps only, never whole models) and are streamed out as they
+are read; nothing holds a whole chunk in memory. The small index, static
+and category documents are rendered whole and cached under the catalog
+version. Every document carries a catalog-version ETag, so crawlers
+re-fetching an unchanged sitemap get a 304.
+"""
+import hashlib
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Max, Window
+from django.db.models.functions import Mod, RowNumber
+from django.urls import NoReverseMatch, reverse
+
+from products.catalog import get_catalog_version
+from products.models import Product
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+NS = 'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+
+STATIC_URL_NAMES = [
+    "home",
+    "product_list",
+    "product_cakes",
+    "product_accessories",
+    "product_offers",
+    "about",
+]
+
+
+def _lastmod(value) -> str:
+    return value.replace(microsecond=0).isoformat() if value else ""
+
+
+def _entry(tag, loc, lastmod=None) -> str:
+    parts = [f"  <{tag}>\n    <loc>{escape(loc)}</loc>\n"]
+    if lastmod:
+        parts.append(f"    <lastmod>{_lastmod(lastmod)}</lastmod>\n")
+    parts.append(f"  </{tag}>\n")
+    return "".join(parts)
+
+
+def _indexable_products():
+    # Custom-cake deposits etc. are bookkeeping products, not pages
+    return Product.objects.filter(is_custom=False)
+
+
+def product_chunk_starts() -> list[int]:
+    """First product id of each chunk, cached per catalog version."""
+    size = settings.SITEMAP_CHUNK_SIZE
+    key = f"sitemap:chunks:{get_catalog_version()}:{size}"
+    starts = cache.get(key)
+    if starts is None:
+        starts = list(
+            _indexable_products()
+            .annotate(row=Window(RowNumber(), order_by=F("pk").asc()))
+            .annotate(slot=Mod(F("row") - 1, size))
+            .filter(slot=0)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        cache.set(key, starts, settings.SITEMAP_CACHE_TIMEOUT)
+    return starts
+
+
+def product_chunk_count() -> int:
+    return max(1, len(product_chunk_starts()))
+
+
+def index_entries(request):
+    """(loc, lastmod) for every sitemap in the index."""
+    newest = _indexable_products().aggregate(Max("updated_on"))
+    lastmod = newest["updated_on__max"]
+    yield request.build_absolute_uri(
+        reverse("sitemap_section", args=["static"])
+    ), None
+    yield request.build_absolute_uri(
+        reverse("sitemap_section", args=["categories"])
+    ), lastmod
+    for chunk in range(1, product_chunk_count() + 1):
+        yield request.build_absolute_uri(
+            reverse("sitemap_products", args=[chunk])
+        ), lastmod
+
+
+def static_entries(request):
+    for name in STATIC_URL_NAMES:
+        try:
+            yield request.build_absolute_uri(reverse(name)), None
+        except NoReverseMatch:
+            # Ignore missing routes (keeps the sitemap safe during refactors)
+            continue
+
+
+def category_entries(request):
+    base = request.build_absolute_uri(reverse("product_list"))
+    rows = (
+        _indexable_products()
+        .exclude(category__isnull=True)
+        .values_list("category__slug")
+        .annotate(lastmod=Max("updated_on"))
+        .order_by("category__slug")
+    )
+    for slug, lastmod in rows.iterator():
+        yield f"{base}?category={slug}", lastmod
+
+
+def product_entries(request, chunk: int):
+    starts = product_chunk_starts()
+    if chunk > len(starts):
+        return
+    rows = (
+        _indexable_products()
+        .filter(pk__gte=starts[chunk - 1])
+        .order_by("pk")
+        .values_list("pk", "updated_on")[: settings.SITEMAP_CHUNK_SIZE]
+    )
+    # reverse() once, then splice each id in
+    prefix, suffix = request.build_absolute_uri(
+        reverse("product_detail", args=[0])
+    ).rsplit("0", 1)
+    for pk, updated_on in rows.iterator(chunk_size=2000):
+        yield f"{prefix}{pk}{suffix}", updated_on
+
+
+def render(entries, index=False):
+    """Yield the XML document for `entries` piece by piece."""
+    root, tag = ("sitemapindex", "sitemap") if index else ("urlset", "url")
+    yield f"{XML_HEADER}<{root} {NS}>\n"
+    for loc, lastmod in entries:
+        yield _entry(tag, loc, lastmod)
+    yield f"</{root}>\n"
+
+
+def cache_key(request, name: str) -> str:
+    raw = f"{name}|{request.get_host()}|{get_catalog_version()}"
+    return "sitemap:" + hashlib.sha1(raw.encode()).hexdigest()
@@ -0,0 +1,142 @@
+"""
+Project-level tests: the query plan regression suite and the sitemaps.
+"""
+import re
+from decimal import Decimal
+from xml.etree import ElementTree
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from checkout.models import Order
+from custom_cake.models import CustomCake
+from products.models import Product
+
+
+class QueryPlanTests(TestCase):
+    """
+    Runs EXPLAIN on the hot lookups and fails if any of them falls back to
+    a full table scan. Supports SQLite (local/dev) and PostgreSQL
+    (production); on PostgreSQL sequential scans are disabled for the
+    check so the planner picks an index whenever a usable one exists, even
+    on tiny test tables.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("plan", "p@example.com", "pw")
+
+    def setUp(self):
+        if connection.vendor not in ("sqlite", "postgresql"):
+            self.skipTest(f"No plan checks for {connection.vendor}")
+
+    def assertNoFullScan(self, queryset):
+        table = queryset.model._meta.db_table
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = queryset.explain()
+            full_scan = re.search(rf"Seq Scan on {table}\b", plan)
+        else:
+            plan = queryset.explain()
+            # "SCAN <table>" without "USING ... INDEX" reads every row
+            full_scan = re.search(rf"\bSCAN {table}\b(?! USING)", plan)
+        self.assertIsNone(full_scan, f"Full scan on {table}:\n{plan}")
+
+    def test_webhook_order_by_stripe_pid(self):
+        self.assertNoFullScan(Order.objects.for_payment_intent("pi_123"))
+
+    def test_discount_already_used_check(self):
+        self.assertNoFullScan(
+            Order.objects.filter(
+                user=self.user, discount_code="WELCOME10", paid=True
+            )
+        )
+
+    def test_product_by_sku(self):
+        self.assertNoFullScan(Product.objects.filter(sku="CUST-DEP"))
+
+    def test_featured_products(self):
+        self.assertNoFullScan(Product.objects.filter(featured=True)[:8])
+
+    def test_offer_products(self):
+        self.assertNoFullScan(Product.objects.filter(is_offer=True))
+
+    def test_custom_cakes_for_user(self):
+        self.assertNoFullScan(
+            CustomCake.objects.filter(user=self.user).order_by(
+                "-created_on", "-id"
+            )
+        )
+
+
+@override_settings(SITEMAP_CHUNK_SIZE=3)
+class SitemapTests(TestCase):
+    NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+    def setUp(self):
+        cache.clear()
+        self.products = [
+            Product.objects.create(
+                name=f"Cake {i}", description="", price=Decimal("10.00")
+            )
+            for i in range(7)
+        ]
+        Product.objects.create(
+            name="Deposit",
+            description="",
+            price=Decimal("20.00"),
+            is_custom=True,
+        )
+
+    def _locs(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        root = ElementTree.fromstring(response.getvalue())
+        return [el.text for el in root.iter(f"{self.NS}loc")]
+
+    def test_index_lists_chunks(self):
+        locs = self._locs(reverse("sitemap_xml"))
+        self.assertEqual(len(locs), 2 + 3)  # static, categories, 3 chunks
+        self.assertTrue(locs[-1].endswith("/sitemap-products-3.xml"))
+
+    def test_chunks_cover_every_product_once(self):
+        seen = []
+        for chunk in (1, 2, 3):
+            seen += self._locs(reverse("sitemap_products", args=[chunk]))
+        expected = [
+            f"http://testserver/products/{p.pk}/" for p in self.products
+        ]
+        self.assertEqual(seen, expected)
+        missing = self.client.get(reverse("sitemap_products", args=[4]))
+        self.assertEqual(missing.status_code, 404)
+
+    def test_chunks_are_keyset_ranges(self):
+        self._locs(reverse("sitemap_xml"))  # finds the chunk starts
+        url = reverse("sitemap_products", args=[3])
+        with CaptureQueriesContext(connection) as ctx:
+            locs = self._locs(url)
+        self.assertEqual(
+            locs, [f"http://testserver/products/{self.products[6].pk}/"]
+        )
+        self.assertEqual(len(ctx.captured_queries), 1)
+        sql = ctx.captured_queries[0]["sql"]
+        self.assertNotIn("OFFSET", sql.upper())
+        self.assertIn(f'"id" >= {self.products[6].pk}', sql)
+
+    def test_product_chunks_stream_and_revalidate(self):
+        url = reverse("sitemap_products", args=[1])
+        first = self.client.get(url)
+        self.assertTrue(first.streaming)
+        again = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+
+    def test_small_sitemaps_are_served_from_cache(self):
+        url = reverse("sitemap_section", args=["categories"])
+        first = self._locs(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self._locs(url), first)
@@ -24,6 +24,16 @@ urlpatterns = [
     ),
     path("robots.txt", core_views.robots_txt, name="robots_txt"),
     path("sitemap.xml", core_views.sitemap_xml, name="sitemap_xml"),
+    path(
+        "sitemap-products-<int:chunk>.xml",
+        core_views.sitemap_products,
+        name="sitemap_products",
+    ),
+    path(
+        "sitemap-<slug:section>.xml",
+        core_views.sitemap_section,
+        name="sitemap_section",
+    ),
     path("newsletter/", include("newsletter.urls")),
 ]
 
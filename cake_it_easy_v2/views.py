@@ -1,6 +1,12 @@
-from django.http import HttpResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.urls import reverse
+from django.views.decorators.http import condition
+
+from cake_it_easy_v2 import sitemaps
+from products.conditional import sitemap_etag
 
 
 def robots_txt(request):
@@ -22,40 +28,50 @@ def robots_txt(request):
     return HttpResponse("\n".join(lines), content_type="text/plain")
 
 
+def _sitemap_response(request, name, pieces):
+    """Serve a small sitemap body from the cache, rendering it on a miss."""
+    key = sitemaps.cache_key(request, name)
+    body = cache.get(key)
+    if body is None:
+        body = "".join(pieces)
+        cache.set(key, body, settings.SITEMAP_CACHE_TIMEOUT)
+    return HttpResponse(body, content_type="application/xml")
+
+
+@condition(etag_func=sitemap_etag)
 def sitemap_xml(request):
-    """Minimal sitemap for public, indexable pages."""
-    url_names = [
-        "home",  # if your home URL name differs, update/remove this
-        "product_list",
-        "product_cakes",
-        "product_accessories",
-        "product_offers",
-        "about",
-    ]
+    """Sitemap index: static pages, categories and product chunks."""
+    return _sitemap_response(
+        request,
+        "index",
+        sitemaps.render(sitemaps.index_entries(request), index=True),
+    )
 
-    urls = []
-    for name in url_names:
-        try:
-            urls.append(request.build_absolute_uri(reverse(name)))
-        except Exception:
-            # Ignore missing routes (keeps this view safe during refactors)
-            continue
-
-    body = [
-        '<?xml version="1.0" encoding="UTF-8"?>',
-        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">',
-    ]
-    for u in urls:
-        body.extend(
-            [
-                "  <url>",
-                f"    <loc>{u}</loc>",
-                "  </url>",
-            ]
-        )
-    body.append("</urlset>")
-
-    return HttpResponse("\n".join(body), content_type="application/xml")
+
+@condition(etag_func=sitemap_etag)
+def sitemap_section(request, section):
+    """The static-page and category-landing sitemaps."""
+    entries = {
+        "static": sitemaps.static_entries,
+        "categories": sitemaps.category_entries,
+    }.get(section)
+    if entries is None:
+        raise Http404("No such sitemap.")
+    return _sitemap_response(
+        request, section, sitemaps.render(entries(request))
+    )
+
+
+@condition(etag_func=sitemap_etag)
+def sitemap_products(request, chunk):
+    """One chunk of product pages (SITEMAP_CHUNK_SIZE per file)."""
+    if not 1 <= chunk <= sitemaps.product_chunk_count():
+        raise Http404("No such sitemap.")
+    # Streamed straight from the cursor; repeat fetches get a 304
+    return StreamingHttpResponse(
+        sitemaps.render(sitemaps.product_entries(request, chunk)),
+        content_type="application/xml",
+    )
 
 
 def custom_404(request, exception):
@@ -1,6 +1,10 @@
 from django.contrib import admin
 
-from .models import Order, OrderLineItem
+from bag.discounts import forget_code_usage
+from jobs.queue import enqueue
+
+from .models import Order, OrderLineItem, StripeEvent
+from .webhooks import PROCESS_TASK
 
 
 class OrderLineItemInline(admin.TabularInline):
@@ -11,7 +15,14 @@ class OrderLineItemInline(admin.TabularInline):
 
 @admin.action(description="Mark selected orders as paid")
 def mark_paid(_modeladmin, _request, queryset):
+    used = list(
+        queryset.filter(paid=False)
+        .exclude(discount_code="")
+        .values_list("user_id", "discount_code")
+    )
     queryset.update(paid=True)
+    for user_id, code in used:
+        forget_code_usage(user_id, code)
 
 
 @admin.register(Order)
@@ -86,3 +97,39 @@ class OrderAdmin(admin.ModelAdmin):
             {"fields": ("order_total",)},
         ),
     )
+
+
+@admin.action(description="Retry selected parked events")
+def retry_events(_modeladmin, _request, queryset):
+    queryset.filter(processed_on__isnull=True).update(
+        failed_on=None, attempts=0
+    )
+    enqueue(PROCESS_TASK)
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    actions = [retry_events]
+    list_display = (
+        "event_id",
+        "type",
+        "stripe_created",
+        "received_on",
+        "processed_on",
+        "failed_on",
+        "attempts",
+    )
+    list_filter = ("type", "processed_on", "failed_on")
+    search_fields = ("event_id",)
+    ordering = ("-stripe_created", "-id")
+    readonly_fields = (
+        "event_id",
+        "type",
+        "payload",
+        "stripe_created",
+        "received_on",
+        "processed_on",
+        "attempts",
+        "failed_on",
+        "last_error",
+    )
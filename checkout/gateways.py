@@ -0,0 +1,298 @@
+"""
+Payment gateway clients.
+
+Checkout and the webhook talk to a PaymentGateway, picked by the
+PAYMENT_GATEWAY setting (a dotted path), instead of the global stripe
+module:
+
+  - StripeGateway: a StripeClient on a pooled keep-alive requests
+    session, with short connect/read timeouts and (by default) no
+    network retries, since a customer is waiting on every call.
+  - FakeGateway: in-process and in-memory, for tests and load runs. It
+    can add latency or act as "down".
+
+Every call goes through a per-process circuit breaker. After
+PAYMENT_BREAKER_THRESHOLD consecutive failures (timeouts, connection or
+5xx errors; without network retries every timed-out attempt counts)
+calls fail fast with GatewayUnavailable for PAYMENT_BREAKER_RESET
+seconds. Then one trial call decides whether to close the breaker again.
+A slow or failing Stripe therefore costs each web worker a few short
+timeouts, not every request.
+"""
+import itertools
+import json
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, replace
+
+import requests
+import stripe
+from django.conf import settings
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+
+
+class PaymentError(Exception):
+    """The gateway answered, but refused the request."""
+
+
+class GatewayUnavailable(PaymentError):
+    """No usable answer: timeout, connection/5xx error or open circuit."""
+
+
+class IntentLocked(PaymentError):
+    """The intent can no longer be changed (confirmed, cancelled, gone)."""
+
+
+class InvalidWebhook(PaymentError):
+    """Bad signature or malformed webhook payload."""
+
+
+@dataclass(frozen=True)
+class Intent:
+    id: str
+    client_secret: str
+    amount: int
+    status: str
+
+
+class CircuitBreaker:
+    """Closed -> open after `threshold` failures -> half-open trial."""
+
+    def __init__(self, threshold, reset_after, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.trial or self.clock() - self.opened_at < self.reset_after:
+                return False
+            self.trial = True  # let one call through to probe
+            return True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                self.opened_at = self.clock()
+            self.trial = False
+
+
+class PaymentGateway:
+    """Base class: subclasses implement _create_intent / _modify_intent."""
+
+    # False when the gateway isn't configured (e.g. no Stripe keys)
+    enabled = True
+
+    def __init__(self):
+        self.breaker = CircuitBreaker(
+            settings.PAYMENT_BREAKER_THRESHOLD,
+            settings.PAYMENT_BREAKER_RESET,
+        )
+
+    def create_intent(self, amount, currency, metadata) -> Intent:
+        return self._guarded(self._create_intent, amount, currency, metadata)
+
+    def modify_intent(self, intent_id, amount, metadata) -> Intent:
+        return self._guarded(self._modify_intent, intent_id, amount, metadata)
+
+    def verify_webhook(self, payload: bytes, sig_header: str, secret: str):
+        """The event as a dict, if its signature checks out (no I/O)."""
+        try:
+            stripe.WebhookSignature.verify_header(
+                payload.decode("utf-8"), sig_header, secret, tolerance=300
+            )
+            event = json.loads(payload)
+        except (ValueError, stripe.SignatureVerificationError) as exc:
+            raise InvalidWebhook(str(exc)) from exc
+        if not isinstance(event, dict) or "id" not in event:
+            raise InvalidWebhook("Payload isn't a Stripe event")
+        return event
+
+    def _guarded(self, func, *args):
+        if not self.breaker.allow():
+            raise GatewayUnavailable("Payment gateway circuit is open")
+        try:
+            result = func(*args)
+        except GatewayUnavailable:
+            self.breaker.failure()
+            raise
+        except PaymentError:
+            self.breaker.success()  # a refusal is still an answer
+            raise
+        except Exception:
+            # Anything unexpected counts against the gateway too, so a
+            # half-open trial never leaves the breaker stuck
+            self.breaker.failure()
+            raise
+        self.breaker.success()
+        return result
+
+    def _create_intent(self, amount, currency, metadata) -> Intent:
+        raise NotImplementedError
+
+    def _modify_intent(self, intent_id, amount, metadata) -> Intent:
+        raise NotImplementedError
+
+
+# ----------------------------
+# Stripe
+# ----------------------------
+
+UNAVAILABLE_ERRORS = (
+    stripe.APIConnectionError,  # includes timeouts
+    stripe.RateLimitError,
+    stripe.APIError,  # 5xx
+)
+
+
+def _pooled_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=settings.STRIPE_POOL_SIZE
+    )
+    session.mount("https://", adapter)
+    return session
+
+
+class StripeGateway(PaymentGateway):
+    def __init__(self):
+        super().__init__()
+        self.enabled = bool(
+            settings.STRIPE_PUBLIC_KEY and settings.STRIPE_SECRET_KEY
+        )
+        self.session = _pooled_session()
+        self.http_client = stripe.RequestsClient(
+            timeout=(
+                settings.STRIPE_CONNECT_TIMEOUT,
+                settings.STRIPE_READ_TIMEOUT,
+            ),
+            session=self.session,
+        )
+        client = stripe.StripeClient(
+            settings.STRIPE_SECRET_KEY or "sk_unset",
+            http_client=self.http_client,
+            # Retries (with idempotency keys) each add a full timeout
+            # and are invisible to the breaker; see STRIPE_MAX_RETRIES
+            max_network_retries=settings.STRIPE_MAX_RETRIES,
+        )
+        self.intents = getattr(client, "v1", client).payment_intents
+
+    @staticmethod
+    def _intent(obj) -> Intent:
+        return Intent(obj.id, obj.client_secret, obj.amount, obj.status)
+
+    def _call(self, func, *args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except UNAVAILABLE_ERRORS as exc:
+            raise GatewayUnavailable(str(exc)) from exc
+        except stripe.InvalidRequestError as exc:
+            raise IntentLocked(str(exc)) from exc
+        except stripe.StripeError as exc:
+            raise PaymentError(str(exc)) from exc
+
+    def _create_intent(self, amount, currency, metadata) -> Intent:
+        return self._intent(
+            self._call(
+                self.intents.create,
+                params={
+                    "amount": amount,
+                    "currency": currency,
+                    "metadata": metadata,
+                    "automatic_payment_methods": {"enabled": True},
+                },
+            )
+        )
+
+    def _modify_intent(self, intent_id, amount, metadata) -> Intent:
+        return self._intent(
+            self._call(
+                self.intents.update,
+                intent_id,
+                params={"amount": amount, "metadata": metadata},
+            )
+        )
+
+
+# ----------------------------
+# In-process fake
+# ----------------------------
+
+
+class FakeGateway(PaymentGateway):
+    """
+    Keeps intents in memory and counts calls. `latency` (default
+    PAYMENT_FAKE_LATENCY seconds) is added to every call; set `down` to
+    simulate an outage.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.reset()
+
+    def reset(self):
+        self.intents = {}
+        self.calls = Counter()
+        self.latency = settings.PAYMENT_FAKE_LATENCY
+        self.down = False
+        self.breaker.success()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _call(self, method):
+        self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.down:
+            raise GatewayUnavailable("Fake gateway is down")
+
+    def _create_intent(self, amount, currency, metadata) -> Intent:
+        self._call("create")
+        with self._lock:
+            pid = f"pi_fake_{next(self._ids)}"
+        intent = Intent(pid, f"{pid}_secret_fake", amount, "requires_payment")
+        self.intents[pid] = intent
+        return intent
+
+    def _modify_intent(self, intent_id, amount, metadata) -> Intent:
+        self._call("modify")
+        intent = self.intents.get(intent_id)
+        if intent is None or intent.status in ("succeeded", "canceled"):
+            raise IntentLocked(f"PaymentIntent {intent_id} can't be updated")
+        intent = self.intents[intent_id] = replace(intent, amount=amount)
+        return intent
+
+    def set_status(self, intent_id, status):
+        self.intents[intent_id] = replace(
+            self.intents[intent_id], status=status
+        )
+
+
+_gateways = {}
+
+
+def get_gateway() -> PaymentGateway:
+    """This process's gateway for PAYMENT_GATEWAY (built once, reused)."""
+    path = settings.PAYMENT_GATEWAY
+    if path not in _gateways:
+        _gateways[path] = import_string(path)()
+    return _gateways[path]
@@ -0,0 +1,86 @@
+"""
+One PaymentIntent per checkout, reused across renders.
+
+The checkout page needs a PaymentIntent client secret, but re-renders
+(form errors, refreshes) shouldn't each create a new intent. The intent
+id, its client secret and a hash of what it was created for (amount,
+bag, discount, user) are kept in the session under SESSION_KEY:
+
+  - same hash:      reuse it, no Stripe call
+  - hash changed:   PaymentIntent.modify() with the new amount/metadata
+  - none, or Stripe refuses the modify (intent already confirmed or
+    cancelled): create a new one
+
+forget_intent() drops it once the order has been placed. Calls go
+through the configured PaymentGateway (checkout.gateways).
+"""
+import hashlib
+import json
+
+from django.conf import settings
+
+from .gateways import IntentLocked, get_gateway
+
+SESSION_KEY = "checkout_intent"
+
+
+def intent_params(priced, amount, bag, username) -> dict:
+    return {
+        "amount": amount,
+        "currency": settings.STRIPE_CURRENCY,
+        "metadata": {
+            "bag": json.dumps(bag or {}, sort_keys=True),
+            "discount_code": priced.discount_code,
+            "discount_amount": str(priced.discount_amount),
+            "username": username,
+        },
+    }
+
+
+def params_hash(params) -> str:
+    raw = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def checkout_intent(request, priced, grand_total) -> str:
+    """
+    Client secret of the PaymentIntent for this bag, reusing or updating
+    the one stored in the session where possible.
+    Raises gateways.PaymentError if the gateway can't provide one.
+    """
+    gateway = get_gateway()
+    params = intent_params(
+        priced,
+        int(grand_total * 100),
+        request.session.get("bag", {}),
+        request.user.username,
+    )
+    digest = params_hash(params)
+    saved = request.session.get(SESSION_KEY) or {}
+
+    if saved.get("hash") == digest:
+        return saved["client_secret"]
+
+    intent = None
+    if saved.get("id"):
+        try:
+            intent = gateway.modify_intent(
+                saved["id"], params["amount"], params["metadata"]
+            )
+        except IntentLocked:
+            intent = None  # confirmed, cancelled or gone: start again
+    if intent is None:
+        intent = gateway.create_intent(
+            params["amount"], params["currency"], params["metadata"]
+        )
+
+    request.session[SESSION_KEY] = {
+        "id": intent.id,
+        "client_secret": intent.client_secret,
+        "hash": digest,
+    }
+    return intent.client_secret
+
+
+def forget_intent(session):
+    session.pop(SESSION_KEY, None)
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from checkout.models import StripeEvent
+from checkout.webhooks import apply_event
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply stored Stripe webhook events again, in order, without "
+        "Stripe (load testing, debugging a handler). Changes are rolled "
+        "back unless --commit is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--type", help="Only events of this type.")
+        parser.add_argument("--limit", type=int, help="At most N events.")
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=1,
+            help="Replay the selection this many times.",
+        )
+        parser.add_argument(
+            "--commit",
+            action="store_true",
+            help="Keep the changes the handlers make.",
+        )
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1.")
+
+        events = StripeEvent.objects.order_by("stripe_created", "id")
+        if options["type"]:
+            events = events.filter(type=options["type"])
+        if options["limit"]:
+            events = events[: options["limit"]]
+        payloads = list(events.values_list("payload", flat=True))
+
+        started = time.monotonic()
+        with transaction.atomic():
+            for _ in range(options["repeat"]):
+                for payload in payloads:
+                    apply_event(payload)
+            if not options["commit"]:
+                transaction.set_rollback(True)
+        elapsed = max(time.monotonic() - started, 1e-6)
+
+        count = len(payloads) * options["repeat"]
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Replayed {count} events in {elapsed:.2f}s, "
+                f"{count / elapsed:,.0f} events/s"
+                + ("." if options["commit"] else " (rolled back).")
+            )
+        )
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:15
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def dedupe_stripe_pids(apps, schema_editor):
+    """
+    Blank pids that aren't PaymentIntent ids (e.g. "test" from the
+    placeholder secret); repeats keep the pid on their oldest order only.
+    """
+    Order = apps.get_model("checkout", "Order")
+    Order.objects.exclude(stripe_pid="").exclude(
+        stripe_pid__startswith="pi_"
+    ).update(stripe_pid="")
+    repeated = (
+        Order.objects.exclude(stripe_pid="")
+        .values("stripe_pid")
+        .annotate(n=Count("id"))
+        .filter(n__gt=1)
+        .values_list("stripe_pid", flat=True)
+    )
+    for pid in list(repeated):
+        oldest = Order.objects.filter(stripe_pid=pid).order_by("id")[0]
+        Order.objects.filter(stripe_pid=pid).exclude(pk=oldest.pk).update(
+            stripe_pid=""
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0006_order_county'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_stripe_pids, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('stripe_pid', ''), _negated=True), fields=('stripe_pid',), name='unique_order_stripe_pid'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0008_order_history_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='stripe_pid',
+            field=models.CharField(blank=True, db_index=True, max_length=254),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', 'discount_code', 'paid'], name='order_user_discount_idx'),
+        ),
+    ]
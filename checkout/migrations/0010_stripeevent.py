@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0009_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True)),
+                ('type', models.CharField(max_length=100)),
+                ('payload', models.JSONField()),
+                ('stripe_created', models.DateTimeField()),
+                ('received_on', models.DateTimeField(auto_now_add=True)),
+                ('processed_on', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('processed_on__isnull', True)), fields=['stripe_created', 'id'], name='stripeevent_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0010_stripeevent'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='stripeevent',
+            name='stripeevent_pending_idx',
+        ),
+        migrations.AddField(
+            model_name='stripeevent',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='stripeevent',
+            name='failed_on',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='stripeevent',
+            index=models.Index(condition=models.Q(('failed_on__isnull', True), ('processed_on__isnull', True)), fields=['stripe_created', 'id'], name='stripeevent_pending_idx'),
+        ),
+    ]
@@ -12,6 +12,16 @@ except ImportError:
     ProductOption = None
 
 
+class OrderQuerySet(models.QuerySet):
+    def for_payment_intent(self, pid):
+        """
+        Orders for PaymentIntent `pid`, looked up through the unique
+        partial index. Repeating its condition (stripe_pid != "") lets
+        SQLite use the index too; PostgreSQL would infer it.
+        """
+        return self.filter(stripe_pid=pid).exclude(stripe_pid="")
+
+
 class Order(models.Model):
     """
     Order model for Cake It Easy.
@@ -54,6 +64,33 @@ class Order(models.Model):
     paid = models.BooleanField(default=False)
     created_on = models.DateTimeField(auto_now_add=True)
 
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of order history (-id), per user and
+            # for the staff paid / date filters
+            models.Index(fields=["user", "-id"], name="order_user_id_idx"),
+            models.Index(fields=["paid", "-id"], name="order_paid_id_idx"),
+            models.Index(
+                fields=["created_on", "id"], name="order_created_id_idx"
+            ),
+            # Single-use discount check (e.g. WELCOME10 already redeemed)
+            models.Index(
+                fields=["user", "discount_code", "paid"],
+                name="order_user_discount_idx",
+            ),
+        ]
+        constraints = [
+            # One order per PaymentIntent; makes order placement
+            # idempotent (see checkout.services.place_order)
+            models.UniqueConstraint(
+                fields=["stripe_pid"],
+                condition=~models.Q(stripe_pid=""),
+                name="unique_order_stripe_pid",
+            ),
+        ]
+
     @property
     def grand_total(self):
         """
@@ -66,18 +103,46 @@ class Order(models.Model):
 
     def update_total(self):
         """
-        Recalculate the order_total from related line items.
+        Recalculate the order_total from related line items, plus
+        delivery by the same rule as the bag (bag.pricing.delivery_for).
 
         Discount logic is intentionally separate and stored in
         discount_amount to keep totals explicit and auditable.
         """
-        self.order_total = (
-            self.lineitems.aggregate(
-                total=models.Sum("lineitem_total")
-            )["total"] or Decimal("0.00")
+        # bag.pricing -> bag.discounts imports this module
+        from bag.pricing import delivery_for
+
+        sums = self.lineitems.aggregate(
+            subtotal=models.Sum("lineitem_total"),
+            count=models.Sum("quantity"),
         )
+        subtotal = sums["subtotal"] or Decimal("0.00")
+        delivery, _ = delivery_for(subtotal, sums["count"] or 0)
+        self.order_total = subtotal + delivery
         self.save(update_fields=["order_total"])
 
+    def add_lineitems(self, lines):
+        """
+        Insert line items for this order with a single bulk INSERT.
+
+        `lines` are priced bag lines (product, option, quantity,
+        unit_price). lineitem_total is computed in Python and no
+        post_save signals fire, so order_total is left untouched; the
+        caller sets it once (checkout does so before saving the order).
+        """
+        lineitems = []
+        for line in lines:
+            lineitem = OrderLineItem(
+                order=self,
+                product=line.product,
+                option=line.option,
+                quantity=line.quantity,
+                lineitem_price=line.unit_price,
+            )
+            lineitem.calculate_total()
+            lineitems.append(lineitem)
+        return OrderLineItem.objects.bulk_create(lineitems)
+
     def __str__(self):
         return f"Order {self.id}"
 
@@ -122,7 +187,7 @@ class OrderLineItem(models.Model):
         editable=False,
     )
 
-    def save(self, *args, **kwargs):
+    def calculate_total(self):
         """
         Ensure lineitem_price is set from:
         - ProductOption.price if present
@@ -143,6 +208,9 @@ class OrderLineItem(models.Model):
             self.lineitem_price = unit
 
         self.lineitem_total = unit * self.quantity
+
+    def save(self, *args, **kwargs):
+        self.calculate_total()
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -151,3 +219,41 @@ class OrderLineItem(models.Model):
             f"{self.quantity} x {self.product.name}"
             f"{label} (Order {self.order_id})"
         )
+
+
+class StripeEvent(models.Model):
+    """
+    A verified Stripe webhook delivery, stored before it is acted on.
+
+    The webhook view only inserts the row (event_id is unique, so Stripe's
+    retries of the same event are a single conflicting INSERT). A queued
+    job then applies pending events oldest first; see checkout.webhooks.
+    Rows are kept after processing, so replay_stripe_events can run them
+    again offline. An event that fails STRIPE_EVENT_MAX_ATTEMPTS times is
+    parked (failed_on) so it stops holding back newer ones.
+    """
+
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    # Stripe's own timestamp; processing order is (stripe_created, id)
+    stripe_created = models.DateTimeField()
+    received_on = models.DateTimeField(auto_now_add=True)
+    processed_on = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    failed_on = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["stripe_created", "id"],
+                condition=models.Q(
+                    processed_on__isnull=True, failed_on__isnull=True
+                ),
+                name="stripeevent_pending_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.type} {self.event_id}"
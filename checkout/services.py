@@ -0,0 +1,131 @@
+"""
+Order placement.
+
+place_order() writes the Order, its line items and the optional profile
+defaults in one transaction, keyed on the Stripe PaymentIntent id so a
+retried or double-submitted checkout POST returns the order that already
+exists instead of inserting a second one.
+"""
+import json
+import re
+
+from django.db import IntegrityError, transaction
+
+from bag.discounts import record_redemption
+from jobs.queue import enqueue
+from profiles.models import UserProfile
+
+from .models import Order
+
+
+# "pi_<id>_secret_<token>"; anything else (e.g. the "test_secret_disabled"
+# placeholder rendered when Stripe is off) is no PaymentIntent at all
+CLIENT_SECRET_RE = re.compile(r"^(pi_\w+?)_secret_\w+$")
+
+
+def stripe_pid_from_client_secret(client_secret: str) -> str:
+    """PaymentIntent id ("pi_...") from its client secret, or ""."""
+    match = CLIENT_SECRET_RE.match(client_secret or "")
+    return match.group(1) if match else ""
+
+
+def existing_order(user, client_secret: str):
+    """The order already placed for this PaymentIntent, if any."""
+    pid = stripe_pid_from_client_secret(client_secret)
+    if not pid:
+        return None
+    return Order.objects.for_payment_intent(pid).filter(user=user).first()
+
+
+DELIVERY_FIELDS = (
+    "full_name",
+    "phone_number",
+    "country",
+    "postcode",
+    "town_or_city",
+    "street_address1",
+    "street_address2",
+)
+
+
+def _delivery_fields(cd) -> dict:
+    """The JSON-safe subset of the order form that profiles keep."""
+    return {
+        field: str(cd[field]) if cd.get(field) is not None else None
+        for field in DELIVERY_FIELDS
+    }
+
+
+def save_delivery_defaults(user, cd):
+    """Copy the checkout name/address onto the User and UserProfile."""
+    profile, _ = UserProfile.objects.get_or_create(user=user)
+
+    # Save full name to User model (no migration required)
+    full_name = (cd.get("full_name") or "").strip()
+    if full_name:
+        parts = full_name.split()
+        user.first_name = parts[0]
+        user.last_name = " ".join(parts[1:]) if len(parts) > 1 else ""
+        user.save(update_fields=["first_name", "last_name"])
+
+    # Save delivery defaults to profile
+    profile.default_phone_number = cd.get("phone_number")
+    profile.default_country = cd.get("country")
+    profile.default_postcode = cd.get("postcode")
+    profile.default_town_or_city = cd.get("town_or_city")
+    profile.default_street_address1 = cd.get("street_address1")
+    profile.default_street_address2 = cd.get("street_address2")
+    profile.save()
+
+
+def place_order(
+    user, order_form, priced, bag, client_secret="", save_info=False
+):
+    """
+    Create the order for a valid OrderForm and a PricedBag. Saving the
+    delivery details to the profile (save_info) is queued as a job.
+
+    Returns (order, created). When an order for the same PaymentIntent
+    already exists for this user it is returned with created=False and
+    nothing is written.
+    """
+    existing = existing_order(user, client_secret)
+    if existing:
+        return existing, False
+
+    pid = stripe_pid_from_client_secret(client_secret)
+
+    try:
+        with transaction.atomic():
+            order = order_form.save(commit=False)
+            order.user = user
+            order.stripe_pid = pid
+            order.original_bag = json.dumps(bag or {})
+            order.order_total = priced.pre_discount_total
+            order.discount_amount = priced.discount_amount
+            order.discount_code = priced.discount_code
+            order.save()
+
+            # One bulk INSERT; order_total above is already final
+            order.add_lineitems(priced.lines)
+
+            if priced.discount_amount > 0:
+                # False if the code ran out meanwhile; the payment at this
+                # price is already confirmed, so the order keeps it
+                record_redemption(priced.discount_code)
+
+            if save_info:
+                # Runs after the response; the job commits with the order
+                enqueue(
+                    "checkout.tasks.save_delivery_defaults_for",
+                    user_id=user.pk,
+                    data=_delivery_fields(order_form.cleaned_data),
+                )
+    except IntegrityError:
+        # A concurrent request won the race for this PaymentIntent
+        existing = existing_order(user, client_secret)
+        if existing is None:
+            raise
+        return existing, False
+
+    return order, True
@@ -1,16 +1,39 @@
+import threading
+from contextlib import contextmanager
+
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
 from .models import OrderLineItem
 
+_state = threading.local()
+
+
+@contextmanager
+def suppress_total_updates():
+    """
+    Skip the per-line Order.update_total() while writing many line items
+    one by one. The caller is responsible for setting order_total.
+    """
+    previous = getattr(_state, "suppressed", False)
+    _state.suppressed = True
+    try:
+        yield
+    finally:
+        _state.suppressed = previous
+
+
+def _updates_suppressed():
+    return getattr(_state, "suppressed", False)
+
 
 @receiver(post_save, sender=OrderLineItem)
 def update_on_save(sender, instance, **kwargs):
-    if instance.order:
+    if not _updates_suppressed() and instance.order:
         instance.order.update_total()
 
 
 @receiver(post_delete, sender=OrderLineItem)
 def update_on_delete(sender, instance, **kwargs):
-    if instance.order:
+    if not _updates_suppressed() and instance.order:
         instance.order.update_total()
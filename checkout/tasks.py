@@ -0,0 +1,20 @@
+from django.contrib.auth.models import User
+
+from jobs.queue import task
+
+from .services import save_delivery_defaults
+from .webhooks import process_pending_events
+
+
+@task
+def save_delivery_defaults_for(user_id, data):
+    """Background half of checkout's "save this info" box."""
+    user = User.objects.filter(pk=user_id).first()
+    if user is not None:
+        save_delivery_defaults(user, data)
+
+
+@task
+def process_stripe_events():
+    """Apply stored webhook events (see checkout.webhooks)."""
+    process_pending_events()
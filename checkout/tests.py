@@ -1 +1,521 @@
-# Create your tests here.
+import hashlib
+import hmac
+import json
+import time
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+import requests
+import stripe
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from bag.pricing import BagPricer
+from jobs.models import Job
+from jobs.queue import work
+from products.models import Product
+from profiles.models import UserProfile
+
+from .forms import OrderForm
+from . import webhooks
+from .gateways import (
+    CircuitBreaker,
+    FakeGateway,
+    GatewayUnavailable,
+    IntentLocked,
+    StripeGateway,
+    get_gateway,
+)
+from .intents import SESSION_KEY
+from .models import Order, OrderLineItem, StripeEvent
+from .services import place_order
+from .signals import suppress_total_updates
+
+
+class OrderLineItemWriteTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("buyer", "b@example.com", "pw")
+        self.products = [
+            Product.objects.create(
+                name=f"Cake {i}", description="", price=Decimal("4.00")
+            )
+            for i in range(10)
+        ]
+        self.order = Order.objects.create(
+            user=self.user,
+            full_name="Buyer",
+            email="b@example.com",
+            order_total=Decimal("45.00"),
+        )
+
+    def test_add_lineitems_is_one_insert(self):
+        priced = BagPricer({str(p.id): 1 for p in self.products}).price()
+        with self.assertNumQueries(1):
+            self.order.add_lineitems(priced.lines)
+
+        self.assertEqual(self.order.lineitems.count(), 10)
+        self.assertEqual(
+            set(self.order.lineitems.values_list("lineitem_total", flat=True)),
+            {Decimal("4.00")},
+        )
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.order_total, Decimal("45.00"))
+
+    def test_single_saves_still_update_total(self):
+        OrderLineItem.objects.create(
+            order=self.order, product=self.products[0], quantity=3
+        )
+        self.order.refresh_from_db()
+        # 12.00 of cake plus standard delivery, as the bag priced it
+        self.assertEqual(self.order.order_total, Decimal("17.00"))
+
+        OrderLineItem.objects.create(
+            order=self.order, product=self.products[1], quantity=10
+        )
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.order_total, Decimal("52.00"))
+
+    def test_suppress_total_updates(self):
+        with suppress_total_updates():
+            OrderLineItem.objects.create(
+                order=self.order, product=self.products[0], quantity=3
+            )
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.order_total, Decimal("45.00"))
+
+
+class PlaceOrderTests(TestCase):
+    FORM = {
+        "full_name": "Ann Buyer",
+        "email": "ann@example.com",
+        "street_address1": "1 Main St",
+        "town_or_city": "Cork",
+        "country": "IE",
+    }
+    SECRET = "pi_123_secret_abc"
+
+    def setUp(self):
+        self.user = User.objects.create_user("ann", "ann@example.com", "pw")
+        self.bag = {
+            str(
+                Product.objects.create(
+                    name=f"Cake {i}", description="", price=Decimal("6.00")
+                ).id
+            ): 1
+            for i in range(20)
+        }
+        self.priced = BagPricer(self.bag).price()
+
+    def _place(self, **kwargs):
+        form = OrderForm(self.FORM)
+        self.assertTrue(form.is_valid())
+        return place_order(
+            self.user, form, self.priced, self.bag, self.SECRET, **kwargs
+        )
+
+    def test_retry_returns_existing_order(self):
+        order, created = self._place()
+        again, created_again = self._place()
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(again.pk, order.pk)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(order.stripe_pid, "pi_123")
+        self.assertEqual(order.order_total, Decimal("120.00"))
+
+    def test_statement_count_per_order(self):
+        # lookup, SAVEPOINT, order INSERT, lineitems INSERT, RELEASE
+        with CaptureQueriesContext(connection) as ctx:
+            self._place()
+        self.assertEqual(len(ctx.captured_queries), 5)
+        self.assertEqual(OrderLineItem.objects.count(), 20)
+
+    @override_settings(JOBS_EAGER=False)
+    def test_save_info_is_queued(self):
+        self._place(save_info=True)
+        job = Job.objects.get()
+        self.assertEqual(job.name, "checkout.tasks.save_delivery_defaults_for")
+        self.assertFalse(
+            UserProfile.objects.filter(default_town_or_city="Cork").exists()
+        )
+
+        work(drain=True)
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(profile.default_town_or_city, "Cork")
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.last_name, "Buyer")
+
+    def test_double_submit_redirects_to_existing_order(self):
+        self.client.login(username="ann", password="pw")
+        session = self.client.session
+        session["bag"] = self.bag
+        session.save()
+        data = dict(self.FORM, client_secret=self.SECRET)
+
+        first = self.client.post(reverse("checkout"), data)
+        second = self.client.post(reverse("checkout"), data)
+
+        order = Order.objects.get()
+        target = reverse("checkout_success", args=[order.id])
+        self.assertRedirects(first, target, fetch_redirect_response=False)
+        self.assertRedirects(second, target, fetch_redirect_response=False)
+
+    def test_orders_without_stripe_are_not_deduplicated(self):
+        # "test_secret_disabled" is rendered when Stripe is off
+        bob = User.objects.create_user("bob", "bob@example.com", "pw")
+        data = dict(self.FORM, client_secret="test_secret_disabled")
+        for user in (self.user, self.user, bob):
+            self.client.force_login(user)
+            session = self.client.session
+            session["bag"] = self.bag
+            session.save()
+            response = self.client.post(reverse("checkout"), data)
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(Order.objects.count(), 3)
+        self.assertEqual(
+            set(Order.objects.values_list("stripe_pid", flat=True)), {""}
+        )
+
+
+@override_settings(ORDERS_PAGE_SIZE=3)
+class MyOrdersPaginationTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(
+            "staff", "s@example.com", "pw", is_staff=True
+        )
+        self.orders = [
+            Order.objects.create(
+                full_name=f"Buyer {i}", email="b@example.com", paid=i % 2
+            )
+            for i in range(7)
+        ]
+        self.client.login(username="staff", password="pw")
+
+    def _ids(self, response):
+        return [o.id for o in response.context["orders"]]
+
+    def test_keyset_pages(self):
+        ids = [o.id for o in reversed(self.orders)]
+        first = self.client.get(reverse("my_orders"))
+        self.assertEqual(self._ids(first), ids[:3])
+        self.assertEqual(first.context["newer_query"], "")
+
+        second = self.client.get(
+            reverse("my_orders") + "?" + first.context["older_query"]
+        )
+        self.assertEqual(self._ids(second), ids[3:6])
+
+        back = self.client.get(
+            reverse("my_orders") + "?" + second.context["newer_query"]
+        )
+        self.assertEqual(self._ids(back), ids[:3])
+
+    def test_query_count_is_flat(self):
+        url = reverse("my_orders")
+        self.client.get(url)  # warm session/user
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+        for i in range(30):
+            Order.objects.create(full_name=f"More {i}", email="m@e.com")
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(url)
+        self.assertEqual(
+            len(small.captured_queries), len(large.captured_queries)
+        )
+
+    def test_paid_filter(self):
+        response = self.client.get(reverse("my_orders"), {"paid": "0"})
+        self.assertFalse(any(o.paid for o in response.context["orders"]))
+        self.assertIn("paid=0", response.context["older_query"])
+
+    def test_impossible_dates_are_ignored(self):
+        response = self.client.get(
+            reverse("my_orders"), {"from": "2024-02-30", "to": "2024-13-45"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["orders"]), 3)
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET="whsec_test", JOBS_EAGER=False)
+class StripeWebhookTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("ann", "ann@example.com", "pw")
+        self.order = Order.objects.create(
+            user=self.user,
+            full_name="Ann",
+            email="ann@example.com",
+            stripe_pid="pi_1",
+        )
+
+    def _event(self, event_id="evt_1", type="payment_intent.succeeded",
+               created=1700000000, pid="pi_1"):
+        return {
+            "id": event_id,
+            "object": "event",
+            "type": type,
+            "created": created,
+            "data": {"object": {"id": pid, "object": "payment_intent"}},
+        }
+
+    def _post(self, event, secret="whsec_test"):
+        body = json.dumps(event)
+        stamp = int(time.time())
+        signature = hmac.new(
+            secret.encode(), f"{stamp}.{body}".encode(), hashlib.sha256
+        ).hexdigest()
+        return self.client.post(
+            reverse("stripe_webhook"),
+            body,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=f"t={stamp},v1={signature}",
+        )
+
+    def test_ingest_then_process(self):
+        self.assertEqual(self._post(self._event()).status_code, 200)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+        self.assertEqual(Job.objects.count(), 1)
+        self.order.refresh_from_db()
+        self.assertFalse(self.order.paid)  # nothing done inline
+
+        work(drain=True)
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.paid)
+        self.assertIsNotNone(StripeEvent.objects.get().processed_on)
+
+    def test_duplicate_delivery_is_a_no_op(self):
+        self._post(self._event())
+        work(drain=True)
+        self.assertEqual(self._post(self._event()).status_code, 200)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_bad_signature_is_rejected(self):
+        response = self._post(self._event(), secret="whsec_wrong")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_events_apply_in_stripe_order(self):
+        seen = []
+        self._post(self._event("evt_late", type="test.seen", created=20))
+        self._post(self._event("evt_early", type="test.seen", created=10))
+        with mock.patch.dict(
+            webhooks.HANDLERS, {"test.seen": lambda obj: seen.append(obj)}
+        ):
+            self.assertEqual(webhooks.process_pending_events(), 2)
+        self.assertEqual(len(seen), 2)
+        self.assertEqual(
+            list(
+                StripeEvent.objects.order_by("processed_on", "id")
+                .values_list("event_id", flat=True)
+            ),
+            ["evt_early", "evt_late"],
+        )
+
+    @override_settings(STRIPE_EVENT_MAX_ATTEMPTS=2)
+    def test_failing_event_is_parked_after_max_attempts(self):
+        self._post(self._event("evt_bad", type="test.boom", created=10))
+        self._post(self._event("evt_ok", created=20))
+        with mock.patch.dict(
+            webhooks.HANDLERS, {"test.boom": mock.Mock(side_effect=KeyError)}
+        ):
+            # First failure: retried later, newer events wait behind it
+            with self.assertRaises(KeyError):
+                webhooks.process_pending_events()
+            self.order.refresh_from_db()
+            self.assertFalse(self.order.paid)
+
+            # Second failure parks it and the newer event goes through
+            self.assertEqual(webhooks.process_pending_events(), 1)
+        bad = StripeEvent.objects.get(event_id="evt_bad")
+        self.assertIsNone(bad.processed_on)
+        self.assertIsNotNone(bad.failed_on)
+        self.assertEqual(bad.attempts, 2)
+        self.assertIn("KeyError", bad.last_error)
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.paid)
+
+    def test_replay_rolls_back_by_default(self):
+        self._post(self._event())
+        out = StringIO()
+        call_command("replay_stripe_events", "--repeat", "3", stdout=out)
+        self.assertIn("Replayed 3 events", out.getvalue())
+        self.order.refresh_from_db()
+        self.assertFalse(self.order.paid)
+
+        call_command("replay_stripe_events", "--commit", stdout=StringIO())
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.paid)
+
+
+FAKE_GATEWAY = "checkout.gateways.FakeGateway"
+
+
+@override_settings(PAYMENT_GATEWAY=FAKE_GATEWAY)
+class PaymentIntentReuseTests(TestCase):
+    def setUp(self):
+        self.gateway = get_gateway()
+        self.gateway.reset()
+        self.user = User.objects.create_user("ann", "ann@example.com", "pw")
+        self.client.login(username="ann", password="pw")
+        self.cake = Product.objects.create(
+            name="Cake", description="", price=Decimal("30.00")
+        )
+        self._set_bag({str(self.cake.id): 1})
+
+    def _set_bag(self, bag):
+        session = self.client.session
+        session["bag"] = bag
+        session.save()
+
+    def _secret(self):
+        return self.client.get(reverse("checkout")).context["client_secret"]
+
+    def test_rerenders_reuse_the_intent(self):
+        first = self._secret()
+        self.assertEqual(self._secret(), first)
+        # A form error re-render doesn't touch Stripe either
+        response = self.client.post(reverse("checkout"), {"full_name": ""})
+        self.assertEqual(response.context["client_secret"], first)
+        self.assertEqual(self.gateway.calls, {"create": 1})
+
+    def test_changed_bag_modifies_the_intent(self):
+        first = self._secret()
+        self._set_bag({str(self.cake.id): 2})
+        self.assertEqual(self._secret(), first)
+        self.assertEqual(self.gateway.calls, {"create": 1, "modify": 1})
+        intent = self.gateway.intents[first.split("_secret")[0]]
+        self.assertEqual(intent.amount, 6000)  # 2 x 30, free delivery
+
+    def test_finished_intent_is_replaced(self):
+        first = self._secret()
+        self.gateway.set_status(first.split("_secret")[0], "succeeded")
+        self._set_bag({str(self.cake.id): 3})
+        self.assertNotEqual(self._secret(), first)
+        self.assertEqual(self.gateway.calls["create"], 2)
+
+    def test_outage_shows_a_warning(self):
+        self.gateway.down = True
+        response = self.client.get(reverse("checkout"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.context["client_secret"], "test_secret_disabled"
+        )
+        self.assertContains(response, "Stripe is not available")
+
+    def test_placing_the_order_forgets_the_intent(self):
+        secret = self._secret()
+        self.client.post(
+            reverse("checkout"),
+            dict(PlaceOrderTests.FORM, client_secret=secret),
+        )
+        self.assertEqual(Order.objects.get().stripe_pid, "pi_fake_1")
+        self.assertNotIn(SESSION_KEY, self.client.session)
+
+
+@override_settings(PAYMENT_BREAKER_THRESHOLD=2, PAYMENT_BREAKER_RESET=30)
+class PaymentGatewayTests(TestCase):
+    def test_breaker_opens_then_probes(self):
+        now = [0.0]
+        breaker = CircuitBreaker(2, 30, clock=lambda: now[0])
+        breaker.failure()
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertFalse(breaker.allow())
+
+        now[0] = 31
+        self.assertTrue(breaker.allow())  # one trial call
+        self.assertFalse(breaker.allow())
+        breaker.failure()  # trial failed: open again
+        self.assertFalse(breaker.allow())
+
+        now[0] = 62
+        self.assertTrue(breaker.allow())
+        breaker.success()
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.is_open)
+
+    def test_outage_fails_fast_once_open(self):
+        gateway = FakeGateway()
+        gateway.down = True
+        for _ in range(2):
+            with self.assertRaises(GatewayUnavailable):
+                gateway.create_intent(100, "eur", {})
+        with self.assertRaises(GatewayUnavailable):
+            gateway.create_intent(100, "eur", {})
+        self.assertEqual(gateway.calls["create"], 2)  # third never sent
+
+    def test_refusals_dont_trip_the_breaker(self):
+        gateway = FakeGateway()
+        for _ in range(3):
+            with self.assertRaises(IntentLocked):
+                gateway.modify_intent("pi_missing", 100, {})
+        self.assertFalse(gateway.breaker.is_open)
+
+    def test_unexpected_errors_end_the_trial(self):
+        now = [0.0]
+        gateway = FakeGateway()
+        gateway.breaker = CircuitBreaker(2, 30, clock=lambda: now[0])
+        gateway.breaker.failure()
+        gateway.breaker.failure()
+
+        now[0] = 31
+        with mock.patch.object(
+            gateway, "_create_intent", side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                gateway.create_intent(100, "eur", {})
+        self.assertFalse(gateway.breaker.allow())  # open again
+        now[0] = 62
+        self.assertTrue(gateway.breaker.allow())  # not stuck half-open
+
+    @override_settings(
+        STRIPE_SECRET_KEY="sk_test_x",
+        STRIPE_CONNECT_TIMEOUT=2,
+        STRIPE_READ_TIMEOUT=7,
+        STRIPE_POOL_SIZE=4,
+    )
+    def test_stripe_client_setup_and_error_mapping(self):
+        gateway = StripeGateway()
+        self.assertEqual(gateway.http_client._timeout, (2, 7))
+        adapter = gateway.session.get_adapter("https://api.stripe.com")
+        self.assertEqual(adapter._pool_maxsize, 4)
+
+        with mock.patch.object(
+            gateway.intents,
+            "create",
+            side_effect=stripe.APIConnectionError("timed out"),
+        ):
+            for _ in range(2):
+                with self.assertRaises(GatewayUnavailable):
+                    gateway.create_intent(100, "eur", {})
+        self.assertTrue(gateway.breaker.is_open)
+
+        with mock.patch.object(
+            gateway.intents,
+            "update",
+            side_effect=stripe.InvalidRequestError("done", "intent"),
+        ):
+            gateway.breaker.success()
+            with self.assertRaises(IntentLocked):
+                gateway.modify_intent("pi_1", 100, {})
+
+    @override_settings(STRIPE_SECRET_KEY="sk_test_x", STRIPE_MAX_RETRIES=0)
+    def test_each_timeout_is_one_attempt_and_one_failure(self):
+        gateway = StripeGateway()
+        with mock.patch.object(
+            gateway.session,
+            "request",
+            side_effect=requests.exceptions.ReadTimeout("slow"),
+        ) as request:
+            with self.assertRaises(GatewayUnavailable):
+                gateway.create_intent(100, "eur", {})
+            self.assertEqual(request.call_count, 1)  # not retried
+            self.assertEqual(gateway.breaker.failures, 1)
+            with self.assertRaises(GatewayUnavailable):
+                gateway.create_intent(100, "eur", {})
+        self.assertTrue(gateway.breaker.is_open)
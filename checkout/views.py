@@ -1,103 +1,49 @@
-import json
+from datetime import datetime, time, timedelta
 from decimal import Decimal
 
-import stripe
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 
-from bag.context_processors import bag_contents
-from products.models import Product
-
-try:
-    from products.models import ProductOption
-except Exception:
-    ProductOption = None
-
-from profiles.models import UserProfile
+from bag.context_processors import BAG_SUMMARY_KEY, get_priced_bag
+from bag.discounts import removed_notice_message
 from .forms import OrderForm
-from .models import Order, OrderLineItem
+from .gateways import PaymentError, get_gateway
+from .intents import checkout_intent, forget_intent
+from .models import Order
+from .services import existing_order, place_order
 
 STRIPE_PUBLIC_KEY = getattr(settings, "STRIPE_PUBLIC_KEY", "")
-STRIPE_SECRET_KEY = getattr(settings, "STRIPE_SECRET_KEY", "")
-STRIPE_CURRENCY = getattr(settings, "STRIPE_CURRENCY", "eur")
-
-if STRIPE_PUBLIC_KEY and STRIPE_SECRET_KEY:
-    stripe.api_key = STRIPE_SECRET_KEY
 
 
 def _consume_discount_removed_notice(request):
     notice = request.session.pop("discount_removed_notice", None)
-    if notice == "WELCOME10_USED":
+    if notice:
         request.session.modified = True
         messages.warning(
-            request,
-            (
-                "WELCOME10 has already been used on your account "
-                "and has been removed from this checkout."
-            ),
+            request, removed_notice_message(notice, "this checkout")
         )
 
 
-def _pack_price(product, option):
-    if option and hasattr(option, "pack_price"):
-        return Decimal(option.pack_price())
-    return Decimal(product.price or 0)
-
-
-def _session_items(request):
-    """
-    Build items from session['bag'].
-    When an option is present, unit_price is the **pack price** (box total).
-    """
-    bag = request.session.get("bag", {}) or {}
-    items = []
-    subtotal = Decimal("0.00")
-
-    for key, qty in bag.items():
-        try:
-            parts = str(key).split("_")
-            pid = int(parts[0])
-            opt_id = int(parts[1]) if len(parts) == 2 else None
-            quantity = int(qty)
-        except (TypeError, ValueError):
-            continue
-
-        product = Product.objects.filter(pk=pid).first()
-        if not product:
-            continue
-
-        option = None
-        if opt_id and ProductOption:
-            option = ProductOption.objects.filter(
-                pk=opt_id,
-                product_id=pid,
-            ).first()
-
-        unit_price = _pack_price(product, option)
-        line_total = unit_price * quantity
-
-        items.append(
-            {
-                "product": product,
-                "option": option,
-                "quantity": quantity,
-                "unit_price": unit_price,
-                "line_total": line_total,
-                "key": key,
-            }
-        )
-
-        subtotal += line_total
-
-    return items, subtotal
-
-
 @login_required
 def checkout(request):
-    items, subtotal = _session_items(request)
+    if request.method == "POST":
+        # Retried / double-submitted POST after the order was placed
+        # (the first request already emptied the bag)
+        order = existing_order(
+            request.user, request.POST.get("client_secret", "")
+        )
+        if order:
+            return redirect("checkout_success", order_id=order.id)
+
+    # Priced once per request by the shared engine (includes dynamic
+    # discount); the template context processor reuses the same object.
+    priced = get_priced_bag(request)
+    items = priced.lines
     if not items:
         messages.info(request, "Your bag is empty.")
         return redirect("product_list")
@@ -106,81 +52,30 @@ def checkout(request):
     # during login/session processing
     _consume_discount_removed_notice(request)
 
-    # Use bag context as the single source of truth (includes dynamic discount)
-    bag_ctx = bag_contents(request)
-
-    subtotal = bag_ctx.get("total", subtotal)  # pre-discount subtotal
-    delivery = bag_ctx.get("delivery", Decimal("0.00"))
-    discount_amount = bag_ctx.get("discount_amount") or Decimal("0.00")
-    discount_code = bag_ctx.get("discount_code") or ""
+    subtotal = priced.subtotal  # pre-discount subtotal
+    delivery = priced.delivery
+    discount_amount = priced.discount_amount
+    discount_code = priced.discount_code
 
-    pre_discount_total = subtotal + delivery
-    grand_total = pre_discount_total - discount_amount
-    if grand_total < 0:
-        grand_total = Decimal("0.00")
+    grand_total = max(priced.grand_total, Decimal("0.00"))
 
     if request.method == "POST":
         order_form = OrderForm(request.POST)
         if order_form.is_valid():
-            client_secret = request.POST.get("client_secret", "")
-            pid = (
-                client_secret.split("_secret")[0]
-                if "_secret" in client_secret
-                else ""
-            )
-
-            order = order_form.save(commit=False)
-            order.user = request.user
-            order.stripe_pid = pid
-            order.original_bag = json.dumps(
-                request.session.get("bag", {})
+            order, _ = place_order(
+                request.user,
+                order_form,
+                priced,
+                request.session.get("bag", {}),
+                client_secret=request.POST.get("client_secret", ""),
+                save_info=request.POST.get("save_info") == "on",
             )
 
-            order.order_total = pre_discount_total
-            order.discount_amount = discount_amount
-            order.discount_code = discount_code
-
-            order.save()
-
-            for item in items:
-                OrderLineItem.objects.create(
-                    order=order,
-                    product=item["product"],
-                    option=item.get("option"),
-                    quantity=item["quantity"],
-                    lineitem_price=item.get("unit_price"),
-                )
-
-            if request.POST.get("save_info") == "on":
-                profile, _ = UserProfile.objects.get_or_create(
-                    user=request.user
-                )
-                cd = order_form.cleaned_data
-
-                # Save full name to User model (no migration required)
-                full_name = (cd.get("full_name") or "").strip()
-                if full_name:
-                    parts = full_name.split()
-                    request.user.first_name = parts[0]
-                    request.user.last_name = (
-                        " ".join(parts[1:]) if len(parts) > 1 else ""
-                    )
-                    request.user.save(
-                        update_fields=["first_name", "last_name"]
-                    )
-
-                # Save delivery defaults to profile
-                profile.default_phone_number = cd.get("phone_number")
-                profile.default_country = cd.get("country")
-                profile.default_postcode = cd.get("postcode")
-                profile.default_town_or_city = cd.get("town_or_city")
-                profile.default_street_address1 = cd.get("street_address1")
-                profile.default_street_address2 = cd.get("street_address2")
-                profile.save()
-
             request.session["bag"] = {}
             request.session.pop("discount", None)
+            request.session.pop(BAG_SUMMARY_KEY, None)
             request.session.pop("discount_removed_notice", None)
+            forget_intent(request.session)
             request.session.modified = True
 
             messages.success(request, "Order placed successfully.")
@@ -231,21 +126,11 @@ def checkout(request):
         order_form = OrderForm(initial=initial)
 
     client_secret = "test_secret_disabled"
-    if STRIPE_PUBLIC_KEY and STRIPE_SECRET_KEY and grand_total > 0:
+    if get_gateway().enabled and grand_total > 0:
         try:
-            intent = stripe.PaymentIntent.create(
-                amount=int(grand_total * 100),
-                currency=STRIPE_CURRENCY,
-                automatic_payment_methods={"enabled": True},
-                metadata={
-                    "bag": json.dumps(request.session.get("bag", {})),
-                    "discount_code": discount_code,
-                    "discount_amount": str(discount_amount),
-                    "username": request.user.username,
-                },
-            )
-            client_secret = intent.client_secret
-        except Exception:
+            # Reused / updated across re-renders (see checkout.intents)
+            client_secret = checkout_intent(request, priced, grand_total)
+        except PaymentError:
             messages.warning(request, "Stripe is not available right now.")
 
     context = {
@@ -287,23 +172,126 @@ def order_detail(request, order_id):
     )
 
 
+def _int_param(request, name):
+    try:
+        value = int(request.GET.get(name, ""))
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+def _date_param(request, name):
+    """?name=YYYY-MM-DD as a date; None if missing or not a real date."""
+    try:
+        return parse_date(request.GET.get(name, "") or "")
+    except ValueError:  # well formed but impossible, e.g. 2024-02-30
+        return None
+
+
+def _filter_orders(queryset, request):
+    """
+    Staff filters (all index-backed):
+      - ?paid=1|0
+      - ?from=YYYY-MM-DD / ?to=YYYY-MM-DD (inclusive, on created_on)
+    Dates become plain datetime bounds so the created_on index is used.
+    """
+    paid = request.GET.get("paid", "")
+    if paid in ("1", "0"):
+        queryset = queryset.filter(paid=paid == "1")
+
+    tz = timezone.get_current_timezone()
+    date_from = _date_param(request, "from")
+    if date_from:
+        queryset = queryset.filter(
+            created_on__gte=datetime.combine(date_from, time.min, tz)
+        )
+    date_to = _date_param(request, "to")
+    if date_to:
+        queryset = queryset.filter(
+            created_on__lt=datetime.combine(
+                date_to + timedelta(days=1), time.min, tz
+            )
+        )
+    return queryset
+
+
+def _keyset_page(queryset, request, page_size):
+    """
+    Keyset (cursor) pagination on -id.
+
+    ?before=<id> shows the next older page, ?after=<id> the next newer
+    one. Only page_size + 1 rows are read, however many orders exist.
+    Returns (orders, older_cursor, newer_cursor); cursors are None at
+    either end.
+    """
+    before = _int_param(request, "before")
+    after = _int_param(request, "after")
+
+    if after and not before:
+        newer_first = queryset.filter(id__gt=after).order_by("id")
+        rows = list(newer_first[: page_size + 1])
+        has_newer = len(rows) > page_size
+        orders = rows[:page_size][::-1]
+        has_older = True
+    else:
+        if before:
+            queryset = queryset.filter(id__lt=before)
+        rows = list(queryset.order_by("-id")[: page_size + 1])
+        has_older = len(rows) > page_size
+        orders = rows[:page_size]
+        has_newer = before is not None
+
+    if not orders:
+        return orders, None, None
+    return (
+        orders,
+        orders[-1].id if has_older else None,
+        orders[0].id if has_newer else None,
+    )
+
+
+def _page_query(request, **cursor):
+    """Current querystring with the cursor params replaced."""
+    params = request.GET.copy()
+    params.pop("before", None)
+    params.pop("after", None)
+    params.update(cursor)
+    return params.urlencode()
+
+
 @login_required
 def my_orders(request):
+    """
+    Order history, newest first, one keyset page at a time.
+    Staff see every order and can filter by paid flag and date range.
+    """
     if request.user.is_staff:
-        orders = (
-            Order.objects.select_related("user")
-            .prefetch_related("lineitems__product")
-            .order_by("-id")
-        )
+        orders = _filter_orders(Order.objects.all(), request)
     else:
-        orders = (
-            Order.objects.filter(user=request.user)
-            .select_related("user")
-            .prefetch_related("lineitems__product")
-            .order_by("-id")
-        )
+        orders = Order.objects.filter(user=request.user)
+
+    # The prefetch only runs for the rows on the visible page
+    orders = orders.select_related("user").prefetch_related(
+        "lineitems__product"
+    )
+    page_size = getattr(settings, "ORDERS_PAGE_SIZE", 25)
+    orders, older, newer = _keyset_page(orders, request, page_size)
+
     return render(
         request,
         "checkout/my_orders.html",
-        {"orders": orders},
+        {
+            "orders": orders,
+            "older_query": (
+                _page_query(request, before=older) if older else ""
+            ),
+            "newer_query": (
+                _page_query(request, after=newer) if newer else ""
+            ),
+            "filters": {
+                "paid": request.GET.get("paid", ""),
+                "from": request.GET.get("from", ""),
+                "to": request.GET.get("to", ""),
+            },
+        },
     )
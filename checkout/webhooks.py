@@ -1,27 +1,43 @@
+"""
+Stripe webhooks: a fast ingest step, then queued processing.
+
+stripe_webhook() only verifies the signature, stores the event as a
+StripeEvent row and answers 200. A redelivered event hits the unique
+event_id and is a single conflicting INSERT, nothing more. Each new
+event queues checkout.tasks.process_stripe_events, which applies the
+pending events oldest first (process_pending_events). apply_event() is
+also what the replay_stripe_events command uses offline.
+"""
 import logging
+import traceback
+from datetime import datetime, timezone as dt_timezone
 
-import stripe
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
 from django.http import HttpResponse, HttpResponseBadRequest
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 
-from .models import Order
+from bag.discounts import forget_code_usage
+from jobs.queue import enqueue
+
+from .gateways import InvalidWebhook, get_gateway
+from .models import Order, StripeEvent
 
 logger = logging.getLogger(__name__)
 
+PROCESS_TASK = "checkout.tasks.process_stripe_events"
+
 
 @csrf_exempt
 def stripe_webhook(request):
     """
-    Stripe webhook handler.
+    Stripe webhook endpoint (ingest only).
 
     - Verifies the event using the STRIPE_WEBHOOK_SECRET.
-    - Handles `payment_intent.succeeded` events.
-    - Marks the matching Order (by stripe_pid) as paid.
-
-    The Order and its line items are created in the checkout view,
-    so the webhook does not create or modify orders beyond the `paid`
-    flag.
+    - Stores it once, keyed on the Stripe event id.
+    - Queues processing and acknowledges straight away.
     """
 
     secret = getattr(settings, "STRIPE_WEBHOOK_SECRET", "")
@@ -38,68 +54,118 @@ def stripe_webhook(request):
     sig_header = request.META.get("HTTP_STRIPE_SIGNATURE", "")
 
     try:
-        event = stripe.Webhook.construct_event(
-            payload,
-            sig_header,
-            secret,
-        )
-    except Exception:
+        data = get_gateway().verify_webhook(payload, sig_header, secret)
+    except InvalidWebhook:
         # Signature invalid or payload malformed
-        logger.exception(
-            "Stripe webhook signature verification failed"
-        )
+        logger.warning("Stripe webhook signature verification failed")
         return HttpResponseBadRequest()
+    event_id = data["id"]
 
-    event_type = event.get("type", "")
-    logger.warning(
-        "Stripe webhook received: %s",
-        event_type,
-    )
+    try:
+        with transaction.atomic():
+            StripeEvent.objects.create(
+                event_id=event_id,
+                type=data.get("type", ""),
+                payload=data,
+                stripe_created=datetime.fromtimestamp(
+                    data.get("created") or 0, tz=dt_timezone.utc
+                ),
+            )
+            # Committed together, so no event is stored without its job
+            enqueue(PROCESS_TASK)
+    except IntegrityError:
+        logger.debug("Duplicate Stripe event %s ignored", event_id)
 
-    if event_type == "payment_intent.succeeded":
-        intent = event["data"]["object"]
-        pid = intent.get("id")
+    return HttpResponse(status=200)
 
-        logger.warning(
-            "payment_intent.succeeded pid=%s",
-            pid,
-        )
 
-        if not pid:
-            logger.warning(
-                "payment_intent.succeeded missing pid"
-            )
-            return HttpResponse(status=200)
-
-        try:
-            order = Order.objects.get(stripe_pid=pid)
-            logger.warning(
-                "Order found for pid=%s (paid=%s)",
-                pid,
-                order.paid,
-            )
+# ----------------------------
+# Processing
+# ----------------------------
 
-            if not order.paid:
-                order.paid = True
-                order.save(update_fields=["paid"])
-                logger.warning(
-                    "Order marked paid for pid=%s",
-                    pid,
-                )
 
-        except Order.DoesNotExist:
-            # If there is no matching order we simply acknowledge
-            # the event. Orders are created in the checkout view.
-            logger.warning(
-                "No matching order found for pid=%s",
-                pid,
-            )
+def _payment_intent_succeeded(intent):
+    """Mark the matching Order (by stripe_pid) as paid."""
+    pid = intent.get("id")
+    if not pid:
+        logger.warning("payment_intent.succeeded missing pid")
+        return
 
-        except Exception:
-            logger.exception(
-                "Unexpected error handling "
-                "payment_intent.succeeded"
-            )
+    # The Order and its line items are created in the checkout view,
+    # so only the `paid` flag is changed here.
+    order = Order.objects.for_payment_intent(pid).first()
+    if order is None:
+        logger.info("No matching order found for pid=%s", pid)
+        return
 
-    # For all other event types we simply acknowledge receipt
-    return HttpResponse(status=200)
+    if not order.paid:
+        order.paid = True
+        order.save(update_fields=["paid"])
+        # The user may no longer be eligible for this code
+        forget_code_usage(order.user_id, order.discount_code)
+        logger.info("Order %s marked paid for pid=%s", order.pk, pid)
+
+
+HANDLERS = {
+    "payment_intent.succeeded": _payment_intent_succeeded,
+}
+
+
+def apply_event(payload: dict):
+    """Run the handler for one event payload (other types are ignored)."""
+    handler = HANDLERS.get(payload.get("type", ""))
+    if handler is not None:
+        handler(payload["data"]["object"])
+
+
+def _record_failure(pk) -> bool:
+    """Count a failed attempt; True if the event is now parked."""
+    StripeEvent.objects.filter(pk=pk).update(
+        attempts=F("attempts") + 1, last_error=traceback.format_exc()
+    )
+    return bool(
+        StripeEvent.objects.filter(
+            pk=pk, attempts__gte=settings.STRIPE_EVENT_MAX_ATTEMPTS
+        ).update(failed_on=timezone.now())
+    )
+
+
+def process_pending_events(batch_size=100) -> int:
+    """
+    Apply unprocessed events in Stripe's order; returns how many ran.
+
+    Each event is claimed and applied in one transaction, so concurrent
+    processors never apply an event twice. A failing event is rolled
+    back, its error recorded, and the exception re-raised: the job is
+    retried later and newer events wait behind it. Once an event has
+    failed STRIPE_EVENT_MAX_ATTEMPTS times it is parked (failed_on set,
+    see the admin's retry action) and processing moves past it.
+    """
+    done = 0
+    while True:
+        pending = list(
+            StripeEvent.objects.filter(
+                processed_on__isnull=True, failed_on__isnull=True
+            )
+            .order_by("stripe_created", "id")
+            .values_list("pk", "payload")[:batch_size]
+        )
+        if not pending:
+            return done
+        for pk, payload in pending:
+            try:
+                with transaction.atomic():
+                    claimed = StripeEvent.objects.filter(
+                        pk=pk, processed_on__isnull=True
+                    ).update(processed_on=timezone.now(), last_error="")
+                    if claimed:
+                        apply_event(payload)
+                        done += 1
+            except Exception:
+                if not _record_failure(pk):
+                    raise
+                logger.error(
+                    "Stripe event %s parked after %s failed attempts",
+                    pk,
+                    settings.STRIPE_EVENT_MAX_ATTEMPTS,
+                )
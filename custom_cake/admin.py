@@ -1,4 +1,5 @@
 from django.contrib import admin
+from .forms import CustomCakeAdminForm
 from .models import CustomCake
 from django.utils.html import format_html
 
@@ -10,6 +11,8 @@ class CustomCakeAdmin(admin.ModelAdmin):
     Ensures the 'description' (notes) is visible and searchable.
     """
 
+    form = CustomCakeAdminForm
+
     # Show key info in the list view (includes a short description preview)
     list_display = (
         "id",
@@ -71,6 +74,6 @@ class CustomCakeAdmin(admin.ModelAdmin):
                     '<img src="{}" style="max-height: 100px; '
                     'border-radius: 6px;" />'
                 ),
-                obj.image.url,
+                obj.thumbnails.get("src") or obj.image.url,
             )
         return "No image"
@@ -2,10 +2,22 @@ from django import forms
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
+from products.images import ThumbnailFormMixin
+
 from .models import CustomCake
 
 
-class CustomCakeForm(forms.ModelForm):
+class CustomCakeAdminForm(ThumbnailFormMixin, forms.ModelForm):
+    thumbnail_folder = "custom_cakes"
+
+    class Meta:
+        model = CustomCake
+        fields = "__all__"
+
+
+class CustomCakeForm(ThumbnailFormMixin, forms.ModelForm):
+    thumbnail_folder = "custom_cakes"
+
     # Explicit field for validation and custom widget
     needed_date = forms.DateField(
         required=False,
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_cake', '0006_customcake_needed_date'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customcake',
+            index=models.Index(fields=['user', '-created_on', '-id'], name='customcake_user_created_idx'),
+        ),
+    ]
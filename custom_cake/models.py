@@ -60,10 +60,18 @@ class CustomCake(models.Model):
         help_text="Date you need the cake for (optional).",
     )
     image = models.ImageField(upload_to="custom_cakes/", blank=True, null=True)
+    # Precomputed derivatives of `image` (see products.images)
+    thumbnails = models.JSONField(default=dict, blank=True, editable=False)
     created_on = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ["-created_on"]
+        indexes = [
+            models.Index(
+                fields=["user", "-created_on", "-id"],
+                name="customcake_user_created_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.user.username if self.user else 'guest'})"
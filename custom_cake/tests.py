@@ -1,9 +1,14 @@
 from django.contrib.auth.models import User
 from django.contrib.messages import get_messages
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
+from products.catalog import CATALOG
+from products.models import CatalogVersion
+from products.tests import jpeg_upload
+
 from .models import CustomCake
+from .utils import get_or_create_deposit_product
 
 
 class CustomCakeViewsTests(TestCase):
@@ -35,6 +40,36 @@ class CustomCakeViewsTests(TestCase):
             "Success message not found after creation.",
         )
 
+    @override_settings(
+        STORAGES={
+            "default": {
+                "BACKEND": "django.core.files.storage.InMemoryStorage"
+            },
+            "staticfiles": {
+                "BACKEND": "django.contrib.staticfiles.storage."
+                "StaticFilesStorage"
+            },
+        },
+        JOBS_EAGER=True,
+    )
+    def test_create_with_image_builds_thumbnails(self):
+        get_or_create_deposit_product()  # the detail page's own write
+        CatalogVersion.objects.update_or_create(
+            pk=CATALOG, defaults={"version": 1}
+        )
+        response = self.client.post(
+            reverse("create_custom_cake"),
+            {**self.valid_data, "image": jpeg_upload(800, 600)},
+            follow=True,
+        )
+        cake = CustomCake.objects.get()
+        self.assertEqual(
+            [s["width"] for s in cake.thumbnails["sizes"]], [320, 640]
+        )
+        self.assertContains(response, cake.thumbnails["srcset"]["webp"])
+        # Custom cakes aren't in the catalog, so its caches stay valid
+        self.assertEqual(CatalogVersion.objects.get(pk=CATALOG).version, 1)
+
     def test_update_custom_cake(self):
         cake = CustomCake.objects.create(user=self.user, **self.valid_data)
         update_data = self.valid_data.copy()
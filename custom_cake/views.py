@@ -42,6 +42,7 @@ def custom_cake_create(request):
             cake = form.save(commit=False)
             cake.user = request.user
             cake.save()
+            form.save_m2m()  # queues thumbnails for an uploaded image
             messages.success(request, "Custom cake created successfully.")
             return redirect("custom_cake_detail", pk=cake.pk)
         else:
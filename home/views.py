@@ -1,11 +1,11 @@
 from django.shortcuts import render
 from django.views.generic import TemplateView
 
-from products.models import Product
+from products.snapshot import get_snapshot
 
 
 def index(request):
-    products = Product.objects.filter(featured=True)[:8]
+    products = get_snapshot().featured[:8]
     return render(
         request,
         "home/index.html",
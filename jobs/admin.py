@@ -0,0 +1,33 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Job
+
+
+@admin.action(description="Retry selected jobs now")
+def retry_now(_modeladmin, _request, queryset):
+    queryset.exclude(status=Job.RUNNING).update(
+        status=Job.QUEUED,
+        attempts=0,
+        run_at=timezone.now(),
+        finished_on=None,
+    )
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "name",
+        "status",
+        "attempts",
+        "max_attempts",
+        "run_at",
+        "locked_by",
+        "finished_on",
+    )
+    list_filter = ("status", "name")
+    search_fields = ("name", "last_error")
+    ordering = ("-id",)
+    readonly_fields = ("created_on", "finished_on", "locked_by", "last_error")
+    actions = [retry_now]
@@ -0,0 +1,79 @@
+import multiprocessing
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from jobs.queue import work
+
+
+class Command(BaseCommand):
+    help = "Run background job workers (see jobs.queue)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.JOBS_WORKERS,
+            help="Number of worker threads or processes.",
+        )
+        parser.add_argument(
+            "--mode",
+            choices=["thread", "process"],
+            default="thread",
+            help="Threads suit I/O-bound tasks (HTTP, email); processes "
+            "suit CPU-bound ones.",
+        )
+        parser.add_argument(
+            "--poll",
+            type=float,
+            default=settings.JOBS_POLL_INTERVAL,
+            help="Seconds to wait when no job is due.",
+        )
+        parser.add_argument(
+            "--drain",
+            action="store_true",
+            help="Exit once no job is due instead of polling.",
+        )
+
+    def handle(self, *args, **options):
+        count = options["workers"]
+        if count < 1:
+            raise CommandError("--workers must be at least 1.")
+
+        if options["mode"] == "process":
+            # Children must open their own connections
+            connections.close_all()
+            context = multiprocessing.get_context("fork")
+            stop = context.Event()
+            spawn = context.Process
+        else:
+            stop = threading.Event()
+            spawn = threading.Thread
+
+        workers = [
+            spawn(
+                target=work,
+                args=(index, stop, options["poll"], options["drain"]),
+                daemon=True,
+            )
+            for index in range(count)
+        ]
+
+        def shut_down(*_):
+            self.stderr.write("Stopping workers after their current jobs…")
+            stop.set()
+
+        signal.signal(signal.SIGTERM, shut_down)
+        signal.signal(signal.SIGINT, shut_down)
+
+        self.stdout.write(
+            f"Starting {count} {options['mode']} worker(s)."
+        )
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.stdout.write(self.style.SUCCESS("Workers stopped."))
@@ -0,0 +1,58 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    One queued call of a registered task (see jobs.queue).
+
+    A worker claims a job by moving it to RUNNING with `locked_until` set
+    to now + JOBS_VISIBILITY_TIMEOUT. If the worker dies, the job becomes
+    claimable again once that passes. `attempts` counts claims and doubles
+    as a fencing token, so a worker whose claim has expired can't mark
+    the job done after someone else picked it up.
+    """
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    name = models.CharField(max_length=200)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=QUEUED
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_on = models.DateTimeField(auto_now_add=True)
+    finished_on = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["run_at", "id"]
+        indexes = [
+            # Claim scans: due queued jobs, expired running ones
+            models.Index(
+                fields=["run_at", "id"],
+                condition=models.Q(status="queued"),
+                name="job_due_idx",
+            ),
+            models.Index(
+                fields=["locked_until"],
+                condition=models.Q(status="running"),
+                name="job_lease_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
@@ -0,0 +1,202 @@
+"""
+A small DB-backed job queue for slow side effects.
+
+Register a function as a task in an app's tasks.py (they're discovered
+at startup) and enqueue calls to it with JSON-serialisable kwargs:
+
+    @task
+    def save_delivery_defaults(user_id, data): ...
+
+    enqueue(save_delivery_defaults, user_id=user.pk, data={...})
+
+Jobs are rows in jobs.Job, so enqueueing inside a transaction only
+publishes the job if the transaction commits. `manage.py run_workers`
+claims and runs them; failures are retried with exponential backoff up
+to max_attempts. With JOBS_EAGER = True (tests, local dev) enqueue()
+runs the job inline and re-raises its error, with no worker needed.
+"""
+import logging
+import os
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import (
+    InterfaceError,
+    OperationalError,
+    close_old_connections,
+    connection,
+)
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+def task(func=None, *, name=None):
+    """Register `func` as a task, by default as "<module>.<function>"."""
+
+    def register(func):
+        key = name or f"{func.__module__}.{func.__name__}"
+        TASKS[key] = func
+        func.task_name = key
+        return func
+
+    return register(func) if func else register
+
+
+def _task_name(func_or_name) -> str:
+    name = getattr(func_or_name, "task_name", func_or_name)
+    if name not in TASKS:
+        raise LookupError(f"Unknown task {name!r}; is it registered?")
+    return name
+
+
+def enqueue(func_or_name, *, delay=0, max_attempts=None, **kwargs) -> Job:
+    """Queue a call of a registered task; returns the Job."""
+    job = Job.objects.create(
+        name=_task_name(func_or_name),
+        payload=kwargs,
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+    if settings.JOBS_EAGER:
+        run_job(_claim_job(job.pk, "eager"), propagate=True)
+        job.refresh_from_db()
+    return job
+
+
+def backoff(attempts: int) -> timedelta:
+    """Delay before retry number `attempts`: base * 2^(n-1), capped."""
+    seconds = settings.JOBS_RETRY_BACKOFF * 2 ** max(attempts - 1, 0)
+    return timedelta(seconds=min(seconds, settings.JOBS_RETRY_BACKOFF_MAX))
+
+
+def _claimable(now):
+    return Q(status=Job.QUEUED, run_at__lte=now) | Q(
+        status=Job.RUNNING, locked_until__lt=now
+    )
+
+
+def _claim_job(pk, worker: str):
+    """Take job `pk` if it's still claimable; None if someone beat us."""
+    now = timezone.now()
+    claimed = Job.objects.filter(_claimable(now), pk=pk).update(
+        status=Job.RUNNING,
+        attempts=F("attempts") + 1,
+        locked_by=worker,
+        locked_until=now
+        + timedelta(seconds=settings.JOBS_VISIBILITY_TIMEOUT),
+    )
+    return Job.objects.get(pk=pk) if claimed else None
+
+
+def claim(worker: str, scan: int = 10):
+    """
+    Claim the next due job for `worker`, or None.
+
+    Each claim is a conditional UPDATE, so concurrent workers (threads,
+    processes or hosts) never get the same job, on any database.
+    """
+    candidates = (
+        Job.objects.filter(_claimable(timezone.now()))
+        .order_by("run_at", "id")
+        .values_list("pk", flat=True)[:scan]
+    )
+    for pk in candidates:
+        job = _claim_job(pk, worker)
+        if job is not None:
+            return job
+    return None
+
+
+def _finish(job, **fields):
+    # Fenced on attempts: a stale worker can't overwrite a newer claim
+    return Job.objects.filter(
+        pk=job.pk, status=Job.RUNNING, attempts=job.attempts
+    ).update(locked_until=None, **fields)
+
+
+def run_job(job, propagate=False) -> bool:
+    """Run a claimed job, then mark it done or schedule its retry."""
+    if job.attempts > job.max_attempts:
+        # Its worker kept dying (visibility timeout) without finishing
+        _finish(job, status=Job.FAILED, finished_on=timezone.now())
+        return False
+    try:
+        func = TASKS.get(job.name)
+        if func is None:
+            raise LookupError(f"Unknown task {job.name!r}")
+        func(**job.payload)
+    except Exception as exc:
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts and not propagate:
+            logger.warning(
+                "Job %s failed (attempt %s), retrying", job, job.attempts
+            )
+            _finish(
+                job,
+                status=Job.QUEUED,
+                run_at=timezone.now() + backoff(job.attempts),
+                last_error=error,
+            )
+        else:
+            logger.error("Job %s failed: %s", job, exc)
+            _finish(
+                job,
+                status=Job.FAILED,
+                finished_on=timezone.now(),
+                last_error=error,
+            )
+        if propagate:
+            raise
+        return False
+    _finish(job, status=Job.DONE, finished_on=timezone.now())
+    return True
+
+
+def _close_old_connections():
+    # Drop broken or expired connections between jobs, but never one a
+    # caller's transaction is using (e.g. work() run inside a test)
+    if not connection.in_atomic_block:
+        close_old_connections()
+
+
+def worker_name(index=0) -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+def work(index=0, stop=None, poll=1.0, drain=False) -> int:
+    """
+    Worker loop: claim and run jobs until `stop` is set, or, with
+    drain=True, until nothing is due. Returns how many jobs it ran.
+    """
+    stop = stop or threading.Event()
+    name = worker_name(index)
+    ran = 0
+    while not stop.is_set():
+        _close_old_connections()
+        try:
+            job = claim(name)
+            if job is not None:
+                run_job(job)
+                ran += 1
+        except (OperationalError, InterfaceError):
+            # A dropped connection or a lock timeout. Don't let it kill
+            # the worker; a job it had claimed is picked up again after
+            # its timeout. Other database errors are bugs and propagate.
+            logger.exception("Worker %s hit a database error", name)
+            stop.wait(poll)
+            continue
+        if job is None:
+            if drain:
+                break
+            stop.wait(poll)
+    _close_old_connections()
+    return ran
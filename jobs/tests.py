@@ -0,0 +1,138 @@
+import threading
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .models import Job
+from .queue import _claim_job, backoff, claim, enqueue, run_job, task, work
+
+calls = []
+
+
+@task(name="jobs.tests.record")
+def record(value):
+    calls.append(value)
+
+
+@task(name="jobs.tests.explode")
+def explode():
+    raise RuntimeError("boom")
+
+
+@override_settings(
+    JOBS_EAGER=False, JOBS_RETRY_BACKOFF=10, JOBS_RETRY_BACKOFF_MAX=60
+)
+class QueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_then_work(self):
+        job = enqueue(record, value=1)
+        enqueue("jobs.tests.record", value=2, delay=60)
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertEqual(calls, [])
+
+        self.assertEqual(work(drain=True), 1)
+        self.assertEqual(calls, [1])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.DONE, 1))
+        self.assertIsNotNone(job.finished_on)
+
+    def test_unknown_task_is_rejected(self):
+        with self.assertRaises(LookupError):
+            enqueue("jobs.tests.missing")
+
+    def test_retry_with_backoff_then_fail(self):
+        job = enqueue(explode, max_attempts=2)
+        self.assertFalse(run_job(claim("w")))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn("RuntimeError: boom", job.last_error)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=9))
+        self.assertIsNone(claim("w"))  # not due yet
+
+        Job.objects.update(run_at=timezone.now())
+        run_job(claim("w"))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_backoff_doubles_and_caps(self):
+        self.assertEqual(
+            [backoff(n).seconds for n in (1, 2, 3, 4, 5)],
+            [10, 20, 40, 60, 60],
+        )
+
+    def test_claims_are_exclusive_and_expire(self):
+        job = enqueue(record, value=1)
+        first = claim("a")
+        self.assertEqual(first.pk, job.pk)
+        self.assertIsNone(claim("b"))
+
+        # Worker "a" stalls past its visibility timeout
+        Job.objects.update(locked_until=timezone.now() - timedelta(1))
+        second = claim("b")
+        self.assertEqual((second.locked_by, second.attempts), ("b", 2))
+
+        run_job(first)  # the stale claim can't finish the job
+        self.assertEqual(Job.objects.get().status, Job.RUNNING)
+        run_job(second)
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+        self.assertEqual(calls, [1, 1])
+
+    @override_settings(JOBS_EAGER=True)
+    def test_eager_runs_inline(self):
+        job = enqueue(record, value=3)
+        self.assertEqual(calls, [3])
+        self.assertEqual(job.status, Job.DONE)
+        with self.assertRaises(RuntimeError):
+            enqueue(explode)
+        self.assertEqual(
+            Job.objects.get(name="jobs.tests.explode").status, Job.FAILED
+        )
+
+
+@override_settings(JOBS_EAGER=False)
+class RunWorkersTests(TransactionTestCase):
+    def test_thread_pool_drains_queue(self):
+        calls.clear()
+        for value in range(20):
+            enqueue(record, value=value)
+        with self.assertNoLogs("jobs.queue", "ERROR"):
+            call_command(
+                "run_workers", "--workers", "4", "--drain", stdout=StringIO()
+            )
+        self.assertEqual(sorted(calls), list(range(20)))
+        self.assertEqual(
+            Job.objects.filter(status=Job.DONE, attempts=1).count(), 20
+        )
+
+    def test_racing_claims_take_each_job_once(self):
+        jobs = [enqueue(record, value=value).pk for value in range(5)]
+        start = threading.Barrier(8)
+        won = []
+
+        def race(index):
+            # Each thread has its own connection
+            try:
+                for pk in jobs:
+                    start.wait()
+                    if _claim_job(pk, f"w{index}") is not None:
+                        won.append(pk)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=race, args=(i,)) for i in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(won), sorted(jobs))
+        self.assertEqual(
+            Job.objects.filter(status=Job.RUNNING, attempts=1).count(), 5
+        )
@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from .forms import ProductAdminForm
 from .models import Category, Product, ProductOption
 
 
@@ -20,6 +21,7 @@ class ProductOptionInline(admin.TabularInline):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
+    form = ProductAdminForm
     list_display = (
         "name",
         "sku",
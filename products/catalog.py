@@ -0,0 +1,85 @@
+"""
+Catalog version counter.
+
+Bumped whenever products, options or categories change, so anything that
+caches catalog-derived data (the in-memory snapshot, page fragments, the
+bag summary kept in the session) can tell it is stale without re-reading
+the catalog.
+
+The version lives in a single CatalogVersion row, so every worker agrees
+on it, and is mirrored in the cache for CATALOG_VERSION_TTL seconds so
+reading it is usually free. With a shared cache a bump is seen everywhere
+as soon as it commits; with a per-process cache, within the TTL.
+
+The same mechanism backs other counters, one row each (`counter` below):
+DISCOUNTS versions bag.discounts' compiled rule table, so discount code
+changes don't retire catalog caches, and PAID_ORDERS its cached per-user
+code usage counts.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from .models import CatalogVersion
+
+# CatalogVersion rows
+CATALOG = 1
+DISCOUNTS = 2
+PAID_ORDERS = 3
+
+VERSION_KEYS = {
+    CATALOG: "catalog:version",
+    DISCOUNTS: "discounts:version",
+    PAID_ORDERS: "paid_orders:version",
+}
+CATALOG_VERSION_KEY = VERSION_KEYS[CATALOG]
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _read_version(counter=CATALOG) -> int:
+    version = (
+        CatalogVersion.objects.filter(pk=counter)
+        .values_list("version", flat=True)
+        .first()
+    )
+    if version is None:
+        row, _ = CatalogVersion.objects.get_or_create(
+            pk=counter, defaults={"version": _now_ms()}
+        )
+        version = row.version
+    return version
+
+
+def get_catalog_version(counter=CATALOG) -> int:
+    """Return the current catalog (or other `counter`) version."""
+    key = VERSION_KEYS[counter]
+    version = cache.get(key)
+    if version is None:
+        version = _read_version(counter)
+        cache.set(key, version, settings.CATALOG_VERSION_TTL)
+    return version
+
+
+def bump_catalog_version(counter=CATALOG) -> int:
+    """Move the version forward and return the new value."""
+    # Never below the clock, so versions don't repeat after a rollback
+    CatalogVersion.objects.filter(pk=counter).update(
+        version=Greatest(F("version") + 1, Value(_now_ms()))
+    )
+    version = _read_version(counter)  # seeds the row if it was missing
+
+    # Readers in this transaction go to the row; other processes keep the
+    # committed value until the new one is published on commit.
+    key = VERSION_KEYS[counter]
+    cache.delete(key)
+    transaction.on_commit(
+        lambda: cache.set(key, version, settings.CATALOG_VERSION_TTL)
+    )
+    return version
@@ -0,0 +1,244 @@
+"""
+Streaming catalog import/export (JSON Lines or CSV).
+
+Used by the import_catalog / export_catalog management commands. Rows
+are read and written one at a time, and imports are upserted by SKU in
+batches with bulk_create(update_conflicts=True), so memory stays flat and
+a large catalog takes a handful of statements per batch (plus a thumbnail
+job per product whose image changed).
+
+Row fields: sku, name, description, price, category (slug), image,
+featured, is_custom, is_accessory, is_offer. JSON Lines rows may also
+carry "options": [{"label", "quantity", "price", "is_default"}], upserted
+by (product, quantity); CSV has no options column.
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from jobs.queue import enqueue
+
+from .models import Category, Product, ProductOption, reserve_skus
+
+FIELDS = [
+    "sku",
+    "name",
+    "description",
+    "price",
+    "category",
+    "image",
+    "featured",
+    "is_custom",
+    "is_accessory",
+    "is_offer",
+]
+FLAGS = ("featured", "is_custom", "is_accessory", "is_offer")
+PRODUCT_UPDATE_FIELDS = [
+    "name",
+    "description",
+    "price",
+    "category",
+    "image",
+    "thumbnails",
+    "featured",
+    "is_custom",
+    "is_accessory",
+    "is_offer",
+    "updated_on",
+]
+OPTION_UPDATE_FIELDS = ["label", "price", "is_default"]
+
+
+class RowError(ValueError):
+    """A row that can't be imported; the message says why."""
+
+
+def guess_format(path: str) -> str:
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+# ----------------------------
+# Reading
+# ----------------------------
+
+
+def read_rows(stream, fmt: str):
+    """Yield (line_number, dict) from a JSON Lines or CSV stream."""
+    if fmt == "csv":
+        for number, row in enumerate(csv.DictReader(stream), start=2):
+            yield number, row
+        return
+    for number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if line:
+            try:
+                yield number, json.loads(line)
+            except json.JSONDecodeError as exc:
+                yield number, RowError(f"invalid JSON ({exc.msg})")
+
+
+def _flag(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value or "").strip().lower() in ("1", "true", "yes", "y")
+
+
+def _decimal(value, field) -> Decimal:
+    try:
+        return Decimal(str(value).strip())
+    except (InvalidOperation, TypeError):
+        raise RowError(f"bad {field} {value!r}")
+
+
+def build_product(row: dict, category_ids: dict) -> Product:
+    """An unsaved Product for `row`; raises RowError if it can't be used."""
+    name = (row.get("name") or "").strip()
+    if not name:
+        raise RowError("missing name")
+    slug = (row.get("category") or "").strip()
+    if slug and slug not in category_ids:
+        raise RowError(f"unknown category {slug!r}")
+    return Product(
+        sku=(row.get("sku") or "").strip() or None,
+        name=name,
+        description=row.get("description") or "",
+        price=_decimal(row.get("price"), "price"),
+        category_id=category_ids.get(slug) if slug else None,
+        image=row.get("image") or None,
+        **{flag: _flag(row.get(flag)) for flag in FLAGS},
+    )
+
+
+def build_options(row: dict) -> list[ProductOption]:
+    options = []
+    for opt in row.get("options") or []:
+        price = opt.get("price")
+        if price not in (None, ""):
+            price = _decimal(price, "option price")
+        options.append(
+            ProductOption(
+                label=opt.get("label") or "",
+                quantity=int(opt.get("quantity") or 0),
+                price=price or None,
+                is_default=_flag(opt.get("is_default")),
+            )
+        )
+    return options
+
+
+def category_map() -> dict:
+    """slug -> id for every category, loaded once per import."""
+    return dict(Category.objects.values_list("slug", "id"))
+
+
+def upsert_batch(batch) -> list[int]:
+    """
+    Upsert [(Product, [ProductOption])] by SKU; returns the product ids.
+    Rows without a SKU get freshly reserved ones; if a SKU repeats within
+    the batch, the last row wins. A product keeps its thumbnails while its
+    image stays the same; a new image gets a build_thumbnails_for job.
+    """
+    by_sku = {}
+    for product, opts in batch:
+        by_sku[product.sku or id(product)] = (product, opts)
+    batch = list(by_sku.values())
+
+    unsku = [product for product, _ in batch if not product.sku]
+    for product, sku in zip(unsku, reserve_skus(len(unsku)) if unsku else []):
+        product.sku = sku
+    skus = [product.sku for product, _ in batch]
+
+    existing = {
+        sku: (image or "", thumbnails)
+        for sku, image, thumbnails in Product.objects.filter(
+            sku__in=skus
+        ).values_list("sku", "image", "thumbnails")
+    }
+    new_images = []
+    for product, _ in batch:
+        image, thumbnails = existing.get(product.sku, ("", {}))
+        if (product.image.name or "") == image:
+            product.thumbnails = thumbnails
+        elif product.image:
+            new_images.append(product.sku)
+
+    Product.objects.bulk_create(
+        [product for product, _ in batch],
+        update_conflicts=True,
+        unique_fields=["sku"],
+        update_fields=PRODUCT_UPDATE_FIELDS,
+    )
+    # Looked up rather than read off bulk_create, which only sets pks on
+    # conflicting rows from Django 5.0
+    ids = dict(
+        Product.objects.filter(sku__in=skus).values_list("sku", "pk")
+    )
+    options = []
+    for product, opts in batch:
+        for opt in opts:
+            opt.product_id = ids[product.sku]
+            options.append(opt)
+    if options:
+        ProductOption.objects.bulk_create(
+            options,
+            update_conflicts=True,
+            unique_fields=["product", "quantity"],
+            update_fields=OPTION_UPDATE_FIELDS,
+        )
+    for sku in new_images:
+        enqueue(
+            "products.tasks.build_thumbnails_for",
+            model=Product._meta.label,
+            pk=ids[sku],
+            folder="products",
+        )
+    return [ids[sku] for sku in skus]
+
+
+# ----------------------------
+# Writing
+# ----------------------------
+
+
+def export_rows(queryset, with_options: bool):
+    """Yield export dicts for `queryset`, streamed in chunks."""
+    queryset = queryset.select_related("category").order_by("pk")
+    if with_options:
+        queryset = queryset.prefetch_related("options")
+    for product in queryset.iterator(chunk_size=2000):
+        row = {
+            "sku": product.sku or "",
+            "name": product.name,
+            "description": product.description,
+            "price": str(product.price),
+            "category": product.category.slug if product.category else "",
+            "image": product.image.name if product.image else "",
+            **{flag: getattr(product, flag) for flag in FLAGS},
+        }
+        if with_options:
+            row["options"] = [
+                {
+                    "label": opt.label,
+                    "quantity": opt.quantity,
+                    "price": None if opt.price is None else str(opt.price),
+                    "is_default": opt.is_default,
+                }
+                for opt in product.options.all()
+            ]
+        yield row
+
+
+def write_rows(stream, rows, fmt: str) -> int:
+    """Write `rows` to `stream`; returns how many were written."""
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(stream, fieldnames=FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+        return count
+    for row in rows:
+        stream.write(json.dumps(row, ensure_ascii=False) + "\n")
+        count += 1
+    return count
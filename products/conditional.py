@@ -0,0 +1,99 @@
+"""
+Validators for conditional GET (ETag / Last-Modified -> 304).
+
+Used with django.views.decorators.http.condition on the catalog pages
+and the sitemap. Everything here reads the catalog version, the catalog
+snapshot and the session, so checking a revalidation costs no catalog
+queries.
+
+Catalog pages also show per-visitor bits (bag badge, account menu, staff
+links, flash messages), so their ETags fold in the visitor's state, and
+no validator is offered while messages are waiting to be shown.
+Last-Modified is only sent where it is safe on its own: product pages
+for visitors with no session state. Listings use ETags only, since
+deleting a product can make a listing change without anything getting
+newer. Product pages also show the category nav, so their validators
+move with the catalog version as well as the product.
+"""
+import hashlib
+import json
+from datetime import datetime, timezone
+
+from django.contrib.messages import get_messages
+
+from .catalog import DISCOUNTS, get_catalog_version
+from .snapshot import get_snapshot
+
+
+def _digest(*parts) -> str:
+    raw = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _visitor_state(request):
+    """What differs between visitors on an otherwise identical page."""
+    session = getattr(request, "session", None) or {}
+    user = getattr(request, "user", None)
+    signed_in = user is not None and user.is_authenticated
+    discount = session.get("discount") or {}
+    if discount:
+        # Its rule can change without the catalog changing
+        discount = dict(discount, rules=get_catalog_version(DISCOUNTS))
+    return [
+        [user.pk, user.is_staff, user.is_superuser] if signed_in else None,
+        session.get("bag") or {},
+        discount,
+    ]
+
+
+def _is_plain_visitor(request) -> bool:
+    return _visitor_state(request) == [None, {}, {}]
+
+
+def _has_pending_messages(request) -> bool:
+    return len(get_messages(request)) > 0
+
+
+def catalog_etag(request, *args, **kwargs):
+    """Listings: any catalog change or visitor change is a new ETag."""
+    if _has_pending_messages(request):
+        return None
+    return _digest("catalog", get_catalog_version(), _visitor_state(request))
+
+
+def _snapshot_product(product_id):
+    found = get_snapshot().get_products([product_id])
+    return found[0] if found else None
+
+
+def product_etag(request, product_id, *args, **kwargs):
+    product = _snapshot_product(product_id)
+    if product is None or _has_pending_messages(request):
+        return None
+    return _digest(
+        "product",
+        product.pk,
+        product.updated_on,
+        get_catalog_version(),
+        _visitor_state(request),
+    )
+
+
+def _catalog_changed_at() -> datetime:
+    # Bumps never set the version below the clock (in ms), so it is
+    # never earlier than the last catalog change
+    return datetime.fromtimestamp(get_catalog_version() / 1000, timezone.utc)
+
+
+def product_last_modified(request, product_id, *args, **kwargs):
+    if not _is_plain_visitor(request) or _has_pending_messages(request):
+        return None
+    product = _snapshot_product(product_id)
+    if product is None:
+        return None
+    return max(product.updated_on, _catalog_changed_at())
+
+
+def sitemap_etag(request, *args, **kwargs):
+    """Sitemaps only change with the catalog (and the host they name)."""
+    return _digest("sitemap", get_catalog_version(), request.get_host())
@@ -1,5 +1,9 @@
-from .models import Category
+from .snapshot import get_snapshot
 
 
 def all_categories(request):
-    return {"ALL_CATEGORIES": Category.objects.all()}
+    # Callables: only resolved if a template actually uses them
+    return {
+        "ALL_CATEGORIES": lambda: tuple(get_snapshot().categories.values()),
+        "CATEGORY_TREE": lambda: get_snapshot().tree,
+    }
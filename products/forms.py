@@ -1,8 +1,20 @@
 from django import forms
+
+from .images import ThumbnailFormMixin
 from .models import Product
 
 
-class ProductForm(forms.ModelForm):
+class ProductAdminForm(ThumbnailFormMixin, forms.ModelForm):
+    thumbnail_folder = "products"
+
+    class Meta:
+        model = Product
+        fields = "__all__"
+
+
+class ProductForm(ThumbnailFormMixin, forms.ModelForm):
+    thumbnail_folder = "products"
+
     class Meta:
         model = Product
         fields = (
@@ -0,0 +1,107 @@
+"""
+Fragment cache for catalog pages.
+
+Expensive, user-independent parts of a page (the product grid, the
+featured strip, static copy) are cached under a key built from a fragment
+name, the catalog version and whatever the fragment varies on (slugs,
+search, sort, page...). The rest of the page, including the per-session
+bag badge and nav, is still rendered on every request, so one cached grid
+serves every visitor. Any catalog change bumps the version and so retires
+all fragments at once.
+
+Hits and misses are counted per fragment and in total. Each process
+tallies them in memory and adds them to the "shared" cache every
+FRAGMENT_STATS_FLUSH seconds, so counting is free on the request path and
+fragment_stats() / the staff-only cache stats view report every process.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache, caches
+
+from .catalog import get_catalog_version
+
+STATS_KEY = "fragment:stats:{name}:{outcome}"
+TOTAL = "_total"
+OUTCOMES = ("hits", "misses")
+
+# Fragment names seen by this process (for the stats report)
+_names = set()
+
+# Counts not yet added to the shared cache
+_pending = Counter()
+_pending_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+def fragment_key(name: str, vary) -> str:
+    raw = json.dumps(
+        [name, get_catalog_version(), vary], sort_keys=True, default=str
+    )
+    return "fragment:" + hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _count(name: str, outcome: str):
+    _names.add(name)
+    with _pending_lock:
+        for who in (name, TOTAL):
+            _pending[STATS_KEY.format(name=who, outcome=outcome)] += 1
+    if time.monotonic() - _flushed_at >= settings.FRAGMENT_STATS_FLUSH:
+        flush_fragment_stats()
+
+
+def flush_fragment_stats():
+    """Add this process's pending counts to the shared totals."""
+    global _flushed_at
+    with _pending_lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _flushed_at = time.monotonic()
+    shared = caches["shared"]
+    for key, n in pending.items():
+        if not shared.add(key, n, timeout=None):
+            try:
+                shared.incr(key, n)
+            except ValueError:
+                # Evicted between add() and incr(); start again
+                shared.add(key, n, timeout=None)
+
+
+def cached_fragment(name: str, vary, build):
+    """
+    Return the cached value for (name, catalog version, vary), calling
+    build() and storing its result on a miss. The value must be
+    picklable (rendered HTML, or a small dict around it).
+    """
+    key = fragment_key(name, vary)
+    value = cache.get(key)
+    if value is not None:
+        _count(name, "hits")
+        return value
+    _count(name, "misses")
+    value = build()
+    cache.set(key, value, settings.FRAGMENT_CACHE_TIMEOUT)
+    return value
+
+
+def fragment_stats(names=()) -> dict:
+    """{name: {"hits": n, "misses": n}} including a "_total" entry."""
+    flush_fragment_stats()
+    names = sorted(_names.union(names)) + [TOTAL]
+    keys = {
+        (name, outcome): STATS_KEY.format(name=name, outcome=outcome)
+        for name in names
+        for outcome in OUTCOMES
+    }
+    values = caches["shared"].get_many(keys.values())
+    return {
+        name: {
+            outcome: values.get(keys[name, outcome], 0)
+            for outcome in OUTCOMES
+        }
+        for name in names
+    }
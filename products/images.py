@@ -0,0 +1,162 @@
+"""
+Precomputed image derivatives (thumbnails) for uploaded images.
+
+When an image is uploaded through a form using ThumbnailFormMixin
+(ProductForm, CustomCakeForm and their admin forms), a job
+(products.tasks.build_thumbnails_for) resizes it once to each
+IMAGE_THUMB_WIDTHS width that fits, saves it as WebP (keeping any
+transparency) and JPEG (flattened onto white) next to the originals, and
+describes the result on the model's `thumbnails` JSON field:
+
+    {
+        "width": 320, "height": 240,           # the fallback src
+        "src": ".../ab12cd34ef56-320.jpg",
+        "srcset": {"webp": "... 320w, ... 640w", "jpeg": "..."},
+        "sizes": [{"width", "height", "webp", "jpeg"}, ...],
+    }
+
+srcset strings are built here, so templates (includes/picture.html) just
+print them. An empty dict means "no derivatives (yet)"; templates then
+fall back to the original image.
+"""
+import hashlib
+import logging
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from jobs.queue import enqueue
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {"webp": ("WEBP", "webp"), "jpeg": ("JPEG", "jpg")}
+
+
+def _widths(original_width: int) -> list[int]:
+    widths = [w for w in settings.IMAGE_THUMB_WIDTHS if w <= original_width]
+    return widths or [original_width]
+
+
+def _has_alpha(image) -> bool:
+    return image.mode in ("RGBA", "LA", "PA") or (
+        "transparency" in image.info
+    )
+
+
+def _on_white(image):
+    """RGB copy of an RGBA image, composited onto a white background."""
+    flat = Image.new("RGB", image.size, "white")
+    flat.paste(image, mask=image.getchannel("A"))
+    return flat
+
+
+def _encode(image, fmt: str) -> bytes:
+    out = BytesIO()
+    image.save(
+        out,
+        format=FORMATS[fmt][0],
+        quality=settings.IMAGE_THUMB_QUALITY,
+        optimize=True,
+    )
+    return out.getvalue()
+
+
+def build_thumbnails(upload, folder: str) -> dict:
+    """
+    Generate and store the derivatives for `upload` (an uploaded or stored
+    image file) under thumbs/<folder>/, returning the `thumbnails` value.
+    Files are named after a hash of the source, so re-uploading the same
+    image doesn't leave new copies behind.
+    """
+    if not upload:
+        return {}
+    try:
+        upload.seek(0)
+        data = upload.read()
+        upload.seek(0)
+        with Image.open(BytesIO(data)) as source:
+            source = ImageOps.exif_transpose(source)
+            alpha = _has_alpha(source)
+            # Premultiplied while resampling, so edges don't go dark
+            source = (
+                source.convert("RGBA").convert("RGBa")
+                if alpha
+                else source.convert("RGB")
+            )
+    except (OSError, UnidentifiedImageError):
+        logger.exception("Couldn't read image %s for thumbnails", upload)
+        return {}
+
+    stem = hashlib.sha1(data).hexdigest()[:12]
+    sizes = []
+    for width in _widths(source.width):
+        height = max(1, round(source.height * width / source.width))
+        resized = source.resize((width, height), Image.LANCZOS)
+        if alpha:
+            resized = resized.convert("RGBA")
+        encoded = {
+            "webp": resized,
+            "jpeg": _on_white(resized) if alpha else resized,
+        }
+        entry = {"width": width, "height": height}
+        for fmt, (_, ext) in FORMATS.items():
+            name = f"thumbs/{folder}/{stem}-{width}.{ext}"
+            if not default_storage.exists(name):
+                name = default_storage.save(
+                    name, ContentFile(_encode(encoded[fmt], fmt))
+                )
+            entry[fmt] = default_storage.url(name)
+        sizes.append(entry)
+
+    fallback = sizes[0]
+    return {
+        "width": fallback["width"],
+        "height": fallback["height"],
+        "src": fallback["jpeg"],
+        "srcset": {
+            fmt: ", ".join(f"{s[fmt]} {s['width']}w" for s in sizes)
+            for fmt in FORMATS
+        },
+        "sizes": sizes,
+    }
+
+
+class ThumbnailFormMixin:
+    """
+    ModelForm mixin: whenever the image field changes, clear
+    `instance.thumbnails` and queue a job to rebuild them once the
+    instance is saved. With save(commit=False) the job is queued by
+    save_m2m(), i.e. after the caller has saved the instance.
+    """
+
+    thumbnail_folder = "images"
+
+    def save(self, commit=True):
+        changed = "image" in self.changed_data
+        if changed:
+            self.instance.thumbnails = {}
+        instance = super().save(commit)
+        if changed:
+            if commit:
+                self._queue_thumbnails()
+            else:
+                save_m2m = self.save_m2m
+
+                def save_m2m_and_queue():
+                    save_m2m()
+                    self._queue_thumbnails()
+
+                self.save_m2m = save_m2m_and_queue
+        return instance
+
+    def _queue_thumbnails(self):
+        if self.instance.image:
+            enqueue(
+                "products.tasks.build_thumbnails_for",
+                model=self.instance._meta.label,
+                pk=self.instance.pk,
+                folder=self.thumbnail_folder,
+            )
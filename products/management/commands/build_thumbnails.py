@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+
+from custom_cake.models import CustomCake
+from products.catalog import bump_catalog_version
+from products.images import build_thumbnails
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate thumbnails for product and custom cake images that "
+        "don't have them yet (e.g. uploaded before derivatives existed, "
+        "or imported with import_catalog)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Rebuild thumbnails for every image.",
+        )
+
+    def handle(self, *args, **options):
+        built = 0
+        for model, folder in (
+            (Product, "products"),
+            (CustomCake, "custom_cakes"),
+        ):
+            queryset = model.objects.exclude(image="").exclude(
+                image__isnull=True
+            )
+            if not options["force"]:
+                queryset = queryset.filter(thumbnails={})
+            for obj in queryset.only("pk", "image").iterator():
+                thumbnails = build_thumbnails(obj.image, folder)
+                if thumbnails:
+                    # update() skips per-row signals; one bump below
+                    model.objects.filter(pk=obj.pk).update(
+                        thumbnails=thumbnails
+                    )
+                    built += 1
+                else:
+                    self.stderr.write(
+                        f"{model.__name__} {obj.pk}: couldn't read "
+                        f"{obj.image.name}"
+                    )
+
+        if built:
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"Built thumbnails for {built}."))
@@ -0,0 +1,75 @@
+"""
+Full-text search for products (queried by products.search).
+
+The SQL is written out here rather than imported from products.search,
+so later changes to that module can't change what this migration does.
+"""
+from django.db import migrations
+
+PG_INSTALL = [
+    "ALTER TABLE products_product "
+    "ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    "CREATE INDEX IF NOT EXISTS product_search_idx "
+    "ON products_product USING GIN (search_vector)",
+    """
+    UPDATE products_product AS p SET search_vector =
+        setweight(to_tsvector('english', coalesce(p.name, '')), 'A')
+        || setweight(to_tsvector('english',
+            coalesce(c.name, '') || ' ' || coalesce(c.friendly_name, '')),
+            'B')
+        || setweight(to_tsvector('english',
+            coalesce(p.description, '')), 'C')
+    FROM products_product AS src
+    LEFT JOIN products_category AS c ON c.id = src.category_id
+    WHERE src.id = p.id
+    """,
+]
+PG_UNINSTALL = [
+    "DROP INDEX IF EXISTS product_search_idx",
+    "ALTER TABLE products_product DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_INSTALL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_product_fts USING fts5("
+    "name, category, description, tokenize='porter unicode61')",
+    """
+    INSERT INTO products_product_fts (rowid, name, category, description)
+    SELECT p.id, p.name,
+           coalesce(c.name, '') || ' ' || coalesce(c.friendly_name, ''),
+           p.description
+    FROM products_product AS p
+    LEFT JOIN products_category AS c ON c.id = p.category_id
+    """,
+]
+SQLITE_UNINSTALL = ["DROP TABLE IF EXISTS products_product_fts"]
+
+
+def _run(schema_editor, statements):
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def install_search(apps, schema_editor):
+    _run(
+        schema_editor,
+        {"postgresql": PG_INSTALL, "sqlite": SQLITE_INSTALL},
+    )
+
+
+def uninstall_search(apps, schema_editor):
+    _run(
+        schema_editor,
+        {"postgresql": PG_UNINSTALL, "sqlite": SQLITE_UNINSTALL},
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0009_hot_lookup_indexes"),
+    ]
+
+    operations = [
+        # Vendor-specific: tsvector + GIN on PostgreSQL, FTS5 on SQLite
+        migrations.RunPython(install_search, uninstall_search),
+    ]
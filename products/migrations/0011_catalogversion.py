@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:26
+
+import time
+
+from django.db import migrations, models
+
+
+def seed_version(apps, schema_editor):
+    CatalogVersion = apps.get_model("products", "CatalogVersion")
+    CatalogVersion.objects.get_or_create(
+        pk=1, defaults={"version": int(time.time() * 1000)}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_version, migrations.RunPython.noop),
+    ]
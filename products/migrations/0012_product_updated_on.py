@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_catalogversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='updated_on',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
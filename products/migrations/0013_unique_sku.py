@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:35
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def dedupe_skus(apps, schema_editor):
+    """Blank SKUs become NULL; repeats get the product id appended."""
+    Product = apps.get_model("products", "Product")
+    Product.objects.filter(sku="").update(sku=None)
+    repeated = (
+        Product.objects.exclude(sku=None)
+        .values("sku")
+        .annotate(n=Count("id"))
+        .filter(n__gt=1)
+        .values_list("sku", flat=True)
+    )
+    for sku in list(repeated):
+        for product in Product.objects.filter(sku=sku).order_by("id")[1:]:
+            product.sku = f"{sku}-{product.pk}"
+            product.save(update_fields=["sku"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_product_updated_on'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SkuSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('next_value', models.BigIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(dedupe_skus, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(blank=True, max_length=254, null=True, unique=True),
+        ),
+    ]
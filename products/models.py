@@ -1,12 +1,60 @@
-import uuid
+import threading
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.utils.html import format_html
 from django.utils.text import slugify
 
+SKU_PREFIX = "CIE-"
+SKU_BLOCK_SIZE = 100
+SKU_SAVE_ATTEMPTS = 5
+
+_sku_block = {"next": 0, "end": 0}
+_sku_lock = threading.Lock()
+
+
+def _format_sku(number: int) -> str:
+    return f"{SKU_PREFIX}{number:06d}"
+
+
+def reserve_skus(count: int) -> list[str]:
+    """
+    Reserve `count` consecutive SKUs with a single counter UPDATE
+    (for bulk imports).
+    """
+    with transaction.atomic():
+        SkuSequence.objects.get_or_create(pk=1)
+        SkuSequence.objects.filter(pk=1).update(
+            next_value=F("next_value") + count
+        )
+        end = SkuSequence.objects.values_list("next_value", flat=True).get(
+            pk=1
+        )
+    return [_format_sku(n) for n in range(end - count, end)]
+
 
 def generate_sku() -> str:
-    return uuid.uuid4().hex[:8].upper()
+    """
+    Next SKU from this process's block, reserving a new block of
+    SKU_BLOCK_SIZE when it runs out (one query per block, not per SKU).
+    """
+    with _sku_lock:
+        if _sku_block["next"] >= _sku_block["end"]:
+            block = reserve_skus(SKU_BLOCK_SIZE)
+            _sku_block["next"] = int(block[0][len(SKU_PREFIX):])
+            _sku_block["end"] = _sku_block["next"] + SKU_BLOCK_SIZE
+        number = _sku_block["next"]
+        _sku_block["next"] += 1
+    return _format_sku(number)
+
+
+class SkuSequence(models.Model):
+    """Single-row counter behind generated SKUs (see generate_sku)."""
+
+    next_value = models.BigIntegerField(default=1)
+
+    def __str__(self):
+        return str(self.next_value)
 
 
 class Category(models.Model):
@@ -46,7 +94,7 @@ class Product(models.Model):
         blank=True,
         on_delete=models.SET_NULL,
     )
-    sku = models.CharField(max_length=254, null=True, blank=True)
+    sku = models.CharField(max_length=254, null=True, blank=True, unique=True)
     name = models.CharField(max_length=254)
     description = models.TextField()
 
@@ -58,12 +106,32 @@ class Product(models.Model):
         null=True,
         blank=True,
     )
+    # Precomputed derivatives of `image` (see products.images)
+    thumbnails = models.JSONField(default=dict, blank=True, editable=False)
 
     featured = models.BooleanField(default=False)
     is_custom = models.BooleanField(default=False)
     is_accessory = models.BooleanField(default=False)
     is_offer = models.BooleanField(default=False)
 
+    # Also touched when the product's options or category change
+    updated_on = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Small partial indexes for the home page / offers listing
+            models.Index(
+                fields=["id"],
+                condition=models.Q(featured=True),
+                name="product_featured_idx",
+            ),
+            models.Index(
+                fields=["id"],
+                condition=models.Q(is_offer=True),
+                name="product_offer_idx",
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -73,24 +141,38 @@ class Product(models.Model):
             return format_html(
                 '<img src="{}" width="100" height="100" '
                 'style="object-fit:cover;" />',
-                image.url,
+                self.thumbnails.get("src") or image.url,
             )
         return "No Image"
 
     image_preview.short_description = "Preview"
 
     def save(self, *args, **kwargs):
-        if not self.sku:
-            new_sku = generate_sku()
-            while type(self).objects.filter(sku=new_sku).exists():
-                new_sku = generate_sku()
-            self.sku = new_sku
-        super().save(*args, **kwargs)
+        if self.sku:
+            return super().save(*args, **kwargs)
+
+        # Insert and retry: the unique index, not a lookup, catches the
+        # rare clash (e.g. a block handed out again after a rollback)
+        for attempt in range(SKU_SAVE_ATTEMPTS):
+            self.sku = generate_sku()
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                clash = type(self).objects.filter(sku=self.sku).exists()
+                if not clash or attempt == SKU_SAVE_ATTEMPTS - 1:
+                    self.sku = None
+                    raise
 
     # ---- Helpers for UI badges / labels ----
 
     def min_pack_option(self):
-        """Return the ProductOption with the smallest quantity (if any)."""
+        """
+        Return the ProductOption with the smallest quantity (if any).
+
+        Uses prefetched options when present (products from the catalog
+        snapshot have them), so listings don't query once per card.
+        """
         opts = list(self.options.all())
         return min(opts, key=lambda o: o.quantity) if opts else None
 
@@ -144,3 +226,15 @@ class ProductOption(models.Model):
         if self.price is not None:
             return self.price
         return (self.product.price or 0) * self.quantity
+
+
+class CatalogVersion(models.Model):
+    """
+    A version counter, one row each: the catalog (pk 1), the discount
+    rules (pk 2) and paid orders with a code (pk 3); see products.catalog.
+    """
+
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return str(self.version)
@@ -0,0 +1,172 @@
+"""
+Full-text search for the catalog.
+
+Each product has a maintained search document built from its name
+(weight A), category name/friendly name (B) and description (C):
+
+  - PostgreSQL: a ``search_vector`` tsvector column on products_product
+    with a GIN index, ranked with ts_rank.
+  - SQLite: an FTS5 table (products_product_fts, rowid = product id),
+    ranked with bm25. Used for local development.
+
+The column/table is created (and first filled) by migration 0010 and
+kept up to date by the product/category signals; bulk writes (e.g.
+catalog imports) must call index_products() with the affected ids.
+Queries use prefix matching on every word ("choc cake" finds "Chocolate
+Cake"). On other databases, or before the migration has run, search
+falls back to icontains filters.
+"""
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+PRODUCT_TABLE = "products_product"
+FTS_TABLE = "products_product_fts"
+PG_CONFIG = "english"
+
+# Keep IN (...) lists well under SQLite's bound-parameter limit
+CHUNK_SIZE = 500
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_ready = set()
+
+PG_REINDEX = f"""
+    UPDATE {PRODUCT_TABLE} AS p SET search_vector =
+        setweight(to_tsvector('{PG_CONFIG}', coalesce(p.name, '')), 'A')
+        || setweight(to_tsvector('{PG_CONFIG}',
+            coalesce(c.name, '') || ' ' || coalesce(c.friendly_name, '')),
+            'B')
+        || setweight(to_tsvector('{PG_CONFIG}',
+            coalesce(p.description, '')), 'C')
+    FROM {PRODUCT_TABLE} AS src
+    LEFT JOIN products_category AS c ON c.id = src.category_id
+    WHERE src.id = p.id
+"""
+
+SQLITE_REINDEX = f"""
+    INSERT INTO {FTS_TABLE} (rowid, name, category, description)
+    SELECT p.id, p.name,
+           coalesce(c.name, '') || ' ' || coalesce(c.friendly_name, ''),
+           p.description
+    FROM {PRODUCT_TABLE} AS p
+    LEFT JOIN products_category AS c ON c.id = p.category_id
+"""
+# bm25 weights follow the column order: name, category, description
+SQLITE_RANK = f"bm25({FTS_TABLE}, 10.0, 4.0, 1.0)"
+
+
+def is_available(using=DEFAULT_DB_ALIAS) -> bool:
+    """True once the search column/table exists on this database."""
+    if using in _ready:
+        return True
+    conn = connections[using]
+    if conn.vendor == "postgresql":
+        sql = (
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_name = %s AND column_name = 'search_vector'"
+        )
+        params = [PRODUCT_TABLE]
+    elif conn.vendor == "sqlite":
+        sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s"
+        params = [FTS_TABLE]
+    else:
+        return False
+    with conn.cursor() as cursor:
+        cursor.execute(sql, params)
+        found = cursor.fetchone() is not None
+    # Only remember success: the migration may not have run yet
+    if found:
+        _ready.add(using)
+    return found
+
+
+def _chunks(ids):
+    ids = sorted(set(ids))
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start: start + CHUNK_SIZE]
+
+
+def index_products(ids=None, using=DEFAULT_DB_ALIAS):
+    """
+    Rebuild the search document for the given product ids (all products
+    when ids is None). Deleted ids are simply dropped from the index.
+    """
+    if not is_available(using):
+        return
+    conn = connections[using]
+    batches = [None] if ids is None else list(_chunks(ids))
+    with conn.cursor() as cursor:
+        for batch in batches:
+            if conn.vendor == "postgresql":
+                sql, params = PG_REINDEX, []
+                if batch is not None:
+                    sql += " AND p.id = ANY(%s)"
+                    params = [batch]
+                cursor.execute(sql, params)
+                continue
+
+            if batch is None:
+                cursor.execute(f"DELETE FROM {FTS_TABLE}")
+                cursor.execute(SQLITE_REINDEX)
+                continue
+            marks = ", ".join(["%s"] * len(batch))
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({marks})", batch
+            )
+            cursor.execute(SQLITE_REINDEX + f" WHERE p.id IN ({marks})", batch)
+
+
+def _terms(q: str) -> list[str]:
+    return _WORD_RE.findall(q.lower())
+
+
+def _fallback(queryset, q):
+    return queryset.filter(
+        Q(name__icontains=q)
+        | Q(description__icontains=q)
+        | Q(category__name__icontains=q)
+        | Q(category__friendly_name__icontains=q)
+    )
+
+
+def search(queryset, q: str):
+    """
+    Filter `queryset` to products matching every word of `q` (as a
+    prefix) and annotate ``search_rank`` (higher is better).
+    """
+    terms = _terms(q)
+    if not terms:
+        return _fallback(queryset, q)
+    if not is_available(queryset.db):
+        return _fallback(queryset, q)
+
+    if connections[queryset.db].vendor == "postgresql":
+        query = " & ".join(f"{term}:*" for term in terms)
+        tsquery = f"to_tsquery('{PG_CONFIG}', %s)"
+        matches = RawSQL(
+            f"SELECT id FROM {PRODUCT_TABLE} "
+            f"WHERE search_vector @@ {tsquery}",
+            [query],
+        )
+        rank = RawSQL(
+            f'ts_rank("{PRODUCT_TABLE}"."search_vector", {tsquery})',
+            [query],
+            output_field=FloatField(),
+        )
+        return queryset.filter(id__in=matches).annotate(search_rank=rank)
+
+    # Join the FTS table once: MATCH filters its rows and bm25() ranks
+    # the joined row (lower is better; negated so both backends sort desc)
+    query = " ".join(f'"{term}"*' for term in terms)
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[
+            f'{FTS_TABLE}.rowid = "{PRODUCT_TABLE}"."id"',
+            f"{FTS_TABLE} MATCH %s",
+        ],
+        params=[query],
+    ).annotate(
+        search_rank=RawSQL(f"-{SQLITE_RANK}", [], output_field=FloatField())
+    )
@@ -0,0 +1,40 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .catalog import bump_catalog_version
+from .models import Category, Product, ProductOption
+from .search import index_products
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=ProductOption)
+def catalog_changed(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_search_changed(sender, instance, using, **kwargs):
+    index_products([instance.pk], using=using)
+
+
+@receiver(post_save, sender=Category)
+def category_search_changed(sender, instance, using, **kwargs):
+    ids = Product.objects.using(using).filter(category=instance)
+    index_products(ids.values_list("pk", flat=True), using=using)
+
+
+@receiver([post_save, post_delete], sender=ProductOption)
+def option_touches_product(sender, instance, using, **kwargs):
+    # Options show on the product page, so they count as a product change
+    Product.objects.using(using).filter(pk=instance.product_id).update(
+        updated_on=timezone.now()
+    )
+
+
+@receiver(post_save, sender=Category)
+def category_touches_products(sender, instance, using, **kwargs):
+    Product.objects.using(using).filter(category=instance).update(
+        updated_on=timezone.now()
+    )
@@ -0,0 +1,142 @@
+"""
+Process-local catalog snapshot.
+
+The whole catalog (categories, products, options) is loaded into memory
+once per catalog version, in three queries, and shared by every request
+in the worker until products.catalog reports a newer version. Lookups by
+id or slug, and walks of the category tree, are then dict reads with no
+queries.
+
+Product instances come with their category and options (sorted by
+quantity) already attached, so templates can use product.category,
+product.options.all and product.min_pack_price freely. The instances are
+shared across requests: treat them as read-only and load a fresh object
+from the database before editing or saving one.
+"""
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from django.db.models import prefetch_related_objects
+
+from .catalog import get_catalog_version
+from .models import Category, Product
+
+
+@dataclass(frozen=True)
+class CategoryTree:
+    """Category hierarchy, precomputed to any depth."""
+
+    ids_by_slug: MappingProxyType  # slug -> id
+    friendly_names: MappingProxyType  # id -> friendly name
+    children: MappingProxyType  # id -> tuple of child ids
+    descendants: MappingProxyType  # id -> tuple of all ids below it
+
+    @classmethod
+    def build(cls, categories) -> "CategoryTree":
+        children = {pk: [] for pk in categories}
+        for cat in categories.values():
+            if cat.parent_id in children:
+                children[cat.parent_id].append(cat.pk)
+
+        descendants = {}
+        for pk in categories:
+            found, stack = [], list(children[pk])
+            seen = {pk}  # guards against parent loops set up in admin
+            while stack:
+                child = stack.pop(0)
+                if child in seen:
+                    continue
+                seen.add(child)
+                found.append(child)
+                stack.extend(children[child])
+            descendants[pk] = tuple(found)
+
+        return cls(
+            ids_by_slug=MappingProxyType(
+                {c.slug: c.pk for c in categories.values()}
+            ),
+            friendly_names=MappingProxyType(
+                {c.pk: c.get_friendly_name() for c in categories.values()}
+            ),
+            children=MappingProxyType(
+                {pk: tuple(ids) for pk, ids in children.items()}
+            ),
+            descendants=MappingProxyType(descendants),
+        )
+
+    def subtree_ids(self, slug: str) -> list[int]:
+        """[id] + every descendant id for `slug`; [] if unknown."""
+        pk = self.ids_by_slug.get(slug)
+        if pk is None:
+            return []
+        return [pk, *self.descendants[pk]]
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    version: int
+    categories: MappingProxyType  # id -> Category
+    categories_by_slug: MappingProxyType  # slug -> Category
+    products: MappingProxyType  # id -> Product (id order)
+    featured: tuple  # featured products, id order
+    tree: CategoryTree
+
+    @classmethod
+    def load(cls, version: int) -> "CatalogSnapshot":
+        categories = {c.pk: c for c in Category.objects.order_by("pk")}
+        products = list(Product.objects.order_by("pk"))
+        for product in products:
+            # Reuse the loaded categories (sets the FK cache, no query)
+            product.category = categories.get(product.category_id)
+        # One query; also links each option back to its product
+        prefetch_related_objects(products, "options")
+        return cls(
+            version=version,
+            categories=MappingProxyType(categories),
+            categories_by_slug=MappingProxyType(
+                {c.slug: c for c in categories.values()}
+            ),
+            products=MappingProxyType({p.pk: p for p in products}),
+            featured=tuple(p for p in products if p.featured),
+            tree=CategoryTree.build(categories),
+        )
+
+    def categories_for_slugs(self, slugs) -> list[Category]:
+        """Known categories for `slugs`, in the order given."""
+        found = (self.categories_by_slug.get(slug) for slug in slugs)
+        return [cat for cat in found if cat is not None]
+
+    def get_products(self, ids) -> list[Product]:
+        """
+        Products for `ids`, in the order given. Ids the snapshot doesn't
+        know yet (created since it was loaded) are read from the database.
+        """
+        ids = list(ids)
+        missing = [pk for pk in ids if pk not in self.products]
+        extra = {}
+        if missing:
+            extra = (
+                Product.objects.select_related("category")
+                .prefetch_related("options")
+                .in_bulk(missing)
+            )
+        found = (self.products.get(pk) or extra.get(pk) for pk in ids)
+        return [product for product in found if product is not None]
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def get_snapshot() -> CatalogSnapshot:
+    """The snapshot for the current catalog version (reloaded lazily)."""
+    global _snapshot
+    version = get_catalog_version()
+    snapshot = _snapshot
+    if snapshot is None or snapshot.version != version:
+        with _lock:
+            snapshot = _snapshot
+            if snapshot is None or snapshot.version != version:
+                snapshot = _snapshot = CatalogSnapshot.load(version)
+    return snapshot
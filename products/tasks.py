@@ -0,0 +1,35 @@
+from django.apps import apps
+from django.utils import timezone
+
+from jobs.queue import task
+
+from .catalog import bump_catalog_version
+from .images import build_thumbnails
+from .models import Product
+
+
+@task
+def build_thumbnails_for(model, pk, folder):
+    """Thumbnails for one saved image (queued by ThumbnailFormMixin)."""
+    model = apps.get_model(model)
+    obj = model.objects.filter(pk=pk).only("pk", "image").first()
+    if obj is None or not obj.image:
+        return
+    thumbnails = build_thumbnails(obj.image, folder)
+    if not thumbnails:
+        return
+    # update() skips auto_now, so stamp those (product ETags use them)
+    touched = {
+        field.name: timezone.now()
+        for field in model._meta.concrete_fields
+        if getattr(field, "auto_now", False)
+    }
+    # Only if the image is still the one we read; a newer upload has its
+    # own job
+    updated = model.objects.filter(pk=pk, image=obj.image.name).update(
+        thumbnails=thumbnails, **touched
+    )
+    if updated and model is Product:
+        # Product cards show them; other models (custom cakes) aren't
+        # part of the catalog, so its caches stay valid
+        bump_catalog_version()
@@ -0,0 +1,45 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from products.fragments import cached_fragment
+
+register = template.Library()
+
+
+class CachedFragmentNode(template.Node):
+    def __init__(self, nodelist, name, vary):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary = vary
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        vary = [str(var.resolve(context)) for var in self.vary]
+        return mark_safe(
+            cached_fragment(name, vary, lambda: self.nodelist.render(context))
+        )
+
+
+@register.tag
+def catalog_fragment(parser, token):
+    """
+    Cache the enclosed template per catalog version:
+
+        {% catalog_fragment "home_featured" [vary_on ...] %}
+          ...
+        {% endcatalog_fragment %}
+
+    Keep per-user content (bag badge, staff links) outside the block.
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' needs a fragment name."
+        )
+    nodelist = parser.parse(("endcatalog_fragment",))
+    parser.delete_first_token()
+    return CachedFragmentNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        [parser.compile_filter(bit) for bit in bits[2:]],
+    )
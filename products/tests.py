@@ -1 +1,632 @@
-# Create your tests here.
+import json
+import tempfile
+import time
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from jobs.models import Job
+from jobs.queue import work
+
+from .catalog import bump_catalog_version, get_catalog_version
+from .forms import ProductForm
+from .fragments import STATS_KEY, flush_fragment_stats, fragment_stats
+from .models import Category, Product, ProductOption, generate_sku
+from .search import index_products, search
+from .snapshot import get_snapshot
+
+
+@override_settings(PRODUCTS_PAGE_SIZE=5, PRODUCTS_COUNT_CAP=8)
+class ProductListingQueryTests(TestCase):
+    def setUp(self):
+        self.cupcakes = Category.objects.create(
+            name="cupcakes", slug="cupcakes"
+        )
+
+    def _add_products(self, count):
+        for i in range(count):
+            product = Product.objects.create(
+                name=f"Cupcake {i}",
+                description="",
+                price=Decimal("2.50"),
+                category=self.cupcakes,
+            )
+            for qty in (12, 6):
+                ProductOption.objects.create(
+                    product=product, label=f"Box of {qty}", quantity=qty
+                )
+
+    def _count_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("product_list"))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_query_count_is_flat(self):
+        self._add_products(2)
+        small, _ = self._count_queries()
+        self._add_products(30)
+        large, response = self._count_queries()
+        self.assertEqual(small, large)
+        self.assertContains(response, "From €15.00")
+
+    def test_pages_follow_sort(self):
+        self._add_products(12)
+        url = reverse("product_list")
+        first = self.client.get(url, {"sort": "name", "direction": "desc"})
+        self.assertEqual(len(first.context["products"]), 5)
+        self.assertEqual(first.context["prev_query"], "")
+        self.assertContains(first, 'rel="next"')
+        self.assertEqual(first.context["result_count"], 8)
+        self.assertTrue(first.context["result_count_capped"])
+
+        seen = [p.name for p in first.context["products"]]
+        response = first
+        while response.context["next_query"]:
+            response = self.client.get(
+                url + "?" + response.context["next_query"]
+            )
+            seen += [p.name for p in response.context["products"]]
+        self.assertEqual(seen, sorted(seen, key=str.lower, reverse=True))
+        self.assertEqual(len(set(seen)), 12)
+        self.assertIn("sort=name", response.context["prev_query"])
+
+    def test_page_past_the_end_is_404(self):
+        self._add_products(3)
+        response = self.client.get(reverse("product_list"), {"page": 9})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(
+            reverse("product_list"), {"page": "99999999999999999999"}
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.cakes = Category.objects.create(
+            name="cakes", friendly_name="Celebration Cakes", slug="cakes"
+        )
+        self.choc = Product.objects.create(
+            name="Chocolate Fudge Cake",
+            description="Rich and dark.",
+            price=Decimal("30.00"),
+            category=self.cakes,
+        )
+        self.lemon = Product.objects.create(
+            name="Lemon Drizzle",
+            description="Zesty sponge with a chocolate swirl.",
+            price=Decimal("25.00"),
+            category=self.cakes,
+        )
+        Product.objects.create(
+            name="Gold Candles", description="Pack of 10", price=Decimal("4")
+        )
+
+    def _names(self, q):
+        return [p.name for p in search(Product.objects.all(), q).order_by(
+            "-search_rank"
+        )]
+
+    def test_prefix_and_ranking(self):
+        # Name matches outrank description matches
+        self.assertEqual(
+            self._names("choc"), ["Chocolate Fudge Cake", "Lemon Drizzle"]
+        )
+        self.assertEqual(self._names("choc fudge"), ["Chocolate Fudge Cake"])
+
+    def test_category_change_is_reindexed(self):
+        self.assertEqual(len(self._names("celebration")), 2)
+        self.cakes.friendly_name = "Party Bakes"
+        self.cakes.save()
+        self.assertEqual(self._names("celebration"), [])
+        self.assertEqual(len(self._names("party")), 2)
+
+    def test_bulk_writes_need_index_products(self):
+        Product.objects.filter(pk=self.lemon.pk).update(name="Lime Tart")
+        self.assertEqual(self._names("lime"), [])
+        index_products([self.lemon.pk])
+        self.assertEqual(self._names("lime"), ["Lime Tart"])
+
+    def test_deleted_products_leave_the_index(self):
+        self.choc.delete()
+        self.assertEqual(self._names("fudge"), [])
+
+    def test_listing_search_orders_by_rank(self):
+        response = self.client.get(reverse("product_list"), {"q": "choc"})
+        self.assertEqual(
+            [p.name for p in response.context["products"]],
+            ["Chocolate Fudge Cake", "Lemon Drizzle"],
+        )
+
+
+class CatalogSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cupcakes = Category.objects.create(
+            name="cupcakes", slug="cupcakes"
+        )
+        self.product = Product.objects.create(
+            name="Cupcake",
+            description="",
+            price=Decimal("2.00"),
+            category=self.cupcakes,
+        )
+        for qty in (12, 4):
+            ProductOption.objects.create(
+                product=self.product, label=f"Box of {qty}", quantity=qty
+            )
+
+    def test_reads_are_query_free_once_loaded(self):
+        get_snapshot()
+        with self.assertNumQueries(0):
+            snapshot = get_snapshot()
+            product = snapshot.products[self.product.pk]
+            self.assertEqual(product.category.slug, "cupcakes")
+            self.assertEqual(
+                [o.quantity for o in product.options.all()], [4, 12]
+            )
+            self.assertEqual(product.min_pack_price(), Decimal("8.00"))
+            self.assertIs(
+                snapshot.categories_by_slug["cupcakes"], product.category
+            )
+
+    def test_saves_bump_version_and_reload(self):
+        before = get_snapshot()
+        version = get_catalog_version()
+        self.product.price = Decimal("3.00")
+        self.product.save()
+        self.assertGreater(get_catalog_version(), version)
+        after = get_snapshot()
+        self.assertIsNot(after, before)
+        self.assertEqual(after.products[self.product.pk].price, 3)
+
+    def test_versions_are_monotonic(self):
+        versions = [bump_catalog_version() for _ in range(3)]
+        self.assertEqual(versions, sorted(set(versions)))
+
+    def test_unknown_ids_fall_back_to_the_database(self):
+        get_snapshot()
+        Product.objects.bulk_create(
+            [Product(name="New", description="", price=Decimal("1.00"))]
+        )
+        new = Product.objects.get(name="New")
+        self.assertEqual(
+            [p.name for p in get_snapshot().get_products([new.pk])], ["New"]
+        )
+
+
+class CategoryTreeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        cakes = Category.objects.create(name="cakes", slug="cakes")
+        birthday = Category.objects.create(
+            name="birthday", slug="birthday", parent=cakes
+        )
+        kids = Category.objects.create(
+            name="kids",
+            friendly_name="Kids' Parties",
+            slug="kids",
+            parent=birthday,
+        )
+        self.ids = [cakes.pk, birthday.pk, kids.pk]
+        Product.objects.create(
+            name="Dino Cake",
+            description="",
+            price=Decimal("40.00"),
+            category=kids,
+        )
+
+    def test_descendants_at_any_depth(self):
+        tree = get_snapshot().tree
+        self.assertEqual(tree.subtree_ids("cakes"), self.ids)
+        self.assertEqual(tree.subtree_ids("kids"), self.ids[2:])
+        self.assertEqual(tree.subtree_ids("nope"), [])
+        self.assertEqual(tree.friendly_names[self.ids[2]], "Kids' Parties")
+
+    def test_cakes_listing_includes_grandchildren(self):
+        response = self.client.get(reverse("product_cakes"))
+        self.assertEqual(
+            [p.name for p in response.context["products"]], ["Dino Cake"]
+        )
+
+    def test_category_delete_rebuilds_tree(self):
+        get_snapshot()
+        Category.objects.get(pk=self.ids[2]).delete()
+        self.assertEqual(
+            get_snapshot().tree.subtree_ids("cakes"), self.ids[:2]
+        )
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        flush_fragment_stats()  # earlier tests' counts
+        caches["shared"].clear()
+        self.cake = Product.objects.create(
+            name="Sponge", description="", price=Decimal("12.00")
+        )
+
+    def _catalog_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [
+            q["sql"] for q in ctx.captured_queries
+            if "products_product" in q["sql"]
+        ]
+
+    def test_second_hit_skips_catalog_queries(self):
+        url = reverse("product_list") + "?sort=price"
+        self.assertTrue(self._catalog_queries(url))
+        self.assertEqual(self._catalog_queries(url), [])
+        self.assertEqual(
+            fragment_stats()["product_list"], {"hits": 1, "misses": 1}
+        )
+
+    def test_catalog_change_retires_fragments(self):
+        url = reverse("product_list")
+        self.client.get(url)
+        self.cake.name = "Victoria Sponge"
+        self.cake.save()
+        self.assertContains(self.client.get(url), "Victoria Sponge")
+
+    def test_bag_badge_is_rendered_per_session(self):
+        url = reverse("product_list")
+        self.client.get(url)  # warm the grid
+        session = self.client.session
+        session["bag"] = {str(self.cake.id): 3}
+        session.save()
+        response = self.client.get(url)
+        self.assertEqual(response.context["bag_count"](), 3)
+        self.assertEqual(fragment_stats()["product_list"]["hits"], 1)
+
+    def test_stats_are_staff_only(self):
+        self.client.get(reverse("about"))
+        self.client.get(reverse("about"))
+        url = reverse("fragment_cache_stats")
+        self.assertEqual(self.client.get(url).status_code, 302)
+        User.objects.create_user("staff", "s@e.com", "pw", is_staff=True)
+        self.client.login(username="staff", password="pw")
+        stats = self.client.get(url).json()
+        self.assertEqual(stats["about"], {"hits": 1, "misses": 1})
+        self.assertEqual(stats["_total"]["misses"], 1)
+
+    def test_stats_add_up_across_processes(self):
+        self.client.get(reverse("about"))
+        flush_fragment_stats()
+        # Another worker's flushed hits
+        caches["shared"].incr(STATS_KEY.format(name="about", outcome="misses"))
+        caches["shared"].set(STATS_KEY.format(name="about", outcome="hits"), 4)
+        self.client.get(reverse("about"))
+        self.assertEqual(fragment_stats()["about"], {"hits": 5, "misses": 2})
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(
+            name="Sponge", description="", price=Decimal("12.00")
+        )
+        self.detail = reverse("product_detail", args=[self.product.pk])
+
+    def _revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+    def test_listing_revalidates_until_catalog_changes(self):
+        url = reverse("product_list")
+        first = self.client.get(url)
+        self.assertEqual(self._revalidate(url, first).status_code, 304)
+        self.product.save()
+        self.assertEqual(self._revalidate(url, first).status_code, 200)
+
+    def test_bag_change_busts_etag(self):
+        first = self.client.get(self.detail)
+        session = self.client.session
+        session["bag"] = {str(self.product.pk): 1}
+        session.save()
+        self.assertEqual(
+            self._revalidate(self.detail, first).status_code, 200
+        )
+
+    def test_product_last_modified(self):
+        first = self.client.get(self.detail)
+        since = first["Last-Modified"]
+        self.assertEqual(
+            self.client.get(
+                self.detail, HTTP_IF_MODIFIED_SINCE=since
+            ).status_code,
+            304,
+        )
+        old = self.product.updated_on
+        ProductOption.objects.create(
+            product=self.product, label="Box of 6", quantity=6
+        )
+        self.product.refresh_from_db()
+        self.assertGreater(self.product.updated_on, old)
+        self.assertEqual(
+            self._revalidate(self.detail, first).status_code, 200
+        )
+
+    def test_category_change_busts_product_validators(self):
+        first = self.client.get(self.detail)
+        later = int((time.time() + 60) * 1000)  # past Last-Modified's 1s
+        with mock.patch("products.catalog._now_ms", return_value=later):
+            Category.objects.create(name="tarts", slug="tarts")
+        self.assertEqual(
+            self._revalidate(self.detail, first).status_code, 200
+        )
+        self.assertEqual(
+            self.client.get(
+                self.detail, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"]
+            ).status_code,
+            200,
+        )
+
+    def test_sitemap_etag(self):
+        url = reverse("sitemap_xml")
+        first = self.client.get(url)
+        self.assertEqual(self._revalidate(url, first).status_code, 304)
+
+
+class SkuTests(TestCase):
+    def test_skus_come_from_a_reserved_block(self):
+        # Start from an empty block, whatever earlier tests used up
+        with mock.patch.dict(
+            "products.models._sku_block", {"next": 0, "end": 0}
+        ):
+            first = generate_sku()
+            with self.assertNumQueries(0):
+                rest = [generate_sku() for _ in range(10)]
+        numbers = [int(sku.split("-")[1]) for sku in [first, *rest]]
+        self.assertEqual(numbers, list(range(numbers[0], numbers[0] + 11)))
+
+    def test_save_retries_on_clash(self):
+        Product.objects.create(
+            name="Old", description="", price=Decimal("1.00"), sku="DUP-1"
+        )
+        with mock.patch(
+            "products.models.generate_sku", side_effect=["DUP-1", "NEW-1"]
+        ):
+            product = Product.objects.create(
+                name="New", description="", price=Decimal("1.00")
+            )
+        self.assertEqual(product.sku, "NEW-1")
+
+    def test_explicit_duplicate_sku_is_rejected(self):
+        Product.objects.create(
+            name="A", description="", price=Decimal("1.00"), sku="SAME"
+        )
+        with self.assertRaises(IntegrityError):
+            Product.objects.create(
+                name="B", description="", price=Decimal("1.00"), sku="SAME"
+            )
+
+
+class CatalogImportExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cupcakes = Category.objects.create(
+            name="cupcakes", slug="cupcakes"
+        )
+        self.tmp = Path(tempfile.mkdtemp())
+
+    def _write(self, name, rows):
+        path = self.tmp / name
+        path.write_text("".join(json.dumps(row) + "\n" for row in rows))
+        return str(path)
+
+    def _import(self, path, *args):
+        out, err = StringIO(), StringIO()
+        call_command("import_catalog", path, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def _rows(self, count, **extra):
+        return [
+            {
+                "sku": f"IMP-{i}",
+                "name": f"Imported {i}",
+                "price": "3.50",
+                "category": "cupcakes",
+                **extra,
+            }
+            for i in range(count)
+        ]
+
+    def test_upserts_by_sku(self):
+        rows = self._rows(2) + [
+            {"name": "No SKU", "price": "1"},
+            {"name": "Bad", "price": "x"},
+            {"name": "Lost", "price": "1", "category": "nope"},
+        ]
+        rows[0]["options"] = [{"label": "Box of 6", "quantity": 6}]
+        out, err = self._import(self._write("a.jsonl", rows))
+        self.assertIn("Imported 3 products (2 skipped)", out)
+        self.assertIn("rows/s", out)
+        self.assertIn("Line 4: skipped", err)
+        self.assertTrue(
+            Product.objects.get(name="No SKU").sku.startswith("CIE-")
+        )
+
+        rows[1]["price"] = "9.00"
+        self._import(self._write("b.jsonl", rows[:2]))
+        self.assertEqual(
+            Product.objects.filter(sku__startswith="IMP").count(), 2
+        )
+        self.assertEqual(Product.objects.get(sku="IMP-1").price, 9)
+        self.assertEqual(
+            Product.objects.get(sku="IMP-0").options.get().pack_price(), 21
+        )
+        self.assertEqual(
+            [p.name for p in search(Product.objects.all(), "imported 1")],
+            ["Imported 1"],
+        )
+
+    def test_statements_do_not_grow_with_rows(self):
+        counts = []
+        for size in (5, 50):
+            path = self._write(f"{size}.jsonl", self._rows(size))
+            with CaptureQueriesContext(connection) as ctx:
+                self._import(path, "--batch-size", "50")
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_new_image_clears_thumbnails_and_queues_a_build(self):
+        thumbs = {"src": "/media/products/old-320.jpg"}
+        kept = Product.objects.create(
+            sku="IMP-0", name="Kept", price=1, image="old.jpg",
+            thumbnails=thumbs,
+        )
+        moved = Product.objects.create(
+            sku="IMP-1", name="Moved", price=1, image="old.jpg",
+            thumbnails=thumbs,
+        )
+        self._import(
+            self._write(
+                "img.jsonl",
+                [
+                    {**self._rows(2)[0], "image": "old.jpg"},
+                    {**self._rows(2)[1], "image": "new.jpg"},
+                ],
+            )
+        )
+        kept.refresh_from_db()
+        moved.refresh_from_db()
+        self.assertEqual(kept.thumbnails, thumbs)
+        self.assertEqual(moved.thumbnails, {})
+        self.assertEqual(moved.image.name, "new.jpg")
+        job = Job.objects.get(name="products.tasks.build_thumbnails_for")
+        self.assertEqual(job.payload["pk"], moved.pk)
+
+    def test_stdin_is_left_open(self):
+        stdin = StringIO(json.dumps(self._rows(1)[0]) + "\n")
+        with mock.patch("sys.stdin", stdin):
+            out, _ = self._import("-")
+        self.assertIn("Imported 1 products", out)
+        self.assertFalse(stdin.closed)
+
+    def test_export_round_trip(self):
+        self._import(self._write("in.jsonl", self._rows(3)))
+        for fmt in ("jsonl", "csv"):
+            path = str(self.tmp / f"out.{fmt}")
+            call_command("export_catalog", path, stderr=StringIO())
+            Product.objects.all().delete()
+            out, _ = self._import(path)
+            self.assertIn("Imported 3 products (0 skipped)", out)
+
+
+def jpeg_upload(width, height, name="cake.jpg"):
+    out = BytesIO()
+    Image.new("RGB", (width, height), "pink").save(out, format="JPEG")
+    return SimpleUploadedFile(name, out.getvalue(), "image/jpeg")
+
+
+@override_settings(
+    STORAGES={
+        "default": {
+            "BACKEND": "django.core.files.storage.InMemoryStorage"
+        },
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage."
+            "StaticFilesStorage"
+        },
+    },
+    IMAGE_THUMB_WIDTHS=(320, 640),
+    JOBS_EAGER=True,
+)
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.data = {"name": "Sponge", "description": "Vanilla", "price": "12"}
+
+    def _save(self, upload, instance=None, **data):
+        form = ProductForm(
+            {**self.data, **data}, {"image": upload} if upload else {},
+            instance=instance,
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        product = form.save()
+        product.refresh_from_db()  # thumbnails are written by the job
+        return product
+
+    def test_upload_builds_derivatives(self):
+        product = self._save(jpeg_upload(1200, 900))
+        thumbs = product.thumbnails
+        self.assertEqual(
+            [(s["width"], s["height"]) for s in thumbs["sizes"]],
+            [(320, 240), (640, 480)],
+        )
+        self.assertEqual(thumbs["src"], thumbs["sizes"][0]["jpeg"])
+        self.assertTrue(thumbs["srcset"]["webp"].endswith(".webp 640w"))
+        for size in thumbs["sizes"]:
+            for url in (size["webp"], size["jpeg"]):
+                name = url.split("/", 2)[-1]
+                self.assertTrue(default_storage.exists(name), name)
+                with default_storage.open(name) as stored:
+                    self.assertEqual(
+                        Image.open(stored).size,
+                        (size["width"], size["height"]),
+                    )
+
+        html = self.client.get(reverse("product_list")).content.decode()
+        self.assertIn(thumbs["srcset"]["jpeg"], html)
+        self.assertIn('type="image/webp"', html)
+        self.assertNotIn(product.image.url, html)
+
+    def test_small_image_and_clearing(self):
+        product = self._save(jpeg_upload(200, 100))
+        self.assertEqual(
+            [s["width"] for s in product.thumbnails["sizes"]], [200]
+        )
+
+        product = self._save(None, instance=product, **{"image-clear": "on"})
+        self.assertEqual(product.thumbnails, {})
+
+    def test_unchanged_image_keeps_thumbnails(self):
+        product = self._save(jpeg_upload(400, 300))
+        thumbs = product.thumbnails
+        product = self._save(None, instance=product, name="Renamed")
+        self.assertEqual(product.thumbnails, thumbs)
+
+    def test_transparency_is_kept_or_flattened_onto_white(self):
+        out = BytesIO()
+        Image.new("RGBA", (400, 300), (0, 0, 0, 0)).save(out, format="PNG")
+        product = self._save(
+            SimpleUploadedFile("clear.png", out.getvalue(), "image/png")
+        )
+        size = product.thumbnails["sizes"][0]
+        opened = {}
+        for fmt in ("webp", "jpeg"):
+            with default_storage.open(size[fmt].split("/", 2)[-1]) as f:
+                opened[fmt] = Image.open(f)
+                opened[fmt].load()
+        self.assertEqual(opened["webp"].getpixel((10, 10))[3], 0)
+        self.assertGreater(min(opened["jpeg"].getpixel((10, 10))), 250)
+
+    @override_settings(JOBS_EAGER=False)
+    def test_upload_queues_the_resize(self):
+        product = self._save(jpeg_upload(400, 300))
+        self.assertEqual(product.thumbnails, {})
+        job = Job.objects.get()
+        self.assertEqual(
+            job.payload,
+            {"model": "products.Product", "pk": product.pk,
+             "folder": "products"},
+        )
+
+        work(drain=True)
+        product.refresh_from_db()
+        self.assertEqual(
+            [s["width"] for s in product.thumbnails["sizes"]], [320]
+        )
@@ -10,6 +10,11 @@ urlpatterns = [
     ),
     path("offers/", views.product_offers, name="product_offers"),
     # Admin-only CRUD
+    path(
+        "cache-stats/",
+        views.fragment_cache_stats,
+        name="fragment_cache_stats",
+    ),
     path("add/", views.add_product, name="add_product"),
     path("<int:product_id>/edit/", views.edit_product, name="edit_product"),
     path(
@@ -1,11 +1,33 @@
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
-from django.db.models import Q
 from django.db.models.functions import Lower
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import condition
 
+from .conditional import catalog_etag, product_etag, product_last_modified
 from .forms import ProductForm
-from .models import Category, Product
+from .fragments import cached_fragment, fragment_stats
+from .models import Product
+from .search import search
+from .snapshot import get_snapshot
+
+
+# Fragment cache names (listing grids plus the template-tag fragments)
+CACHED_FRAGMENTS = (
+    "product_list",
+    "product_cakes",
+    "product_accessories",
+    "product_offers",
+    "home_featured",
+    "about",
+)
+# Largest row offset a database integer holds; pages reaching past it
+# can't have products, and asking for them would overflow the query
+MAX_OFFSET = 2**63 - 1
 
 
 # ----------------------------
@@ -16,18 +38,13 @@ from .models import Category, Product
 def _apply_search_sort(queryset, request):
     """
     Apply query params consistently:
-      - ?q= search term
+      - ?q= search term (full-text, ranked; see products.search)
       - ?sort= name|price|category
       - ?direction= asc|desc
     """
     q = request.GET.get("q", "").strip()
     if q:
-        queryset = queryset.filter(
-            Q(name__icontains=q)
-            | Q(description__icontains=q)
-            | Q(category__name__icontains=q)
-            | Q(category__friendly_name__icontains=q)
-        )
+        queryset = search(queryset, q)
 
     sort = request.GET.get("sort", "")
     direction = request.GET.get("direction", "asc").lower()
@@ -49,19 +66,121 @@ def _apply_search_sort(queryset, request):
         if direction == "desc":
             sortkey = f"-{sortkey}"
         queryset = queryset.order_by(sortkey)
+    elif "search_rank" in queryset.query.annotations:
+        # No explicit sort: best matches first
+        queryset = queryset.order_by("-search_rank")
 
     return queryset, q, sort, direction
 
 
-def _ids_for_category_and_children(slug):
-    """Return ([parent.id] + child_ids, parent_category).
-      If slug missing: ([], None)."""
+def _approx_count(queryset):
+    """
+    Count matches, but stop at PRODUCTS_COUNT_CAP: returns (count, capped).
+    A LIMITed count touches at most cap + 1 rows, however big the catalog.
+    """
+    cap = settings.PRODUCTS_COUNT_CAP
+    count = queryset.order_by().values("pk")[: cap + 1].count()
+    return min(count, cap), count > cap
+
+
+def _page_number(request):
     try:
-        parent = Category.objects.get(slug=slug)
-    except Category.DoesNotExist:
-        return [], None
-    child_ids = list(parent.subcategories.values_list("id", flat=True))
-    return [parent.id] + child_ids, parent
+        page = max(int(request.GET.get("page", 1)), 1)
+    except (TypeError, ValueError):
+        return 1
+    if page * settings.PRODUCTS_PAGE_SIZE >= MAX_OFFSET:
+        raise Http404("No products on this page.")
+    return page
+
+
+def _render_grid(queryset, page):
+    """
+    Render one page of product cards: {"html": ..., "has_next": bool}.
+
+    Fetches page size + 1 ids to learn whether a next page exists, so no
+    full COUNT(*) is needed, and takes the cards themselves from the
+    catalog snapshot. Ties in the chosen sort are broken by pk to keep
+    pages stable.
+    """
+    size = settings.PRODUCTS_PAGE_SIZE
+    order = queryset.query.order_by or ()
+    queryset = queryset.order_by(*order, "pk")
+    offset = (page - 1) * size
+    ids = list(
+        queryset.values_list("pk", flat=True)[offset: offset + size + 1]
+    )
+    if page > 1 and not ids:
+        raise Http404("No products on this page.")
+
+    count, capped = _approx_count(queryset)
+    html = render_to_string(
+        "products/includes/product_grid.html",
+        {
+            "products": get_snapshot().get_products(ids[:size]),
+            "page_number": page,
+            "result_count": count,
+            "result_count_capped": capped,
+        },
+    )
+    return {"html": html, "has_next": len(ids) > size}
+
+
+def _paginate(request, view_name, queryset, slugs, q, sort, direction):
+    """
+    One ?page= of products plus the paging context for the template.
+
+    The rendered grid is shared by every visitor through the fragment
+    cache (keyed on the catalog version and the listing parameters), so
+    a hit runs no catalog queries. Prev/next links are built per request.
+    """
+    page = _page_number(request)
+    vary = {
+        "slugs": slugs,
+        "q": q,
+        "sort": sort if sort in ("name", "price", "category") else "",
+        "direction": direction,
+        "page": page,
+    }
+    grid = cached_fragment(
+        view_name, vary, lambda: _render_grid(queryset, page)
+    )
+    return {
+        "grid_html": mark_safe(grid["html"]),
+        "page_number": page,
+        "next_query": (
+            _page_query(request, page + 1) if grid["has_next"] else ""
+        ),
+        "prev_query": _page_query(request, page - 1) if page > 1 else "",
+    }
+
+
+def _page_query(request, page):
+    """Current querystring with ?page= replaced (dropped for page 1)."""
+    params = request.GET.copy()
+    params.pop("page", None)
+    if page > 1:
+        params["page"] = page
+    return params.urlencode() or "page=1"
+
+
+def _ids_for_category_and_children(slug):
+    """Return ([parent.id] + descendant_ids, parent_category), any depth.
+      If slug missing: ([], None). Served from the cached category tree."""
+    snapshot = get_snapshot()
+    return (
+        snapshot.tree.subtree_ids(slug),
+        snapshot.categories_by_slug.get(slug),
+    )
+
+
+def _filter_slugs(queryset, slugs):
+    """Narrow to ?category= slugs by id (no join to the category table)."""
+    tree = get_snapshot().tree
+    return queryset.filter(
+        category_id__in=[
+            tree.ids_by_slug[s] for s in slugs if s in tree.ids_by_slug
+        ]
+    )
 
 
 # ----------------------------
@@ -69,6 +188,7 @@ def _ids_for_category_and_children(slug):
 # ----------------------------
 
 
+@condition(etag_func=catalog_etag)
 def product_list(request):
     """All products, optional ?category=a,b,c filtering (CSV of slugs)."""
     qs = Product.objects.all()
@@ -76,23 +196,24 @@ def product_list(request):
     cat_param = request.GET.get("category", "").strip()
     slugs = [s for s in cat_param.split(",") if s]
     if slugs:
-        qs = qs.filter(category__slug__in=slugs)
+        qs = _filter_slugs(qs, slugs)
 
     qs, q, sort, direction = _apply_search_sort(qs, request)
 
     context = {
-        "products": qs,
+        **_paginate(request, "product_list", qs, slugs, q, sort, direction),
         "page_title": "All Products",
         "request_get": request.GET,
         "search_term": q,
         "current_sort": sort,
         "current_direction": direction,
-        "current_categories": Category.objects.filter(slug__in=slugs),
+        "current_categories": get_snapshot().categories_for_slugs(slugs),
         "selected_slugs": slugs,
     }
     return render(request, "products/product_list.html", context)
 
 
+@condition(etag_func=catalog_etag)
 def product_cakes(request):
     """
     Cakes landing:
@@ -112,13 +233,13 @@ def product_cakes(request):
     cat_param = request.GET.get("category", "").strip()
     slugs = [s for s in cat_param.split(",") if s]
     if slugs:
-        qs = qs.filter(category__slug__in=slugs)
+        qs = _filter_slugs(qs, slugs)
 
     qs, q, sort, direction = _apply_search_sort(qs, request)
 
-    cupcakes = Category.objects.filter(slug="cupcakes").first()
+    cupcakes = get_snapshot().categories_by_slug.get("cupcakes")
     context = {
-        "products": qs,
+        **_paginate(request, "product_cakes", qs, slugs, q, sort, direction),
         "page_title": "Cakes",
         "active_category": cakes_cat,
         "subcategories": [cupcakes] if cupcakes else [],
@@ -126,12 +247,13 @@ def product_cakes(request):
         "search_term": q,
         "current_sort": sort,
         "current_direction": direction,
-        "current_categories": Category.objects.filter(slug__in=slugs),
+        "current_categories": get_snapshot().categories_for_slugs(slugs),
         "selected_slugs": slugs,
     }
     return render(request, "products/product_list.html", context)
 
 
+@condition(etag_func=catalog_etag)
 def product_accessories(request):
     """
     Accessories landing:
@@ -149,34 +271,38 @@ def product_accessories(request):
     cat_param = request.GET.get("category", "").strip()
     slugs = [s for s in cat_param.split(",") if s]
     if slugs:
-        qs = qs.filter(category__slug__in=slugs)
+        qs = _filter_slugs(qs, slugs)
 
     qs, q, sort, direction = _apply_search_sort(qs, request)
 
-    balloons = Category.objects.filter(slug="balloons").first()
-    candles = Category.objects.filter(slug="candles").first()
+    subcategories = get_snapshot().categories_for_slugs(
+        ["balloons", "candles"]
+    )
     context = {
-        "products": qs,
+        **_paginate(
+            request, "product_accessories", qs, slugs, q, sort, direction
+        ),
         "page_title": "Accessories",
         "active_category": acc_cat,
-        "subcategories": [c for c in (balloons, candles) if c],
+        "subcategories": subcategories,
         "request_get": request.GET,
         "search_term": q,
         "current_sort": sort,
         "current_direction": direction,
-        "current_categories": Category.objects.filter(slug__in=slugs),
+        "current_categories": get_snapshot().categories_for_slugs(slugs),
         "selected_slugs": slugs,
     }
     return render(request, "products/product_list.html", context)
 
 
+@condition(etag_func=catalog_etag)
 def product_offers(request):
     """Special offers flagged with is_offer=True."""
     qs, q, sort, direction = _apply_search_sort(
         Product.objects.filter(is_offer=True), request
     )
     context = {
-        "products": qs,
+        **_paginate(request, "product_offers", qs, [], q, sort, direction),
         "page_title": "Special Offers",
         "request_get": request.GET,
         "search_term": q,
@@ -188,8 +314,14 @@ def product_offers(request):
     return render(request, "products/product_list.html", context)
 
 
+@condition(
+    etag_func=product_etag, last_modified_func=product_last_modified
+)
 def product_detail(request, product_id):
-    product = get_object_or_404(Product, pk=product_id)
+    found = get_snapshot().get_products([product_id])
+    if not found:
+        raise Http404("No Product matches the given query.")
+    product = found[0]
     return render(
         request,
         "products/product_detail.html",
@@ -202,6 +334,12 @@ def product_detail(request, product_id):
 # ----------------------------
 
 
+@staff_member_required
+def fragment_cache_stats(request):
+    """Fragment cache hit/miss counters, as JSON."""
+    return JsonResponse(fragment_stats(CACHED_FRAGMENTS))
+
+
 @staff_member_required
 def add_product(request):
     if request.method == "POST":